@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Split export times into PyCap's own overhead and network and server time.
+
+    python benchmarks/client_overhead.py [--rows 50000] [--columns 30]
+
+Exports are recorded from a local server process with a
+``CassetteTransport``, then timed live and replayed from the cassette.
+Replayed exports cost only the client side (building the request,
+decoding and parsing the response); the rest of a live export is the
+network and the server.
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from redcap import Project, CassetteTransport
+from redcap.optional import pandas
+
+from memory_phases import serve
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve,
+                                     args=(args.rows, args.columns, ports))
+    server.daemon = True
+    server.start()
+    port, csv_bytes, json_bytes = ports.get()
+    url = 'http://127.0.0.1:%d/api/' % port
+    print('%d rows x %d columns: %.1f MB csv, %.1f MB json\n' % (
+        args.rows, args.columns, csv_bytes / 1e6, json_bytes / 1e6))
+
+    exports = [('json', {}), ('csv', {'format': 'csv'})]
+    if pandas:
+        exports.append(('df', {'format': 'df'}))
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'exports.json')
+    try:
+        with CassetteTransport(path, mode='record') as cassette:
+            live = Project(url, 'token', lazy=True, transport=cassette)
+            for _, kwargs in exports:
+                live.export_records(**kwargs)
+        live = Project(url, 'token', lazy=True)
+        with CassetteTransport(path, mode='replay') as cassette:
+            replay = Project(url, 'token', lazy=True, transport=cassette)
+            print('%-6s %10s %10s %10s' % ('format', 'live', 'client',
+                                           'network'))
+            for name, kwargs in exports:
+                live_time = best_of(
+                    args.runs, lambda: live.export_records(**kwargs))
+                client_time = best_of(
+                    args.runs, lambda: replay.export_records(**kwargs))
+                print('%-6s %9.3fs %9.3fs %9.3fs' % (
+                    name, live_time, client_time, live_time - client_time))
+        live.close()
+    finally:
+        shutil.rmtree(tmp)
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure parsing exported csv batches into DataFrames in the downloading
+threads versus in a process pool.
+
+    python benchmarks/decode_pool.py [--batches 32] [--rows 20000]
+                                     [--processes 8] [--latency 0.05]
+
+``--latency`` simulates the download time of each batch so the overlap of
+network I/O and decoding shows up in the total.
+"""
+
+import argparse
+import csv
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from redcap.project import _read_csv_bytes
+
+
+def synthetic_batch(rows, columns, seed):
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    writer.writerow(['record_id'] + ['field_%03d' % i for i in range(columns)])
+    for r in range(rows):
+        rec = seed * rows + r
+        writer.writerow([rec] + [
+            (rec * 31 + i) % 97 if i % 3 else 'text value %d' % (rec % 50)
+            for i in range(columns)])
+    return buf.getvalue().encode('utf-8')
+
+
+def run(batches, latency, downloaders, processes):
+    kwargs = {'index_col': 'record_id'}
+    decoder = ProcessPoolExecutor(processes) if processes else None
+
+    def fetch(raw):
+        time.sleep(latency)
+        if decoder is not None:
+            return decoder.submit(_read_csv_bytes, raw, kwargs)
+        return _read_csv_bytes(raw, kwargs)
+
+    start = time.time()
+    with ThreadPoolExecutor(downloaders) as fetcher:
+        parts = list(fetcher.map(fetch, batches))
+    if decoder is not None:
+        parts = [f.result() for f in parts]
+        decoder.shutdown()
+    return time.time() - start, sum(len(p) for p in parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--batches', type=int, default=32)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--downloaders', type=int, default=4)
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    batches = [synthetic_batch(args.rows, args.columns, i)
+               for i in range(args.batches)]
+    size = sum(len(b) for b in batches) / 1e6
+    print('%d batches, %.1f MB of csv, %d cpus' % (
+        len(batches), size, multiprocessing.cpu_count()))
+    threaded, rows = run(batches, args.latency, args.downloaders, None)
+    print('threads only:      %6.2fs (%d rows)' % (threaded, rows))
+    pooled, rows = run(batches, args.latency, args.downloaders,
+                       args.processes)
+    print('%2d decode procs:   %6.2fs (%d rows), speedup %.2fx' % (
+        args.processes, pooled, rows, threaded / pooled))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the size of export_records payloads before and after the
+minimal fields/forms backfill on a large synthetic project.
+
+    python benchmarks/export_payload.py [--forms 40] [--fields 50]
+
+With ``--url`` and ``--token`` of a real project, the server time of each
+payload is measured as well (the synthetic metadata is then replaced by
+the project's own).
+"""
+
+import argparse
+import time
+
+try:
+    from urllib import urlencode
+except ImportError:
+    from urllib.parse import urlencode
+
+from redcap import Project
+
+
+def legacy_backfill(project, fields, forms):
+    """export_records' fields before they were minimized"""
+    return project.backfill_fields(fields, forms), forms
+
+
+def synthetic_project(n_forms, n_fields):
+    project = Project('http://localhost/api/', 'token', lazy=True)
+    project.metadata = [
+        {'field_name': 'record_id', 'form_name': 'form_000'}]
+    for i in range(n_forms):
+        for j in range(n_fields):
+            project.metadata.append({
+                'field_name': 'form_%03d_question_%03d' % (i, j),
+                'form_name': 'form_%03d' % i})
+    project.field_names = [f['field_name'] for f in project.metadata]
+    project.def_field = 'record_id'
+    return project
+
+
+def scenarios(project):
+    forms = []
+    for f in project.metadata:
+        if f['form_name'] not in forms:
+            forms.append(f['form_name'])
+    whole_forms = [f['field_name'] for f in project.metadata
+                   if f['form_name'] in forms[1:4]]
+    whole_forms += [f + '_complete' for f in forms[1:4]]
+    return [
+        ('all fields', None, None),
+        ('two forms', None, forms[1:3]),
+        ('three whole forms as fields', whole_forms, None),
+        ('duplicated fields', project.field_names[1:50] * 2, None),
+    ]
+
+
+def payload(project, fields, forms):
+    pl = {'token': project.token, 'content': 'record', 'format': 'json',
+          'type': 'flat'}
+    if fields:
+        pl['fields'] = ','.join(fields)
+    if forms:
+        pl['forms'] = ','.join(forms)
+    return pl
+
+
+def timed(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--forms', type=int, default=40)
+    parser.add_argument('--fields', type=int, default=50)
+    parser.add_argument('--url')
+    parser.add_argument('--token')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.url and args.token:
+        project = Project(args.url, args.token)
+    else:
+        project = synthetic_project(args.forms, args.fields)
+    print('%d fields in %d forms' % (len(project.field_names),
+                                     len(set(f['form_name']
+                                             for f in project.metadata))))
+    row = '%-30s %12s %12s %10s %10s'
+    print(row % ('scenario', 'old bytes', 'new bytes', 'old s', 'new s'))
+    for name, fields, forms in scenarios(project):
+        old = payload(project, *legacy_backfill(project, fields, forms))
+        new = payload(project, *project._shortest_request(fields, forms))
+        sizes = [len(urlencode(pl)) for pl in (old, new)]
+        times = ['-', '-']
+        if args.url and args.token:
+            for i, pl in enumerate((old, new)):
+                _, elapsed = timed(lambda: project._call_api(pl, 'exp_record'),
+                                   args.repeat)
+                times[i] = '%.2f' % elapsed
+        print(row % (name, sizes[0], sizes[1], times[0], times[1]))
+
+
+if __name__ == '__main__':
+    main()
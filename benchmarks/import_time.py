@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure how long ``import redcap`` takes in a fresh interpreter.
+
+    python benchmarks/import_time.py [--runs 10] [--max-ms 350]
+
+Reports the median over ``--runs`` interpreters, with the interpreter's
+own startup (``python -c pass``) subtracted, and which optional heavy
+modules got imported. Exits with status 1 if the median exceeds
+``--max-ms`` or pandas/numpy were imported, so it can guard against
+regressions in CI.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HEAVY = ('pandas', 'numpy')
+
+CHECK = ('import sys, redcap; '
+         'print(",".join(m for m in %r if m in sys.modules))' % (HEAVY,))
+
+
+def run(code, env):
+    start = time.time()
+    out = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return time.time() - start, out.decode('utf-8').strip()
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, default=350)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, PYTHONDONTWRITEBYTECODE='1')
+    startup = median([run('pass', env)[0] for _ in range(args.runs)])
+    timings, heavy = [], ''
+    for _ in range(args.runs):
+        elapsed, heavy = run(CHECK, env)
+        timings.append(elapsed - startup)
+    ms = median(timings) * 1000
+    print('import redcap: %.0f ms (median of %d, interpreter startup %.0f '
+          'ms excluded)' % (ms, args.runs, startup * 1000))
+    print('heavy modules imported: %s' % (heavy or 'none'))
+    if heavy or ms > args.max_ms:
+        print('FAIL: limit is %.0f ms without %s' % (args.max_ms,
+                                                   ', '.join(HEAVY)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the JSON backends on a synthetic REDCap record export.
+
+    python benchmarks/json_backends.py [--records 50000] [--fields 60]
+                                       [--no-newlines]
+
+``text`` is the former decoding path, ``json.loads(r.text)``, which first
+builds a str copy of the response; the backends decode the bytes directly.
+"""
+
+import argparse
+import json
+import time
+
+from redcap import serializers
+
+
+def synthetic_export(records, fields, newlines=True):
+    rows = []
+    for r in range(records):
+        row = {'record_id': str(r + 1)}
+        for i in range(fields):
+            if i % 5 == 0:
+                row['note_%03d' % i] = 'free text%swith a newline %d' % (
+                    '\n' if newlines else ' ', r)
+            elif i % 3 == 0:
+                row['date_%03d' % i] = '2014-%02d-%02d' % (r % 12 + 1,
+                                                          r % 28 + 1)
+            else:
+                row['field_%03d' % i] = str((r * 31 + i) % 97)
+        rows.append(row)
+    # REDCap leaves control characters in strings unescaped
+    return json.dumps(rows).replace('\\n', '\n').encode('utf-8')
+
+
+def timed(func, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func(arg)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--fields', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-newlines', dest='newlines',
+                        action='store_false',
+                        help="notes without raw newlines, which the fast "
+                             "backends can't decode directly")
+    args = parser.parse_args()
+
+    raw = synthetic_export(args.records, args.fields, args.newlines)
+    rows = json.loads(raw.decode('utf-8'), strict=False)
+    print('%d records, %.1f MB of json' % (args.records, len(raw) / 1e6))
+    print('%-12s %10s %10s' % ('backend', 'decode s', 'encode s'))
+    text = timed(lambda b: json.loads(b.decode('utf-8'), strict=False),
+                 raw, args.repeat)
+    print('%-12s %10.3f %10s' % ('text', text, '-'))
+    default = serializers.get_backend()
+    for name in serializers.available():
+        serializers.set_backend(name)
+        print('%-12s %10.3f %10.3f' % (
+            name, timed(serializers.loads, raw, args.repeat),
+            timed(serializers.dumps, rows, args.repeat)))
+    serializers.set_backend(default)
+
+
+if __name__ == '__main__':
+    main()
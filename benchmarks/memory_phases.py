@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Report the peak memory of each phase of an export and an import, as
+copies of the payload.
+
+    python benchmarks/memory_phases.py [--rows 50000] [--columns 30]
+
+A local server process answers a synthetic csv/json export. The project is
+profiled with ``profile_memory=True`` and ``MetricsCollector``; for each
+phase, ``copies`` is the traced peak divided by the payload size. The
+DataFrame export is also run the way it was before it parsed the
+response bytes (``r.text`` wrapped in a ``StringIO``) for comparison, and
+the DataFrame import the way it was before it was streamed in row chunks.
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs
+
+from redcap import Project, MetricsCollector
+from redcap.metrics import profile_phase
+from redcap.optional import pandas
+
+
+def synthetic_rows(rows, columns):
+    header = ['record_id'] + ['field_%03d' % i for i in range(columns)]
+    for r in range(rows):
+        yield header, [str(r)] + [
+            str((r * 31 + i) % 97) if i % 3 else 'text value %d' % (r % 50)
+            for i in range(columns)]
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        pl = dict((k, v[0]) for k, v in
+                  parse_qs(body.decode('utf-8')).items())
+        if 'data' in pl:
+            content = b'{"count": 1}'
+        elif pl['content'] in ('event', 'arm'):
+            content = b'{"error": "not longitudinal"}'
+        elif pl['content'] == 'metadata':
+            content = (b'[{"field_name": "record_id", "form_name": "f", '
+                       b'"field_label": "Record ID"}]')
+        elif pl.get('format') == 'csv':
+            content = self.server.csv
+        else:
+            content = self.server.json
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def serve(rows, columns, ports):
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    records = []
+    for header, row in synthetic_rows(rows, columns):
+        if not records:
+            writer.writerow(header)
+        writer.writerow(row)
+        records.append(dict(zip(header, row)))
+    server.csv = buf.getvalue().encode('utf-8')
+    server.json = json.dumps(records).encode('utf-8')
+    ports.put((server.server_address[1], len(server.csv), len(server.json)))
+    server.serve_forever()
+
+
+def report(title, collector):
+    print(title)
+    for m in collector.memory:
+        print('  %-10s %-10s payload %6.1f MB  peak %6.1f MB  '
+              'copies %5.2f' % (m.type, m.phase, m.payload_bytes / 1e6,
+                                m.peak / 1e6, m.copies or 0))
+    del collector.memory[:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--columns', type=int, default=30)
+    args = parser.parse_args()
+
+    # serve from another process, so only the client's memory is traced
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve,
+                                     args=(args.rows, args.columns, ports))
+    server.daemon = True
+    server.start()
+    port, csv_bytes, json_bytes = ports.get()
+    url = 'http://127.0.0.1:%d/api/' % port
+    collector = MetricsCollector()
+    project = Project(url, 'token', lazy=True, hooks=[collector],
+                      profile_memory=True)
+    print('%d rows x %d columns: %.1f MB csv, %.1f MB json\n' % (
+        args.rows, args.columns, csv_bytes / 1e6, json_bytes / 1e6))
+
+    records = project.export_records()
+    report("export_records(format='json')", collector)
+    project.import_records(records)
+    report('import_records(records)', collector)
+    del records
+
+    if pandas:
+        kwargs = {'index_col': 'record_id'}
+        project.export_records(format='df', df_kwargs=kwargs)
+        report("export_records(format='df')", collector)
+        # the DataFrame export before it parsed the response bytes
+        text = project.export_records(format='csv')
+        with profile_phase([collector], 'dataframe', 'legacy', True) as p:
+            p.payload_bytes = csv_bytes
+            pandas.read_csv(io.StringIO(text), **kwargs)
+        report('legacy: read_csv(StringIO(r.text)), r.text still alive',
+               collector)
+
+        frame = project.export_records(format='df', df_kwargs=kwargs)
+        del collector.memory[:]
+        project.import_records(frame)
+        report('import_records(DataFrame)', collector)
+        # the DataFrame import before it was streamed in row chunks
+        with profile_phase([collector], 'import', 'legacy', True) as p:
+            buf = io.StringIO()
+            frame.to_csv(buf, index_label='record_id')
+            data = buf.getvalue()
+            p.payload_bytes = len(data)
+            project.session.post(url, data={
+                'token': 'token', 'content': 'record', 'format': 'csv',
+                'type': 'flat', 'data': data})
+            del data, buf
+        report('legacy: to_csv(StringIO), getvalue(), url-encoded by '
+               'requests', collector)
+    else:
+        print('pandas not installed, skipping DataFrame exports')
+    project.close()
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare form-encoded and multipart request bodies of a large import.
+
+    python benchmarks/request_bodies.py [--rows 50000] [--columns 30]
+
+Encodes the JSON and csv of synthetic records the way ``requests`` does
+for ``data=payload`` and with ``redcap.request.spool_multipart``, and
+reports the body size and encoding time of each.
+"""
+
+import argparse
+import csv
+import io
+import json
+import time
+
+from requests.models import RequestEncodingMixin
+
+from redcap.request import spool_multipart
+
+
+def synthetic_records(rows, columns):
+    header = ['record_id'] + ['field_%03d' % i for i in range(columns)]
+    for r in range(rows):
+        yield dict(zip(header, [str(r)] + [
+            str((r * 31 + i) % 97) if i % 3 else
+            'Free text, "quoted" & more: %d/%d' % (r, i)
+            for i in range(columns)]))
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        result = func()
+        timings.append(time.time() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--columns', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    records = list(synthetic_records(args.rows, args.columns))
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=list(records[0]))
+    writer.writeheader()
+    writer.writerows(records)
+    datasets = [('json', json.dumps(records)), ('csv', buf.getvalue())]
+
+    for name, data in datasets:
+        payload = {'token': 'T' * 32, 'content': 'record', 'format': name,
+                   'type': 'flat', 'data': data}
+        raw = len(data.encode('utf-8'))
+        form_time, form = best_of(
+            args.runs, lambda: RequestEncodingMixin._encode_params(payload))
+        multi_time, multi = best_of(
+            args.runs, lambda: len(spool_multipart(payload)))
+        print('%s data: %.1f MB' % (name, raw / 1e6))
+        print('  form-encoded  %6.1f MB (+%2.0f%%)  %6.3fs' % (
+            len(form) / 1e6, 100.0 * (len(form) - raw) / raw, form_time))
+        print('  multipart     %6.1f MB (+%2.0f%%)  %6.3fs  (%.1fx faster)'
+              % (multi / 1e6, 100.0 * (multi - raw) / raw, multi_time,
+                 form_time / multi_time))
+
+
+if __name__ == '__main__':
+    main()
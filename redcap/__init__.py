@@ -18,4 +18,18 @@ Other API requests are available, such as exporting users & Form-Event Mappings.
 
 from .project import Project
 from .request import RCRequest, RCAPIError, RedcapError
+from .choices import ChoiceMap
+from .reshape import Reshaper
+from .pool import ProjectPool, PoolResult, PoolError
+from .metrics import RequestMetrics, MemoryMetrics, MetricsCollector
+from .replicate import Replicator
+from .metadata import MetadataDiff
+from .records import RecordIndex
+from .longitudinal import LongitudinalIndex
+from .changes import ChangeSet, HashIndex
+from .sinks import JSONLinesSink
+from .transport import (Transport, SessionTransport, AsyncTransport,
+                        CassetteTransport, CassetteError)
+from .circuit import CircuitBreaker, CircuitOpenError, server_health
+from .deadlines import Deadline, DeadlineExceeded
 from .version import VERSION as __version__
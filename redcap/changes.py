@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Detecting changed records by their content
+
+Not every REDCap server can filter exports by modification time. Instead,
+each exported record is hashed (over all its events and instances) and the
+hashes are kept in a small :class:`HashIndex` file. Comparing the hashes of
+a later export with the index gives the new, changed and deleted records
+(:class:`ChangeSet`).
+
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+from .records import record_sort_key
+
+FORMAT_VERSION = 1
+
+# columns identifying a row of a record rather than holding data
+ROW_KEYS = ('redcap_event_name', 'redcap_repeat_instrument',
+            'redcap_repeat_instance')
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _hasher():
+    try:
+        return hashlib.blake2b(digest_size=16)
+    except AttributeError:
+        # python < 3.6
+        return hashlib.md5()
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if not hasattr(value, 'strip'):
+        value = str(value)
+    return value.strip()
+
+
+def record_digests(rows, def_field):
+    """
+    Hash exported records
+
+    Each record's rows (one per event and repeated instance) are
+    normalized before hashing: values are stripped, empty values are left
+    out (so adding a field to the project doesn't change every hash) and
+    rows and fields are sorted, so the hash doesn't depend on the order
+    of the export.
+
+    Parameters
+    ----------
+    rows : list
+        records as exported with ``format='json'``
+    def_field : str
+        the record id field
+
+    Returns
+    -------
+    digests : dict
+        record id -> hex digest
+    """
+    by_record = {}
+    for row in rows:
+        items = sorted((k, _text(v)) for k, v in row.items()
+                       if k != def_field and _text(v))
+        key = tuple(_text(row.get(k)) for k in ROW_KEYS)
+        by_record.setdefault(_text(row[def_field]), []).append((key, items))
+    digests = {}
+    for record, record_rows in by_record.items():
+        hasher = _hasher()
+        hasher.update(json.dumps(sorted(record_rows),
+                                 separators=(',', ':')).encode('utf-8'))
+        digests[record] = hasher.hexdigest()
+    return digests
+
+
+class ChangeSet(object):
+    """
+    Records that differ between two exports
+
+    Attributes
+    ----------
+    new : list
+        ids of records that weren't in the previous export
+    changed : list
+        ids of records whose data changed
+    deleted : list
+        ids of records that are gone
+    unchanged : int
+        number of records that didn't change
+    records : list
+        exported rows of the new and changed records, if known
+    index : :class:`HashIndex`
+        index of the newer export
+    """
+
+    def __init__(self, new, changed, deleted, unchanged, records=None,
+                 index=None):
+        self.new = sorted(new, key=record_sort_key)
+        self.changed = sorted(changed, key=record_sort_key)
+        self.deleted = sorted(deleted, key=record_sort_key)
+        self.unchanged = unchanged
+        self.records = records if records is not None else []
+        self.index = index
+
+    def __bool__(self):
+        return bool(self.new or self.changed or self.deleted)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<ChangeSet %d new, %d changed, %d deleted, %d unchanged>' % (
+            len(self.new), len(self.changed), len(self.deleted),
+            self.unchanged)
+
+
+class HashIndex(object):
+    """Record id -> content hash, stored in a gzipped text file"""
+
+    def __init__(self, digests=None, scope=None):
+        """
+        Parameters
+        ----------
+        digests : dict, optional
+            record id -> hex digest, see :func:`record_digests`
+        scope : dict, optional
+            what was exported (e.g. fields and forms), saved with the
+            index so it isn't compared with a different kind of export
+        """
+        self.digests = dict(digests or {})
+        self.scope = scope or {}
+
+    def __len__(self):
+        return len(self.digests)
+
+    def __contains__(self, record):
+        return record in self.digests
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by :meth:`save`"""
+        with gzip.open(path, 'rb') as fobj:
+            lines = fobj.read().decode('utf-8').splitlines()
+        header = json.loads(lines[0])
+        if header.get('version') != FORMAT_VERSION:
+            raise ValueError('%s is not a hash index this version of PyCap '
+                             'can read' % path)
+        digests = dict(line.split('\t', 1) for line in lines[1:] if line)
+        return cls(digests, header.get('scope'))
+
+    def save(self, path):
+        """Write the index, replacing ``path`` only once it's complete"""
+        lines = [json.dumps({'version': FORMAT_VERSION,
+                             'scope': self.scope}, sort_keys=True)]
+        lines.extend('%s\t%s' % (r, self.digests[r])
+                     for r in sorted(self.digests, key=record_sort_key))
+        tmp = path + '.tmp'
+        with gzip.open(tmp, 'wb') as fobj:
+            fobj.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        _replace(tmp, path)
+
+    def diff(self, other, rows=None, def_field=None):
+        """
+        Compare with a newer index
+
+        Parameters
+        ----------
+        other : :class:`HashIndex`
+            index of the newer export
+        rows, def_field : optional
+            rows of the newer export and its id field, to collect the
+            rows of new and changed records in ``ChangeSet.records``
+
+        Returns
+        -------
+        changes : :class:`ChangeSet`
+        """
+        new, changed = [], []
+        for record, digest in other.digests.items():
+            old = self.digests.get(record)
+            if old is None:
+                new.append(record)
+            elif old != digest:
+                changed.append(record)
+        deleted = [r for r in self.digests if r not in other.digests]
+        records = None
+        if rows is not None:
+            wanted = set(new) | set(changed)
+            records = [row for row in rows
+                       if _text(row[def_field]) in wanted]
+        unchanged = len(other.digests) - len(new) - len(changed)
+        return ChangeSet(new, changed, deleted, unchanged, records, other)
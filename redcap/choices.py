@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Translation between raw codes and labels of multiple choice fields
+
+"""
+
+import re
+
+from .optional import pandas as pd
+
+CHOICE_TYPES = ('radio', 'dropdown', 'yesno', 'truefalse', 'checkbox')
+
+# yesno & truefalse fields don't carry their choices in the metadata
+FIXED_CHOICES = {
+    'yesno': [('1', 'Yes'), ('0', 'No')],
+    'truefalse': [('1', 'True'), ('0', 'False')],
+}
+
+CHECKBOX_SEP = '___'
+
+# Values REDCap exports for checkbox columns with raw_or_label='label'
+CHECKED, UNCHECKED = 'Checked', 'Unchecked'
+
+
+def parse_choices(choice_str):
+    """
+    Parse a ``select_choices_or_calculations`` string
+
+    Parameters
+    ----------
+    choice_str : str
+        choices as stored in the metadata, e.g. ``'1, Male | 2, Female'``
+
+    Returns
+    -------
+    choices : list
+        ``(code, label)`` tuples in the order they are defined
+    """
+    choices = []
+    for choice in choice_str.split('|'):
+        if not choice.strip():
+            continue
+        # labels may contain commas, codes may not
+        code, _, label = choice.partition(',')
+        choices.append((code.strip(), label.strip()))
+    return choices
+
+
+def checkbox_column(field, code):
+    """Return the exported column name of one checkbox option"""
+    return field + CHECKBOX_SEP + re.sub(r'[^a-z0-9_]', '_', code.lower())
+
+
+class ChoiceMap(object):
+    """
+    Lookup tables between raw codes and labels, built once from a
+    project's metadata.
+
+    Radio, dropdown, yesno and truefalse fields are keyed by their field
+    name. Checkbox fields are keyed by their exported ``field___code``
+    columns, whose raw values are ``'1'`` (checked) or ``'0'``.
+    """
+
+    def __init__(self, metadata):
+        """
+        Parameters
+        ----------
+        metadata : list
+            metadata structure of the project, as in ``Project.metadata``
+        """
+        self.choices = {}
+        self.checkboxes = {}
+        for field in metadata:
+            ftype = field.get('field_type')
+            if ftype not in CHOICE_TYPES:
+                continue
+            name = field['field_name']
+            if ftype in FIXED_CHOICES:
+                choices = FIXED_CHOICES[ftype]
+            else:
+                choices = parse_choices(
+                    field.get('select_choices_or_calculations', ''))
+            if ftype == 'checkbox':
+                for code, label in choices:
+                    self.checkboxes[checkbox_column(name, code)] = label
+            else:
+                self.choices[name] = choices
+
+    def columns(self):
+        """Return all column names this map can translate"""
+        return list(self.choices) + list(self.checkboxes)
+
+    def _tables(self, checkbox_labels, reverse=False):
+        """Build the {column: [(raw, label), ...]} pairs used to translate"""
+        tables = dict(self.choices)
+        for column, label in self.checkboxes.items():
+            if checkbox_labels:
+                tables[column] = [('1', label), ('0', '')]
+            else:
+                tables[column] = [('1', CHECKED), ('0', UNCHECKED)]
+        if reverse:
+            tables = dict((k, [(lab, raw) for raw, lab in pairs])
+                          for k, pairs in tables.items())
+        return tables
+
+    def to_label(self, data, checkbox_labels=False):
+        """
+        Translate raw codes into labels
+
+        Parameters
+        ----------
+        data : list of dicts, ``pandas.DataFrame``
+            records exported with ``raw_or_label='raw'``
+        checkbox_labels : (``False``), ``True``
+            translate checked boxes into their option label and unchecked
+            boxes into ``''``, like ``export_checkbox_labels=True``.
+            By default, checkbox values become ``'Checked'`` or
+            ``'Unchecked'``.
+
+        Returns
+        -------
+        translated : list of dicts, ``pandas.DataFrame``
+            new object of the same type as ``data``. Multiple choice
+            columns of a DataFrame become categoricals whose categories
+            are the labels, in the order they are defined in the metadata.
+        """
+        return self._translate(data, self._tables(checkbox_labels))
+
+    def to_raw(self, data, checkbox_labels=False):
+        """
+        Translate labels back into raw codes
+
+        Parameters
+        ----------
+        data : list of dicts, ``pandas.DataFrame``
+            records as exported with ``raw_or_label='label'`` or as
+            returned by :meth:`to_label`
+        checkbox_labels : (``False``), ``True``
+            whether checkbox values are option labels rather than
+            ``'Checked'``/``'Unchecked'``
+
+        Returns
+        -------
+        translated : list of dicts, ``pandas.DataFrame``
+            new object of the same type as ``data``
+        """
+        return self._translate(data, self._tables(checkbox_labels, True))
+
+    def categorize(self, df):
+        """
+        Convert the raw multiple choice columns of a DataFrame into
+        categoricals whose categories are the choice codes.
+
+        Once categorized, :meth:`to_label` only renames the categories
+        and never touches the values themselves.
+        """
+        df = df.copy()
+        for column, pairs in self._tables(False).items():
+            if column in df:
+                df[column] = _as_categorical(df[column],
+                                             [raw for raw, _ in pairs])
+        return df
+
+    def _translate(self, data, tables):
+        if hasattr(data, 'columns'):
+            return self._translate_df(data, tables)
+        translated = []
+        lookups = dict((k, dict(pairs)) for k, pairs in tables.items())
+        for record in data:
+            new = dict(record)
+            for key in lookups:
+                if key in new:
+                    new[key] = lookups[key].get(new[key], new[key])
+            translated.append(new)
+        return translated
+
+    def _translate_df(self, df, tables):
+        df = df.copy()
+        for column, pairs in tables.items():
+            if column not in df:
+                continue
+            source = [src for src, _ in pairs]
+            target = [dst for _, dst in pairs]
+            values = df[column]
+            if '' in source and values.isnull().any():
+                # read_csv reads unchecked boxes exported as '' as NaN
+                if hasattr(values, 'cat') and \
+                        '' not in values.cat.categories:
+                    values = values.cat.add_categories([''])
+                values = values.fillna('')
+            cat = _as_categorical(values, source)
+            # values missing from the metadata are kept untranslated
+            target += list(cat.cat.categories[len(source):])
+            if len(set(target)) == len(target):
+                df[column] = cat.cat.rename_categories(target)
+            else:
+                # duplicated labels can't be categories, map them instead
+                mapping = dict(zip(cat.cat.categories, target))
+                df[column] = cat.map(mapping)
+        return df
+
+
+def _as_categorical(series, codes):
+    """
+    Return ``series`` as a categorical whose categories are ``codes``,
+    matching the dtype read_csv inferred for the column (e.g. 1.0 for '1'),
+    followed by any values of ``series`` that aren't codes
+    """
+    if not pd:
+        raise ImportError('pandas is required to translate DataFrames')
+    categories = pd.Index(codes)
+    values = series
+    if hasattr(series, 'cat'):
+        if series.cat.categories.equals(categories):
+            return series
+        values = series.astype(series.cat.categories.dtype)
+    if values.dtype.kind in 'iufb':
+        numeric = pd.to_numeric(categories, errors='coerce')
+        if not numeric.isnull().any():
+            categories = numeric
+            if hasattr(series, 'cat') and \
+                    series.cat.categories.equals(categories):
+                return series
+    unknown = pd.Index(values.dropna().unique()).difference(categories,
+                                                            sort=False)
+    if len(unknown):
+        categories = categories.append(unknown)
+        if hasattr(series, 'cat') and \
+                series.cat.categories.equals(categories):
+            return series
+    return values.astype(pd.CategoricalDtype(categories))
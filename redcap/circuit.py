@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Circuit breakers and health of REDCap servers
+
+Every ``Project`` sends its requests through the :class:`CircuitBreaker`
+of its URL, shared by all projects (and threads) using that URL. After
+``failures`` consecutive connection errors, timeouts or 5xx responses the
+circuit opens: requests fail at once with :class:`CircuitOpenError`
+instead of waiting on a server that isn't answering. After ``reset_after``
+seconds the circuit is half-open and lets one request through as a probe;
+its success closes the circuit, its failure opens it again.
+
+"""
+
+import threading
+import time
+
+from requests import RequestException
+
+# (connect, read) timeouts in seconds of requests sent by a Project. The
+# read timeout bounds the wait for each chunk of the response, not the
+# whole export.
+DEFAULT_TIMEOUT = (10, 300)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class CircuitOpenError(RequestException):
+    """ A request refused because its server's circuit is open """
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Failure counting and fail-fast state of one REDCap server
+
+    Attributes
+    ----------
+    url : str
+        API URL the breaker guards
+    state : str
+        ``'closed'`` (requests go through), ``'open'`` (requests fail
+        fast) or ``'half-open'`` (a probe request is allowed)
+    """
+
+    def __init__(self, url, failures=5, reset_after=30.0, probes=1):
+        """
+        Parameters
+        ----------
+        url : str
+            API URL
+        failures : int
+            consecutive failures opening the circuit
+        reset_after : float
+            seconds the circuit stays open before it lets probes through
+        probes : int
+            requests let through at once while half-open
+        """
+        self.url = url
+        self.failures = failures
+        self.reset_after = reset_after
+        self.probes = probes
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = None
+        self._probing = 0
+        self.consecutive_failures = 0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.last_failure = None
+
+    def __repr__(self):
+        return '<CircuitBreaker %s %s>' % (self.url, self.state)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current()
+
+    def _current(self):
+        if self._state == OPEN and \
+                _clock() - self._opened_at >= self.reset_after:
+            self._state = HALF_OPEN
+            self._probing = 0
+        return self._state
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = _clock()
+        self._probing = 0
+
+    def before(self):
+        """Call before sending a request; raises :class:`CircuitOpenError`
+        if it shouldn't be sent"""
+        with self._lock:
+            state = self._current()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return
+            self.rejected += 1
+            retry_in = max(0, self.reset_after - (_clock() - self._opened_at))
+        raise CircuitOpenError(
+            '%s failed %d times in a row (last: %s); not sending requests '
+            'for another %.0f seconds' % (
+                self.url, self.consecutive_failures, self.last_failure,
+                retry_in))
+
+    def success(self):
+        """Record a request that got a response"""
+        with self._lock:
+            self.total_successes += 1
+            self.consecutive_failures = 0
+            self._state = CLOSED
+            self._probing = 0
+
+    def failure(self, reason):
+        """Record a connection error, timeout or 5xx response"""
+        with self._lock:
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = str(reason)
+            state = self._current()
+            if state == HALF_OPEN or (
+                    state == CLOSED and
+                    self.consecutive_failures >= self.failures):
+                self._open()
+
+    def release(self):
+        """Record a request that failed before reaching the server, e.g.
+        on a bad argument, freeing its probe"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probing:
+                self._probing -= 1
+
+    def reset(self):
+        """Close the circuit and forget the failures"""
+        with self._lock:
+            self._state = CLOSED
+            self._probing = 0
+            self.consecutive_failures = 0
+
+    def health(self):
+        """Return a dict of the state and counts of the breaker"""
+        with self._lock:
+            return {'url': self.url, 'state': self._current(),
+                    'consecutive_failures': self.consecutive_failures,
+                    'successes': self.total_successes,
+                    'failures': self.total_failures,
+                    'rejected': self.rejected,
+                    'last_failure': self.last_failure}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url, **kwargs):
+    """Return the :class:`CircuitBreaker` shared by requests to ``url``,
+    creating it with ``kwargs`` (see :class:`CircuitBreaker`) on first
+    use"""
+    key = url.rstrip('/')
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(url, **kwargs)
+        return _breakers[key]
+
+
+def server_health():
+    """Return :meth:`CircuitBreaker.health` of every server requested so
+    far, by URL"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return dict((b.url, b.health()) for b in breakers)
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Command line interface
+
+Installed as the ``redcap`` command::
+
+    redcap export-records -o records.csv --batch-size 500 --workers 4
+    redcap export-records --format jsonl --forms demographics | gzip > d.gz
+    redcap export-records --format jsonl --max-bytes 100000000 -o r.jsonl.gz
+    redcap import-records records.jsonl --batch-size 200 --workers 2
+    redcap export-files --field consent_form -d consent/
+    redcap export-metadata --format json -o dictionary.json
+
+The API URL and token are taken from ``--url`` and ``--token`` or the
+``REDCAP_URL`` and ``REDCAP_TOKEN`` environment variables, which keep the
+token out of the process list.
+
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .circuit import DEFAULT_TIMEOUT
+from .deadlines import current_deadline, deadline_scope
+from .project import Project
+from .request import RedcapError
+from .serializers import dumps, loads
+from .sinks import JSONLinesSink
+
+
+def _split(value):
+    """Split a comma separated option into a list, ``None`` if empty"""
+    if not value:
+        return None
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def ordered_map(func, items, workers):
+    """
+    Like ``executor.map``, but only ``2 * workers`` calls are submitted
+    ahead of the results consumed, so slow consumers (e.g. a pipe) keep
+    memory bounded
+    """
+    items = iter(items)
+    pending = deque()
+    deadline = current_deadline()
+
+    def call(item):
+        # workers run under the caller's deadline
+        with deadline_scope(deadline):
+            return func(item)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for item in items:
+            pending.append(executor.submit(call, item))
+            if len(pending) >= 2 * max(1, workers):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Progress(object):
+    """Report ``done/total`` on stderr, if enabled"""
+
+    def __init__(self, label, total, enabled):
+        self.label = label
+        self.total = total
+        self.enabled = enabled
+        self.done = 0
+
+    def add(self, n):
+        self.done += n
+        if self.enabled:
+            sys.stderr.write('\r%s: %d/%s' % (self.label, self.done,
+                                              self.total or '?'))
+            sys.stderr.flush()
+
+    def finish(self):
+        if self.enabled:
+            sys.stderr.write('\n')
+
+
+def _output(path, binary=False):
+    """Open ``path`` for writing; ``'-'`` is stdout"""
+    if path == '-':
+        stream = sys.stdout
+        if binary:
+            return getattr(stream, 'buffer', stream)
+        return stream
+    if binary:
+        return open(path, 'wb')
+    return io.open(path, 'w', encoding='utf-8', newline='')
+
+
+def _close(stream):
+    if stream in (sys.stdout, getattr(sys.stdout, 'buffer', None)):
+        stream.flush()
+    else:
+        stream.close()
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_records(project, args):
+    records = _split(args.records) or list(project.record_ids())
+    export_kwargs = dict(fields=_split(args.fields), forms=_split(args.forms),
+                         events=_split(args.events),
+                         raw_or_label=args.raw_or_label)
+    progress = Progress('records', len(records), args.progress)
+    if args.format == 'parquet':
+        df = project.export_records(records=records, format='df',
+                                    batch_size=args.batch_size,
+                                    workers=args.workers, **export_kwargs)
+        out = _output(args.output, binary=True)
+        df.to_parquet(out)
+        _close(out)
+        progress.add(len(records))
+        progress.finish()
+        return 0
+
+    api_format = 'csv' if args.format == 'csv' else 'json'
+
+    def fetch(batch):
+        return batch, project.export_records(records=batch, format=api_format,
+                                             **export_kwargs)
+
+    if args.format == 'jsonl':
+        target = sys.stdout if args.output == '-' else args.output
+        out = JSONLinesSink(target, max_bytes=args.max_bytes)
+    else:
+        out = _output(args.output)
+    first = True
+    if args.format == 'json':
+        out.write(u'[')
+    for batch, data in ordered_map(fetch, _chunks(records, args.batch_size),
+                                   args.workers):
+        if args.format == 'csv':
+            if not first:
+                # drop the repeated header line
+                data = data.split('\n', 1)[1] if '\n' in data else ''
+            out.write(data)
+        else:
+            for row in data:
+                if args.format == 'json':
+                    out.write((u'' if first else u',') + dumps(row))
+                else:
+                    out.write(row)
+                first = False
+        first = False
+        progress.add(len(batch))
+    if args.format == 'json':
+        out.write(u']\n')
+    if args.format == 'jsonl':
+        out.close()
+    else:
+        _close(out)
+    progress.finish()
+    return 0
+
+
+def _read_rows(path, fmt):
+    """Yield the records of an input file (``'-'`` for stdin)"""
+    if path == '-':
+        stream = sys.stdin
+    else:
+        stream = io.open(path, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            for row in csv.DictReader(stream):
+                yield row
+        elif fmt == 'jsonl':
+            for line in stream:
+                if line.strip():
+                    yield loads(line)
+        else:
+            for row in loads(stream.read()):
+                yield row
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def import_records(project, args):
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.input)[1].lstrip('.').lower()
+        fmt = ext if ext in ('csv', 'json', 'jsonl') else 'json'
+    progress = Progress('records', None, args.progress)
+
+    def load(chunk):
+        response = project.import_records(chunk, overwrite=args.overwrite,
+                                          date_format=args.date_format,
+                                          compress=args.compress)
+        if isinstance(response, dict) and 'error' in response:
+            raise RedcapError(response['error'])
+        return len(chunk), response
+
+    count = 0
+    for n, response in ordered_map(load, _chunks(_read_rows(args.input, fmt),
+                                                 args.batch_size),
+                                   args.workers):
+        count += int(response.get('count', 0))
+        progress.add(n)
+    progress.finish()
+    sys.stdout.write(dumps({'count': count}) + '\n')
+    return 0
+
+
+def export_files(project, args):
+    rows = project.export_records(records=_split(args.records),
+                                  fields=[project.def_field, args.field],
+                                  events=_split(args.events))
+    tasks = [(row[project.def_field], row.get('redcap_event_name'))
+             for row in rows if row.get(args.field)]
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+    progress = Progress('files', len(tasks), args.progress)
+
+    def fetch(task):
+        record, event = task
+        content, info = project.export_file(record, args.field, event=event)
+        name = os.path.basename(info.get('name', args.field))
+        parts = [record, event, name] if event else [record, name]
+        path = os.path.join(args.directory, '_'.join(parts))
+        with open(path, 'wb') as fobj:
+            fobj.write(content)
+        return path
+
+    for path in ordered_map(fetch, tasks, args.workers):
+        progress.add(1)
+        if not args.progress:
+            sys.stdout.write(path + '\n')
+    progress.finish()
+    return 0
+
+
+def export_metadata(project, args):
+    fields, forms = _split(args.fields), _split(args.forms)
+    out = _output(args.output)
+    if args.format == 'csv':
+        out.write(project.export_metadata(fields=fields, forms=forms,
+                                          format='csv'))
+    else:
+        rows = project.export_metadata(fields=fields, forms=forms)
+        if args.format == 'jsonl':
+            out.write(u''.join(dumps(row) + u'\n' for row in rows))
+        else:
+            out.write(dumps(rows) + u'\n')
+    _close(out)
+    return 0
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--url', default=os.environ.get('REDCAP_URL'),
+                        help='API URL (default: $REDCAP_URL)')
+    common.add_argument('--token', default=os.environ.get('REDCAP_TOKEN'),
+                        help='API token (default: $REDCAP_TOKEN)')
+    common.add_argument('--no-verify-ssl', dest='verify_ssl',
+                        action='store_false')
+    common.add_argument('--workers', type=int, default=1,
+                        help='concurrent requests (default: 1)')
+    common.add_argument('--timeout', type=float,
+                        help='seconds to wait for a connection or a read '
+                             '(default: %d, %d)' % DEFAULT_TIMEOUT)
+    common.add_argument('--deadline', type=float,
+                        help='seconds the whole command must finish in')
+    common.add_argument('--progress', action='store_true',
+                        help='report progress on stderr')
+
+    parser = argparse.ArgumentParser(
+        prog='redcap', description='Transfer data to and from REDCap')
+    commands = parser.add_subparsers(dest='command')
+
+    cmd = commands.add_parser('export-records', parents=[common],
+                              help='export records in batches')
+    cmd.add_argument('-o', '--output', default='-',
+                     help='output file (default: stdout)')
+    cmd.add_argument('--format', default='csv',
+                     choices=('csv', 'json', 'jsonl', 'parquet'))
+    cmd.add_argument('--batch-size', type=int, default=500)
+    cmd.add_argument('--max-bytes', type=int,
+                     help='with jsonl, split the output into files of at '
+                          'most this many (uncompressed) bytes')
+    cmd.add_argument('--records', help='comma separated record ids')
+    cmd.add_argument('--fields', help='comma separated field names')
+    cmd.add_argument('--forms', help='comma separated form names')
+    cmd.add_argument('--events', help='comma separated unique event names')
+    cmd.add_argument('--raw-or-label', default='raw',
+                     choices=('raw', 'label', 'both'))
+    cmd.set_defaults(func=export_records)
+
+    cmd = commands.add_parser('import-records', parents=[common],
+                              help='import records in batches')
+    cmd.add_argument('input', help="input file, '-' for stdin")
+    cmd.add_argument('--format', choices=('csv', 'json', 'jsonl'),
+                     help='input format (default: from the file extension)')
+    cmd.add_argument('--batch-size', type=int, default=500)
+    cmd.add_argument('--overwrite', default='normal',
+                     choices=('normal', 'overwrite'))
+    cmd.add_argument('--date-format', default='YMD',
+                     choices=('YMD', 'MDY', 'DMY'))
+    cmd.add_argument('--compress', action='store_true',
+                     help='gzip request bodies (the server must accept it)')
+    cmd.set_defaults(func=import_records)
+
+    cmd = commands.add_parser('export-files', parents=[common],
+                              help="export the files of a file field")
+    cmd.add_argument('--field', required=True)
+    cmd.add_argument('-d', '--directory', default='.')
+    cmd.add_argument('--records', help='comma separated record ids')
+    cmd.add_argument('--events', help='comma separated unique event names')
+    cmd.set_defaults(func=export_files)
+
+    cmd = commands.add_parser('export-metadata', parents=[common],
+                              help='export the data dictionary')
+    cmd.add_argument('-o', '--output', default='-',
+                     help='output file (default: stdout)')
+    cmd.add_argument('--format', default='csv',
+                     choices=('csv', 'json', 'jsonl'))
+    cmd.add_argument('--fields', help='comma separated field names')
+    cmd.add_argument('--forms', help='comma separated form names')
+    cmd.set_defaults(func=export_metadata)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, 'func', None):
+        parser.print_help()
+        return 2
+    if not (args.url and args.token):
+        parser.error('--url and --token (or $REDCAP_URL and $REDCAP_TOKEN) '
+                     'are required')
+    project = Project(args.url, args.token, verify_ssl=args.verify_ssl,
+                      lazy=True, timeout=args.timeout or DEFAULT_TIMEOUT)
+    try:
+        with deadline_scope(args.deadline):
+            return args.func(project, args)
+    except (RedcapError, ValueError, IOError) as e:
+        sys.stderr.write('redcap: error: %s\n' % e)
+        return 1
+    finally:
+        project.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
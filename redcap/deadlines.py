@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Deadlines of long operations
+
+A :class:`Deadline` bounds the total time of everything done under it::
+
+    with Deadline(600):
+        project.export_records(batch_size=500, workers=4)
+
+or of one call, with ``deadline=600``. Requests are sent with their
+timeouts cut to the time left, batched exports stop sending batches when
+it runs out, and streamed exports stop between rows. The operation then
+raises :class:`DeadlineExceeded` with what it had done and a cursor to
+resume from.
+
+"""
+
+import threading
+import time
+
+from requests import RequestException
+
+_clock = getattr(time, 'monotonic', time.time)
+_local = threading.local()
+
+
+class DeadlineExceeded(RequestException):
+    """
+    An operation that ran past its deadline
+
+    Attributes
+    ----------
+    partial :
+        what the operation completed, e.g. the records of the finished
+        batches of an export, or the number of records written to a sink
+    cursor : list, None
+        what is left to do, e.g. the record ids of the unfinished
+        batches (pass them as ``records`` to resume), or ``None`` if the
+        operation can't be resumed
+    """
+
+    def __init__(self, message, partial=None, cursor=None):
+        RequestException.__init__(self, message)
+        self.partial = partial
+        self.cursor = cursor
+
+
+class Deadline(object):
+    """
+    A point in time operations must finish by
+
+    Used as a context manager, it applies to everything the current
+    thread does under it; nested deadlines can only shorten it.
+    """
+
+    def __init__(self, seconds):
+        """
+        Parameters
+        ----------
+        seconds : float
+            time from now until the deadline
+        """
+        self.seconds = seconds
+        self.expires = _clock() + seconds
+
+    @classmethod
+    def of(cls, value):
+        """Return ``value`` as a :class:`Deadline`: a deadline itself, a
+        number of seconds or ``None``"""
+        if value is None or isinstance(value, cls):
+            return value
+        return cls(value)
+
+    def __repr__(self):
+        return '<Deadline in %.1fs>' % self.remaining()
+
+    def remaining(self):
+        """Return the seconds left, 0 once expired"""
+        return max(0.0, self.expires - _clock())
+
+    @property
+    def expired(self):
+        return _clock() >= self.expires
+
+    def check(self, what='operation', partial=None, cursor=None):
+        """Raise :class:`DeadlineExceeded` if the deadline has passed"""
+        if self.expired:
+            raise DeadlineExceeded(
+                '%s ran past its deadline of %gs' % (what, self.seconds),
+                partial, cursor)
+
+    def timeout(self, timeout):
+        """Return a ``requests`` timeout (seconds, ``(connect, read)`` or
+        ``None``) cut to the time left"""
+        # requests rejects a timeout of 0
+        left = max(self.remaining(), 0.001)
+        if timeout is None:
+            return left
+        if isinstance(timeout, tuple):
+            return tuple(left if t is None else min(t, left)
+                         for t in timeout)
+        return min(timeout, left)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.stack.remove(self)
+
+
+def current_deadline(deadline=None):
+    """Return the earliest of ``deadline`` (a :class:`Deadline`, seconds
+    or ``None``) and the deadlines the current thread is under, or
+    ``None``"""
+    deadlines = list(getattr(_local, 'stack', None) or [])
+    deadline = Deadline.of(deadline)
+    if deadline is not None:
+        deadlines.append(deadline)
+    if not deadlines:
+        return None
+    return min(deadlines, key=lambda d: d.expires)
+
+
+class _NoDeadline(object):
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def deadline_scope(deadline):
+    """Return a context manager putting the current thread under
+    ``deadline`` (a :class:`Deadline`, seconds or ``None``)"""
+    deadline = Deadline.of(deadline)
+    return _NoDeadline() if deadline is None else deadline
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Arms, events and forms of longitudinal projects
+
+:class:`LongitudinalIndex` indexes a project's events, arms and form-event
+mapping once, so planning exports or reshaping them needs no further
+scans of ``Project.events`` and no extra API calls. Use
+:attr:`redcap.Project.longitudinal_index` to get one.
+
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LongitudinalIndex(object):
+    """
+    Lookups between arms, events and forms
+
+    Classic projects get an empty index (``longitudinal`` is false).
+    """
+
+    def __init__(self, events, arm_nums=(), arm_names=(), fem=None):
+        """
+        Parameters
+        ----------
+        events : list
+            event dicts as exported (``unique_event_name``,
+            ``event_name``, ``arm_num``)
+        arm_nums, arm_names : sequence
+            parallel arm numbers and names
+        fem : list, callable, optional
+            form-event mapping rows (``unique_event_name``, ``form``) as
+            exported by ``Project.export_fem``, or a callable returning
+            them, called once the first time forms are looked up
+        """
+        #: unique event names in project order
+        self.events = tuple(e['unique_event_name'] for e in events)
+        #: arm number (str) -> arm name
+        self.arms = OrderedDict((str(n), name)
+                                for n, name in zip(arm_nums, arm_names))
+        #: unique event name -> event label
+        self.labels = dict((e['unique_event_name'], e['event_name'])
+                           for e in events)
+        self._event_arm = {}
+        self._arm_events = OrderedDict((arm, []) for arm in self.arms)
+        self._aliases = {}
+        for event in events:
+            unique = event['unique_event_name']
+            arm = str(event.get('arm_num', ''))
+            self._event_arm[unique] = arm
+            self._arm_events.setdefault(arm, []).append(unique)
+            # exports may name events by unique name, label or
+            # "label (Arm n: name)"
+            self._aliases[unique] = unique
+            self._aliases[event['event_name']] = unique
+            if arm in self.arms:
+                self._aliases['%s (Arm %s: %s)' % (
+                    event['event_name'], arm, self.arms[arm])] = unique
+        self._fem = fem
+        self._event_forms = None
+        self._form_events = None
+        self._lock = threading.Lock()
+
+    @property
+    def longitudinal(self):
+        """Whether the project has events and arms"""
+        return bool(self.events and self.arms)
+
+    def __bool__(self):
+        return self.longitudinal
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '<LongitudinalIndex of %d arms, %d events>' % (
+            len(self.arms), len(self.events))
+
+    def _mapping(self):
+        if self._event_forms is None:
+            with self._lock:
+                if self._event_forms is None:
+                    rows = self._fem() if callable(self._fem) else self._fem
+                    event_forms = OrderedDict((e, []) for e in self.events)
+                    form_events = OrderedDict()
+                    for row in rows or []:
+                        event, form = row['unique_event_name'], row['form']
+                        event_forms.setdefault(event, []).append(form)
+                        form_events.setdefault(form, []).append(event)
+                    self._form_events = form_events
+                    self._event_forms = event_forms
+        return self._event_forms, self._form_events
+
+    @property
+    def event_forms(self):
+        """dict of unique event name -> forms mapped to it"""
+        return self._mapping()[0]
+
+    @property
+    def form_events(self):
+        """dict of form -> unique event names it is mapped to"""
+        return self._mapping()[1]
+
+    def events_in(self, arm=None):
+        """Return the unique event names of ``arm`` (all arms by default)
+        in project order"""
+        if arm is None:
+            return list(self.events)
+        return list(self._arm_events.get(str(arm), []))
+
+    def arm_of(self, event):
+        """Return the arm number (str) of a unique event name"""
+        return self._event_arm[event]
+
+    def forms_in(self, event):
+        """Return the forms mapped to a unique event name"""
+        return list(self.event_forms.get(event, []))
+
+    def events_of(self, form, events=None):
+        """Return the unique event names ``form`` is mapped to, only those
+        in ``events`` if given"""
+        mapped = self.form_events.get(form, [])
+        if events:
+            return [e for e in mapped if e in events]
+        return list(mapped)
+
+    def unique_name(self, name):
+        """Return the unique event name of an event given by unique name,
+        label or ``'label (Arm n: name)'``; unknown names are returned
+        unchanged"""
+        return self._aliases.get(name, name)
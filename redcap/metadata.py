@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Comparing data dictionaries
+
+The REDCap API can only replace a project's whole data dictionary, which is
+slow on large projects. :class:`MetadataDiff` compares two dictionaries
+field by field so unchanged dictionaries don't have to be imported at all.
+
+"""
+
+
+def normalize(rows, keys=None):
+    """
+    Return metadata rows as dicts of stripped strings, with every key of
+    ``keys`` present (REDCap exports empty attributes as ``''``)
+    """
+    out = []
+    for row in rows:
+        norm = dict.fromkeys(keys or (), '')
+        for key, value in row.items():
+            if value is None:
+                value = ''
+            elif not hasattr(value, 'strip'):
+                value = str(value)
+            norm[key] = value.strip()
+        out.append(norm)
+    return out
+
+
+class MetadataDiff(object):
+    """
+    Field-by-field differences between two data dictionaries
+
+    Attributes
+    ----------
+    added : list
+        names of fields only in the new dictionary, in its order
+    removed : list
+        names of fields only in the old dictionary, in its order
+    changed : dict
+        field name -> dict of attribute -> ``(old, new)`` values for
+        fields in both dictionaries
+    reordered : bool
+        whether the fields in both dictionaries appear in a different
+        order (REDCap shows fields in dictionary order)
+    """
+
+    def __init__(self, old, new):
+        """
+        Parameters
+        ----------
+        old, new : list
+            metadata rows (dicts with at least ``field_name``)
+        """
+        keys = set()
+        for row in old:
+            keys.update(row)
+        self.old = normalize(old, keys)
+        self.new = normalize(new, keys)
+        old_by_name = dict((r['field_name'], r) for r in self.old)
+        new_by_name = dict((r['field_name'], r) for r in self.new)
+        self.added = [r['field_name'] for r in self.new
+                      if r['field_name'] not in old_by_name]
+        self.removed = [r['field_name'] for r in self.old
+                        if r['field_name'] not in new_by_name]
+        self.changed = {}
+        for name, new_row in new_by_name.items():
+            old_row = old_by_name.get(name)
+            if old_row is None:
+                continue
+            delta = dict((k, (old_row.get(k, ''), v))
+                         for k, v in new_row.items()
+                         if old_row.get(k, '') != v)
+            if delta:
+                self.changed[name] = delta
+        kept_old = [r['field_name'] for r in self.old
+                    if r['field_name'] in new_by_name]
+        kept_new = [r['field_name'] for r in self.new
+                    if r['field_name'] in old_by_name]
+        self.reordered = kept_old != kept_new
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or
+                    self.reordered)
+
+    __nonzero__ = __bool__
+
+    def summary(self):
+        """Return a short, human readable description of the differences"""
+        if not self:
+            return 'no changes'
+        parts = []
+        for label, names in (('added', self.added),
+                             ('removed', self.removed),
+                             ('changed', sorted(self.changed))):
+            if names:
+                parts.append('%s: %s' % (label, ', '.join(names)))
+        if self.reordered:
+            parts.append('fields reordered')
+        return '; '.join(parts)
+
+    def __repr__(self):
+        return '<MetadataDiff %s>' % self.summary()
+
+
+NUMERIC_TYPES = ('calc', 'slider')
+NUMERIC_VALIDATIONS = ('integer', 'number')
+DATE_VALIDATIONS = ('date_', 'datetime_')
+
+
+def column_types(metadata, columns):
+    """
+    Return the ``dtype`` and ``parse_dates`` arguments of
+    ``pandas.read_csv`` for exported ``columns``, based on the data
+    dictionary
+
+    Numeric text fields, calculations and sliders are read as floats,
+    dates and datetimes are parsed, and all other fields (including
+    checkbox columns) are kept as strings so codes and identifiers keep
+    their leading zeros. Columns not in the dictionary, like
+    ``redcap_event_name`` or label headers, are left to pandas.
+
+    Returns
+    -------
+    dtype : dict
+    parse_dates : list
+    """
+    by_name = dict((m['field_name'], m) for m in metadata)
+    dtype, dates = {}, []
+    for column in columns:
+        field = by_name.get(column)
+        if field is None:
+            name, sep, _ = column.partition('___')
+            if sep and name in by_name:
+                dtype[column] = str
+            continue
+        validation = field.get(
+            'text_validation_type_or_show_slider_number') or ''
+        if field.get('field_type') == 'text' and \
+                validation.startswith(DATE_VALIDATIONS):
+            dates.append(column)
+        elif field.get('field_type') in NUMERIC_TYPES or (
+                field.get('field_type') == 'text' and
+                validation.startswith(NUMERIC_VALIDATIONS)):
+            dtype[column] = 'float64'
+        else:
+            dtype[column] = str
+    return dtype, dates
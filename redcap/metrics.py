@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Per-request instrumentation
+
+Every request a :class:`redcap.Project` sends is described by a
+:class:`RequestMetrics` object, which is passed to each callable in the
+project's ``hooks``. :class:`MetricsCollector` is a ready-made hook that
+sums them up.
+
+With ``Project(profile_memory=True)``, the hooks also receive a
+:class:`MemoryMetrics` for each phase of an export or import (receiving
+the response, decoding it, building a DataFrame, serializing an import),
+measured with :mod:`tracemalloc`.
+
+"""
+
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # python < 3.4
+    tracemalloc = None
+
+# guards the count of phases being measured and the tracemalloc snapshots,
+# never a whole phase, so profiled requests still run concurrently
+_profile_lock = threading.RLock()
+_profiling = {'active': 0, 'started': False}
+
+
+class RequestMetrics(object):
+    """
+    Measurements of a single API request
+
+    Attributes
+    ----------
+    type : str
+        request type, e.g. ``'exp_record'``
+    content : str
+        ``content`` of the payload, e.g. ``'record'``
+    status : int
+        HTTP status code
+    elapsed : float
+        seconds from sending the request until the response was read
+    bytes_sent : int
+        size of the request body as sent, after compression. ``None``
+        when the body was streamed from an iterator.
+    bytes_received : int
+        size of the response body as received, before decompression
+    content_bytes : int
+        size of the response body after decompression
+    content_encoding : str
+        ``Content-Encoding`` of the response, ``''`` if uncompressed
+    """
+
+    def __init__(self, type, content, status, elapsed, bytes_sent,
+                 bytes_received, content_bytes, content_encoding=''):
+        self.type = type
+        self.content = content
+        self.status = status
+        self.elapsed = elapsed
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.content_bytes = content_bytes
+        self.content_encoding = content_encoding
+
+    @classmethod
+    def from_response(cls, request, response, elapsed):
+        """Build metrics from an RCRequest and its ``requests`` response"""
+        body = response.request.body if response.request is not None \
+            else None
+        bytes_sent = len(body) if hasattr(body, '__len__') else None
+        content_bytes = len(response.content)
+        received = getattr(response.raw, 'tell', None)
+        try:
+            bytes_received = received() if received else content_bytes
+        except Exception:
+            bytes_received = content_bytes
+        return cls(request.type, request.payload.get('content'),
+                   response.status_code, elapsed, bytes_sent,
+                   bytes_received or content_bytes, content_bytes,
+                   response.headers.get('content-encoding', ''))
+
+    def __repr__(self):
+        return ('<RequestMetrics %s %d: %.3fs, sent %s, received %d '
+                '(%d decoded)>' % (self.type, self.status, self.elapsed,
+                                   self.bytes_sent, self.bytes_received,
+                                   self.content_bytes))
+
+
+class MemoryMetrics(object):
+    """
+    Memory used by one phase of an export or import
+
+    Attributes
+    ----------
+    phase : str
+        ``'receive'`` (sending the request and reading the response),
+        ``'decode'`` (JSON or text decoding of the response),
+        ``'dataframe'`` (parsing csv into a DataFrame) or ``'serialize'``
+        (encoding the data of an import)
+    type : str
+        request type, e.g. ``'exp_record'``
+    peak : int
+        highest traced allocation during the phase, in bytes above what
+        was allocated when it started
+    retained : int
+        bytes still allocated when the phase ended (its result, mostly)
+    blocks : int
+        change in the number of allocated memory blocks
+    payload_bytes : int
+        size of the data the phase worked on: the request and response
+        bodies for ``receive``, the response body for ``decode``, the csv for ``dataframe``, the
+        encoded data for ``serialize``. ``None`` if unknown.
+    elapsed : float
+        seconds, including the overhead of tracing
+    """
+
+    def __init__(self, phase, type, peak, retained, blocks,
+                 payload_bytes=None, elapsed=0.0):
+        self.phase = phase
+        self.type = type
+        self.peak = peak
+        self.retained = retained
+        self.blocks = blocks
+        self.payload_bytes = payload_bytes
+        self.elapsed = elapsed
+
+    @property
+    def copies(self):
+        """Peak memory per byte of payload, ``None`` without a payload"""
+        if not self.payload_bytes:
+            return None
+        return float(self.peak) / self.payload_bytes
+
+    def __repr__(self):
+        copies = self.copies
+        return ('<MemoryMetrics %s %s: peak %d, retained %d, %s copies>'
+                % (self.type, self.phase, self.peak, self.retained,
+                   '?' if copies is None else '%.2f' % copies))
+
+
+class _Phase(object):
+    """Context manager measuring one phase; set ``payload_bytes`` inside"""
+
+    def __init__(self, hooks, phase, type):
+        self.hooks = hooks
+        self.phase = phase
+        self.type = type
+        self.payload_bytes = None
+
+    def __enter__(self):
+        with _profile_lock:
+            if not _profiling['active'] and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _profiling['started'] = True
+            # the peak is process-wide: don't reset it under another phase
+            if not _profiling['active'] and \
+                    hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            _profiling['active'] += 1
+            self._current = tracemalloc.get_traced_memory()[0]
+            self._blocks = sys.getallocatedblocks()
+            self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with _profile_lock:
+            elapsed = time.time() - self._start
+            current, peak = tracemalloc.get_traced_memory()
+            blocks = sys.getallocatedblocks() - self._blocks
+            _profiling['active'] -= 1
+            if not _profiling['active'] and _profiling['started']:
+                tracemalloc.stop()
+                _profiling['started'] = False
+        if exc_type is None:
+            metrics = MemoryMetrics(self.phase, self.type,
+                                    max(0, peak - self._current),
+                                    current - self._current, blocks,
+                                    self.payload_bytes, elapsed)
+            for hook in self.hooks:
+                hook(metrics)
+        return False
+
+
+class _NoPhase(object):
+    payload_bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def profile_phase(hooks, phase, type, enabled):
+    """
+    Measure the memory of a block if ``enabled``, calling ``hooks`` with
+    its :class:`MemoryMetrics`::
+
+        with profile_phase(hooks, 'decode', 'exp_record', True) as p:
+            p.payload_bytes = len(body)
+            data = decode(body)
+
+    Tracing is started by the first phase and stopped when the last one
+    ends, unless it was already on. Phases of concurrent requests run at
+    the same time; tracemalloc's peak is process-wide, so the peak of
+    phases that overlap includes the allocations of each other.
+    """
+    if not enabled:
+        return _NoPhase()
+    if tracemalloc is None:
+        raise RuntimeError('Memory profiling needs python 3.4 or newer')
+    return _Phase(hooks or [], phase, type)
+
+
+class MetricsCollector(object):
+    """
+    Hook accumulating :class:`RequestMetrics`, safe to share between
+    threads and projects::
+
+        collector = MetricsCollector()
+        project = Project(url, token, hooks=[collector])
+        project.export_records()
+        print(collector.totals())
+    """
+
+    def __init__(self, keep=True):
+        """
+        Parameters
+        ----------
+        keep : (``True``), ``False``
+            keep every :class:`RequestMetrics` in ``requests``, not only
+            the totals
+        """
+        self.keep = keep
+        self.requests = []
+        #: :class:`MemoryMetrics` received, when ``keep``
+        self.memory = []
+        self._totals = dict.fromkeys(
+            ('requests', 'elapsed', 'bytes_sent', 'bytes_received',
+             'content_bytes'), 0)
+        self._phases = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics):
+        if isinstance(metrics, MemoryMetrics):
+            return self._add_memory(metrics)
+        with self._lock:
+            if self.keep:
+                self.requests.append(metrics)
+            totals = self._totals
+            totals['requests'] += 1
+            totals['elapsed'] += metrics.elapsed
+            totals['bytes_sent'] += metrics.bytes_sent or 0
+            totals['bytes_received'] += metrics.bytes_received
+            totals['content_bytes'] += metrics.content_bytes
+
+    def totals(self):
+        """Return a dict of request count, elapsed seconds and byte counts
+        summed over all requests"""
+        with self._lock:
+            return dict(self._totals)
+
+    def _add_memory(self, metrics):
+        with self._lock:
+            if self.keep:
+                self.memory.append(metrics)
+            phase = self._phases.setdefault(metrics.phase, dict.fromkeys(
+                ('count', 'peak', 'payload_bytes', 'elapsed'), 0))
+            phase['count'] += 1
+            phase['peak'] = max(phase['peak'], metrics.peak)
+            phase['payload_bytes'] += metrics.payload_bytes or 0
+            phase['elapsed'] += metrics.elapsed
+
+    def memory_totals(self):
+        """Return, per phase, the number of measurements, the highest
+        ``peak``, the summed ``payload_bytes`` and ``elapsed`` seconds"""
+        with self._lock:
+            return dict((k, dict(v)) for k, v in self._phases.items())
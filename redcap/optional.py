@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Optional dependencies, imported on first use
+
+pandas (and numpy with it) takes hundreds of milliseconds to import, which
+scripts that never ask for a DataFrame shouldn't pay for. The objects here
+stand in for an optional module or one of its functions: they import it
+the first time they're used, and are false when it isn't installed, so
+``if not read_csv:`` still detects a missing pandas.
+
+"""
+
+import threading
+
+_import_lock = threading.Lock()
+
+
+class OptionalModule(object):
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._missing = False
+
+    def _load(self):
+        if self._module is None and not self._missing:
+            with _import_lock:
+                if self._module is None and not self._missing:
+                    try:
+                        self._module = __import__(self._name, fromlist=['_'])
+                    except ImportError:
+                        self._missing = True
+        return self._module
+
+    def __bool__(self):
+        return self._load() is not None
+
+    __nonzero__ = __bool__
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            # e.g. copy and pickle probing an uninitialized instance
+            raise AttributeError(attr)
+        module = self._load()
+        if module is None:
+            raise ImportError('%s is required for this, but not installed'
+                              % self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return '<optional module %s>' % self._name
+
+
+class OptionalFunction(object):
+    """Stand-in for a function of an optional module"""
+
+    def __init__(self, module, name):
+        self._module = module
+        self._name = name
+
+    def __bool__(self):
+        return bool(self._module)
+
+    __nonzero__ = __bool__
+
+    def __call__(self, *args, **kwargs):
+        return getattr(self._module, self._name)(*args, **kwargs)
+
+    def __repr__(self):
+        return '<optional function %s.%s>' % (self._module._name,
+                                              self._name)
+
+
+pandas = OptionalModule('pandas')
+numpy = OptionalModule('numpy')
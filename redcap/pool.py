@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Running the same operation across many projects
+
+A :class:`ProjectPool` holds one :class:`redcap.Project` per (url, token)
+pair. Projects on the same REDCap server share one pooled HTTP session and
+a per-server limit on concurrent requests, so a fleet of projects can be
+exported in parallel without overloading any single server.
+
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .project import Project
+from .request import RedcapError
+from .transport import SessionTransport, pooled_session
+
+try:
+    from urlparse import urlsplit
+except ImportError:
+    from urllib.parse import urlsplit
+
+
+class PoolResult(object):
+    """
+    Outcome of running an operation on one project of a pool
+
+    Attributes
+    ----------
+    project : :class:`redcap.Project`
+    result :
+        return value of the operation, ``None`` if it failed
+    error : Exception
+        exception raised by the operation, ``None`` if it succeeded
+    elapsed : float
+        seconds the operation took
+    """
+
+    def __init__(self, project, result=None, error=None, elapsed=0.0):
+        self.project = project
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        state = 'ok' if self.ok else 'error: %r' % self.error
+        return '<PoolResult %s %s>' % (self.project.name or self.project.url,
+                                       state)
+
+
+class PoolError(RedcapError):
+    """ Raised when an operation failed for one or more projects of a pool
+
+    ``results`` holds every :class:`PoolResult`, ``errors`` only the failed
+    ones.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.errors = [r for r in results if not r.ok]
+        msg = '%d of %d projects failed: %s' % (
+            len(self.errors), len(results),
+            '; '.join('%s: %s' % (r.project.name or r.project.url, r.error)
+                      for r in self.errors))
+        super(PoolError, self).__init__(msg)
+
+
+class _LimitedTransport(SessionTransport):
+    """Session transport sending at most as many requests at once as
+    ``slots`` allows, shared by the projects of one server"""
+
+    def __init__(self, session, slots):
+        SessionTransport.__init__(self, session)
+        self.slots = slots
+
+    def send(self, request, data, headers=None, **kwargs):
+        with self.slots:
+            return SessionTransport.send(self, request, data,
+                                         headers=headers, **kwargs)
+
+
+def server_of(url):
+    """Key used to group projects by server: scheme and host of the URL"""
+    parts = urlsplit(url)
+    return '%s://%s' % (parts.scheme, parts.netloc)
+
+
+class ProjectPool(object):
+    """Fan out operations over many projects, grouped by server"""
+
+    def __init__(self, credentials, per_server=4, verify_ssl=True,
+                 configure=True, progress=None, raise_errors=False):
+        """
+        Parameters
+        ----------
+        credentials : list
+            ``(url, token)`` or ``(url, token, name)`` tuples
+        per_server : int, dict
+            maximum number of concurrent requests to any one server, and
+            of operations run on its projects at once. Pass a dict of
+            server (``'https://redcap.example.com'``) -> limit to set
+            limits per server; missing servers get 4. Operations that
+            send several requests at once (``workers``, ``split_by``,
+            ``batch_size``) share the limit too. For streamed exports,
+            the limit covers sending the request, not reading the body.
+        verify_ssl : boolean, str
+            passed to each :class:`redcap.Project`
+        configure : (``True``), ``False``
+            configure all projects concurrently on instantiation. Projects
+            that fail are left out of the pool and their
+            :class:`PoolResult` kept in ``errors``.
+        progress : callable, optional
+            default for the ``progress`` argument of :meth:`map`
+        raise_errors : (``False``), ``True``
+            raise :class:`PoolError` instead if any project fails to
+            configure
+        """
+        self.progress = progress
+        #: :class:`PoolResult` of every project that failed to configure
+        self.errors = []
+        self.projects = []
+        self.sessions = {}
+        self.transports = {}
+        self.executors = {}
+        self._server = {}
+        for cred in credentials:
+            url, token = cred[0], cred[1]
+            name = cred[2] if len(cred) > 2 else ''
+            server = server_of(url)
+            if server not in self.sessions:
+                if isinstance(per_server, dict):
+                    limit = per_server.get(server, 4)
+                else:
+                    limit = per_server
+                self.sessions[server] = pooled_session(limit)
+                self.transports[server] = _LimitedTransport(
+                    self.sessions[server], threading.BoundedSemaphore(limit))
+                self.executors[server] = ThreadPoolExecutor(max_workers=limit)
+            project = Project(url, token, name=name, verify_ssl=verify_ssl,
+                              lazy=True, transport=self.transports[server])
+            self._server[id(project)] = server
+            self.projects.append(project)
+        if configure:
+            # the pool already limits concurrency per server
+            results = self.map('configure', workers=1)
+            self.errors = [r for r in results if not r.ok]
+            if self.errors and raise_errors:
+                self.close()
+                raise PoolError(results)
+            self.projects = [r.project for r in results if r.ok]
+
+    def __len__(self):
+        return len(self.projects)
+
+    def __iter__(self):
+        return iter(self.projects)
+
+    def servers(self):
+        """Return dict of server -> projects on that server"""
+        grouped = {}
+        for project in self.projects:
+            grouped.setdefault(self._server[id(project)], []).append(project)
+        return grouped
+
+    def _submit(self, func, args, kwargs):
+        futures = {}
+        for project in self.projects:
+            executor = self.executors[self._server[id(project)]]
+            futures[executor.submit(_run, project, func, args, kwargs)] = \
+                project
+        return futures
+
+    def imap(self, func, *args, **kwargs):
+        """
+        Run ``func`` on every project, yielding a :class:`PoolResult` as
+        soon as each one finishes
+
+        Parameters
+        ----------
+        func : callable, str
+            called with the project as first argument, or the name of a
+            ``Project`` method, e.g. ``'export_records'``
+        progress : callable, optional
+            called as ``progress(done, total, result)`` after each project
+        args, kwargs :
+            passed on to ``func``
+        """
+        progress = kwargs.pop('progress', self.progress)
+        futures = self._submit(func, args, kwargs)
+        total = len(futures)
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            if progress is not None:
+                progress(done, total, result)
+            yield result
+
+    def map(self, func, *args, **kwargs):
+        """
+        Run ``func`` on every project and wait for all of them
+
+        Takes the same arguments as :meth:`imap`, plus
+
+        raise_errors : (``False``), ``True``
+            raise :class:`PoolError` if the operation failed for any
+            project
+
+        Returns
+        -------
+        results : list
+            :class:`PoolResult` objects, in the order of the projects
+        """
+        raise_errors = kwargs.pop('raise_errors', False)
+        by_project = dict((id(r.project), r)
+                          for r in self.imap(func, *args, **kwargs))
+        results = [by_project[id(p)] for p in self.projects]
+        if raise_errors and any(not r.ok for r in results):
+            raise PoolError(results)
+        return results
+
+    def close(self):
+        """Shut down the worker threads and close pooled connections"""
+        for executor in self.executors.values():
+            executor.shutdown()
+        for session in self.sessions.values():
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _run(project, func, args, kwargs):
+    """Run one operation, capturing its result or exception"""
+    start = time.time()
+    try:
+        if not callable(func):
+            result = getattr(project, func)(*args, **kwargs)
+        else:
+            result = func(project, *args, **kwargs)
+    except Exception as e:
+        return PoolResult(project, error=e, elapsed=time.time() - start)
+    return PoolResult(project, result=result, elapsed=time.time() - start)
@@ -5,10 +5,30 @@ __author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
 __license__ = 'MIT'
 __copyright__ = '2014, Vanderbilt University'
 
-import json
+import csv
+import functools
+import io
+import os
+import threading
+import time
 import warnings
-
-from .request import RCRequest, RedcapError, RequestException
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from email.utils import mktime_tz, parsedate_tz
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from .request import (RCRequest, RedcapError, RequestException, ChunkedData,
+                      spool_form, spool_multipart)
+from .transport import SessionTransport
+from .circuit import CircuitOpenError, DEFAULT_TIMEOUT, breaker_for
+from .deadlines import DeadlineExceeded, current_deadline, deadline_scope
+from .choices import ChoiceMap
+from .metadata import MetadataDiff, column_types
+from .records import RecordIndex
+from .longitudinal import LongitudinalIndex
+from .changes import HashIndex, record_digests
+from .serializers import dumps, loads
+from .metrics import profile_phase
 
 import semantic_version
 
@@ -16,16 +36,119 @@ try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
+from io import BytesIO
 
-try:
-    from pandas import read_csv
-except ImportError:
-    read_csv = None
+from .optional import OptionalFunction, pandas
 
-class Project(object):
-    """Main class for interacting with REDCap projects"""
+# pandas is only imported once a DataFrame is asked for; both are false
+# when it isn't installed
+concat = OptionalFunction(pandas, 'concat')
+read_csv = OptionalFunction(pandas, 'read_csv')
+
+# DataFrame rows written to csv at a time when importing a DataFrame
+IMPORT_CHUNK_ROWS = 5000
+
+
+def _frame_csv(df, csv_kwargs, rows=None):
+    """Yield the csv of a DataFrame ``rows`` (``IMPORT_CHUNK_ROWS``) rows
+    at a time, with the header in the first piece"""
+    rows = rows or IMPORT_CHUNK_ROWS
+    for start in range(0, max(len(df), 1), rows):
+        yield df.iloc[start:start + rows].to_csv(header=start == 0,
+                                                 **csv_kwargs)
+
+
+def _read_csv_bytes(raw, df_kwargs):
+    """Parse one exported csv chunk, possibly in a worker process"""
+    if not raw.strip():
+        return None
+    return read_csv(BytesIO(raw), **df_kwargs)
+
+
+# cached reports are checked for changes since they were exported, minus
+# this margin for the time REDCap took to build the report
+CACHE_MARGIN = timedelta(minutes=5)
+
+# reports kept per project with cache=True, the least recently used
+# dropped first
+CACHED_REPORTS = 16
+
+
+def _api_datetime(value):
+    """Format a datetime for the API, leave strings as they are"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def _unique(items):
+    """Return items without duplicates, in their original order"""
+    seen = set()
+    return [i for i in items if not (i in seen or seen.add(i))]
+
+
+def _deadline(method):
+    """Let a Project method take a ``deadline`` keyword (seconds or a
+    :class:`redcap.deadlines.Deadline`) bounding everything it does"""
+    @functools.wraps(method)
+    def bounded(self, *args, **kwargs):
+        deadline = current_deadline(kwargs.pop('deadline', None))
+        with deadline_scope(deadline):
+            return method(self, *args, **kwargs)
+    return bounded
+
+
+class _Lazy(object):
+    """
+    Project attribute exported on first access
+
+    Reading the attribute calls the project method ``loader``, which sets
+    it (and possibly related attributes) on the instance; from then on the
+    instance attribute shadows this descriptor. Assigning the attribute
+    works as for any plain attribute.
+
+    Each loader runs under its own lock, so threads reading the same
+    attribute at once wait for a single export.
+    """
 
-    def __init__(self, url, token, name='', verify_ssl=True, lazy=False):
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+
+    def __get__(self, project, owner):
+        if project is None:
+            return self
+        with project._loader_lock(self.loader):
+            if self.name not in project.__dict__:
+                getattr(project, self.loader)()
+        return project.__dict__[self.name]
+
+
+class Project(object):
+    """
+    Main class for interacting with REDCap projects
+
+    A project can be shared between threads: lazily loaded attributes and
+    caches are filled under locks, every request gets its own payload,
+    and requests go through one pooled session (or another transport).
+    """
+
+    metadata = _Lazy('metadata', '_load_metadata')
+    field_names = _Lazy('field_names', '_index_metadata')
+    def_field = _Lazy('def_field', '_index_metadata')
+    field_labels = _Lazy('field_labels', '_index_metadata')
+    forms = _Lazy('forms', '_index_metadata')
+    redcap_version = _Lazy('redcap_version', '_load_version')
+    project_info = _Lazy('project_info', '_load_project_info')
+    events = _Lazy('events', '_load_events')
+    arm_nums = _Lazy('arm_nums', '_load_arms')
+    arm_names = _Lazy('arm_names', '_load_arms')
+    longitudinal_index = _Lazy('longitudinal_index', '_index_events')
+
+    def __init__(self, url, token, name='', verify_ssl=True, lazy=False,
+                 session=None, hooks=None, profile_memory=False,
+                 multipart=True, transport=None, timeout=DEFAULT_TIMEOUT,
+                 circuit_breaker=True, server_utc_offset=None):
         """
         Parameters
         ----------
@@ -37,26 +160,82 @@ class Project(object):
             name for project
         verify_ssl : boolean, str
             Verify SSL, default True. Can pass path to CA_BUNDLE.
+        lazy : (``False``), ``True``
+            don't configure the project on instantiation. Metadata,
+            version, project information, events and arms are then
+            each exported the first time they're needed.
+        session : ``requests.Session``, optional
+            send all requests through this session, e.g. to share pooled
+            connections between projects on the same server. By default,
+            the project creates its own.
+        hooks : list, optional
+            callables called with a :class:`redcap.metrics.RequestMetrics`
+            after every request, e.g. a
+            :class:`redcap.metrics.MetricsCollector`
+        profile_memory : (``False``), ``True``
+            also call ``hooks`` with a
+            :class:`redcap.metrics.MemoryMetrics` for every phase of
+            exports and imports (receive, decode, DataFrame build,
+            serialization), traced with :mod:`tracemalloc`. Slow; the
+            peaks of phases overlapping in several threads include each
+            other's allocations.
+        multipart : (``True``), ``False``
+            send large imports (more than
+            ``redcap.request.MULTIPART_THRESHOLD`` bytes), DataFrame
+            imports and files as streamed multipart/form-data instead of
+            form-encoding them. Pass ``False`` if something between PyCap
+            and REDCap rejects multipart requests.
+        transport : :class:`redcap.transport.Transport`, optional
+            send requests through this transport instead of ``session``,
+            e.g. a :class:`redcap.transport.CassetteTransport` recording
+            or replaying responses. The caller closes it.
+        timeout : float, tuple, None
+            seconds to wait for a connection and for each read of a
+            response, as ``(connect, read)`` or one number for both;
+            ``redcap.circuit.DEFAULT_TIMEOUT`` by default. ``None`` waits
+            forever.
+        circuit_breaker : (``True``), ``False``, ``CircuitBreaker``
+            fail fast with :class:`redcap.circuit.CircuitOpenError` while
+            the server keeps failing. ``True`` uses the breaker shared
+            by all projects on ``url`` (see
+            :func:`redcap.circuit.breaker_for`).
+        server_utc_offset : float, ``timedelta``, optional
+            offset from UTC, in hours, of the server's time zone, which
+            REDCap reads date ranges of record exports in (e.g. ``-5``
+            for US/Eastern in winter). By default, the server is assumed
+            to be in the same time zone as this machine.
         """
 
         self.token = token
         self.name = name
         self.url = url
         self.verify = verify_ssl
-        self.metadata = None
-        self.redcap_version = None
-        self.field_names = None
-        # We'll use the first field as the default id for each row
-        self.def_field = None
-        self.field_labels = None
-        self.forms = None
-        self.events = None
-        self.arm_nums = None
-        self.arm_names = None
+        self._own_transport = transport is None
+        if transport is None:
+            transport = SessionTransport(session)
+        self.transport = transport
+        self.session = getattr(transport, 'session', session)
+        self.timeout = timeout
+        if circuit_breaker is True:
+            circuit_breaker = breaker_for(url)
+        self.breaker = circuit_breaker or None
+        self.hooks = list(hooks or [])
+        self.profile_memory = profile_memory
+        self.multipart = multipart
+        # guards _locks and caches such as _choice_map
+        self._lock = threading.RLock()
+        self._locks = {}
+        self._report_cache = OrderedDict()
+        self._record_index = None
+        if server_utc_offset is not None and \
+                not isinstance(server_utc_offset, timedelta):
+            server_utc_offset = timedelta(hours=server_utc_offset)
+        self.server_utc_offset = server_utc_offset
+        # metadata, redcap_version, field_names, def_field, field_labels,
+        # forms, events, arm_nums, arm_names and project_info are loaded
+        # on first access, see _Lazy
         self.configured = False
-        # Add more detailed project info
-        #   Stored in dictionary to safe space and clarity
-        self.project_info = None
+        self._choice_map = None
 
         if not lazy:
             self.configure()
@@ -101,48 +280,126 @@ class Project(object):
         rcr = RCRequest(url, pl, 'create_project')
 
         # Execute request
-        response = rcr.execute(**{'verify': verify_ssl})[0]
+        response = rcr.execute(**{'verify': verify_ssl,
+                                  'timeout': DEFAULT_TIMEOUT})[0]
 
         return(response)
 
-    def configure(self):
+    def configure(self, workers=5):
+        """
+        Export the project's metadata, version, information, events and
+        arms
+
+        Parameters
+        ----------
+        workers : int
+            number of these requests sent concurrently, 1 to send them
+            one after the other
+        """
+        loaders = (self._load_metadata, self._load_version,
+                   self._load_project_info, self._load_events,
+                   self._load_arms)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._reload, loader)
+                           for loader in loaders]
+            for future in futures:
+                # re-raise the first failure
+                future.result()
+        else:
+            for loader in loaders:
+                self._reload(loader)
+        self.configured = True
+
+    def _loader_lock(self, loader):
+        """Return the lock serializing calls of the loader method named
+        ``loader``"""
+        with self._lock:
+            return self._locks.setdefault(loader, threading.RLock())
+
+    def _reload(self, loader):
+        with self._loader_lock(loader.__name__):
+            loader()
+
+    def close(self):
+        """Close the pooled connections of the project's own session"""
+        if self._own_transport:
+            self.transport.close()
+
+    def _load_metadata(self):
         try:
             self.metadata = self.__md()
+        except CircuitOpenError:
+            raise
         except RequestException:
             raise RedcapError("Exporting metadata failed. Check your URL and token.")
+        self._index_metadata()
+
+    def _load_version(self):
         try:
             self.redcap_version = self.__rcv()
+        except CircuitOpenError:
+            raise
         except:
             raise RedcapError("Determination of REDCap version failed")
+
+    def _load_project_info(self):
+        # Stored in dictionary to safe space and clarity
         try:
             self.project_info = self.export_project()
+        except CircuitOpenError:
+            raise
         except RequestException:
             raise RedcapError("Exporting project information failed")
 
-        self.field_names = self.filter_metadata('field_name')
-        # we'll use the first field as the default id for each row
-        self.def_field = self.field_names[0]
-        self.field_labels = self.filter_metadata('field_label')
-        self.forms = tuple(set(c['form_name'] for c in self.metadata))
-        # determine whether longitudinal
+    def _load_events(self):
         ev_data = self._call_api(self.__basepl('event'), 'exp_event')[0]
-        arm_data = self._call_api(self.__basepl('arm'), 'exp_arm')[0]
-
         if isinstance(ev_data, dict) and ('error' in ev_data.keys()):
-            events = tuple([])
+            self.events = tuple([])
         else:
-            events = ev_data
-            
+            self.events = ev_data
+        self.__dict__.pop('longitudinal_index', None)
+
+    def _load_arms(self):
+        arm_data = self._call_api(self.__basepl('arm'), 'exp_arm')[0]
         if isinstance(arm_data, dict) and ('error' in arm_data.keys()):
-            arm_nums = tuple([])
-            arm_names = tuple([])
+            self.arm_nums = tuple([])
+            self.arm_names = tuple([])
         else:
-            arm_nums = tuple([a['arm_num'] for a in arm_data])
-            arm_names = tuple([a['name'] for a in arm_data])
-        self.events = events
-        self.arm_nums = arm_nums
-        self.arm_names = arm_names
-        self.configured = True
+            self.arm_nums = tuple([a['arm_num'] for a in arm_data])
+            self.arm_names = tuple([a['name'] for a in arm_data])
+        self.__dict__.pop('longitudinal_index', None)
+
+    def _index_events(self):
+        """Build ``longitudinal_index`` from the events and arms; the
+        form-event mapping is exported the first time it's used"""
+        events, arm_nums = self.events, self.arm_nums
+        longitudinal = len(events) > 0 and len(arm_nums) > 0 and \
+            len(self.arm_names) > 0
+        self.longitudinal_index = LongitudinalIndex(
+            events, arm_nums, self.arm_names,
+            fem=self.export_fem if longitudinal else None)
+
+    def _invalidate_structure(self, *names):
+        """Drop ``names`` (e.g. ``events``) and the longitudinal index
+        after arms, events or the form-event mapping changed, so they are
+        exported again when next used"""
+        with self._lock:
+            for name in names + ('longitudinal_index',):
+                self.__dict__.pop(name, None)
+
+    def _index_metadata(self):
+        """Rebuild the attributes derived from ``self.metadata``"""
+        field_names = self.filter_metadata('field_name')
+        field_labels = self.filter_metadata('field_label')
+        forms = tuple(set(c['form_name'] for c in self.metadata))
+        with self._lock:
+            self.field_names = field_names
+            # we'll use the first field as the default id for each row
+            self.def_field = field_names[0]
+            self.field_labels = field_labels
+            self.forms = forms
+            self._choice_map = None
 
     def __md(self):
         """Return the project's metadata structure"""
@@ -176,9 +433,7 @@ class Project(object):
         boolean :
             longitudinal status of this project
         """
-        return len(self.events) > 0 and \
-            len(self.arm_nums) > 0 and \
-            len(self.arm_names) > 0
+        return self.longitudinal_index.longitudinal
 
     def filter_metadata(self, key):
         """
@@ -200,17 +455,50 @@ class Project(object):
             raise KeyError("Key not found in metadata")
         return filtered
 
+    def choice_map(self):
+        """
+        Return the translation tables between raw codes and labels of the
+        project's multiple choice fields. The tables are built from the
+        metadata on first use and reused afterwards.
+
+        Use this to label a raw export instead of exporting the data a
+        second time with ``raw_or_label='label'``
+
+        Returns
+        -------
+        choice_map : :class:`redcap.choices.ChoiceMap`
+        """
+        with self._lock:
+            if self._choice_map is None:
+                self._choice_map = ChoiceMap(self.metadata)
+            return self._choice_map
+
+    def _invalidate(self):
+        """Drop cached exports after this project changed the data"""
+        with self._lock:
+            self._report_cache.clear()
+            self._record_index = None
+
     def _kwargs(self):
         """Private method to build a dict for sending to RCRequest
 
         Other default kwargs to the http library should go here"""
-        return {'verify': self.verify}
+        return {'verify': self.verify, 'timeout': self.timeout}
 
-    def _call_api(self, payload, typpe, **kwargs):
+    def _call_api(self, payload, typpe, raw=False, compress=False,
+                  stream=False, deadline=None, **kwargs):
         request_kwargs = self._kwargs()
         request_kwargs.update(kwargs)
-        rcr = RCRequest(self.url, payload, typpe)
-        return rcr.execute(**request_kwargs)
+        rcr = RCRequest(self.url, payload, typpe, raw=raw, stream=stream)
+        return rcr.execute(transport=self.transport, breaker=self.breaker,
+                           deadline=current_deadline(deadline),
+                           hooks=self.hooks, compress=compress,
+                           profile_memory=self.profile_memory,
+                           multipart=self.multipart, **request_kwargs)
+
+    def _profile(self, phase, typpe):
+        """Measure a phase of an export or import, see ``profile_memory``"""
+        return profile_phase(self.hooks, phase, typpe, self.profile_memory)
 
     def export_project(self, format='json',df_kwargs=None):
         """
@@ -232,7 +520,7 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -241,7 +529,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -250,7 +538,8 @@ class Project(object):
             else:
                 return read_csv(StringIO(response), **df_kwargs)   
 
-    def export_report(self, report_id, format='json', raw_or_label='raw', raw_or_label_headers='raw', export_checkbox_labels=False, df_kwargs=None):
+    @_deadline
+    def export_report(self, report_id, format='json', raw_or_label='raw', raw_or_label_headers='raw', export_checkbox_labels=False, df_kwargs=None, typed=False, cache=False):
         """
         Export the project's report (REDCap >= 6.0.0)
 
@@ -273,6 +562,23 @@ class Project(object):
         df_kwargs : dict
             Passed to pandas.read_csv to control construction of
             returned DataFrame
+        typed : (``False``), ``True``
+            for ``format='df'``, type the columns of known fields from
+            the metadata (see :func:`redcap.metadata.column_types`)
+            instead of letting pandas guess. ``dtype`` or ``parse_dates``
+            in ``df_kwargs`` take precedence.
+        cache : (``False``), ``True``
+            reuse the last export of the same report as long as no
+            records were created or modified since (checked with one
+            small record export). Imports through this project clear the
+            cache. Deleted records aren't detected. The check asks for
+            records modified since the server's ``Date`` of the export in
+            the server's time zone, which is assumed to be this machine's
+            unless ``server_utc_offset`` was given to the project. Up to
+            ``CACHED_REPORTS`` reports are kept.
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the call must end by, or it raises
+            :class:`redcap.deadlines.DeadlineExceeded`
 
         Returns
         -------
@@ -281,30 +587,141 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
-        pl = self.__basepl('report',format=format)
-
+        ret_format = 'csv' if format == 'df' else format
+        pl = self._report_payload(report_id, ret_format, raw_or_label,
+                                  raw_or_label_headers,
+                                  export_checkbox_labels)
+        content = self._cached_report(pl) if cache else None
+        if content is None:
+            content, headers = self._call_api(pl, 'exp_report', raw=True)
+            if cache:
+                key = self._report_key(pl)
+                with self._lock:
+                    self._report_cache.pop(key, None)
+                    self._report_cache[key] = (self._server_time(headers),
+                                               content)
+                    while len(self._report_cache) > CACHED_REPORTS:
+                        self._report_cache.popitem(last=False)
+
+        if format == 'json':
+            return loads(content) if content.strip() else {}
+        response = content.decode('utf-8')
+        if format in ('csv', 'xml'):
+            return response
+        kwargs = {}
+        if typed and response.strip():
+            header = next(csv.reader(StringIO(response)))
+            dtype, dates = column_types(self.metadata, header)
+            kwargs = {'dtype': dtype, 'parse_dates': dates}
+        kwargs.update(df_kwargs or {})
+        with self._profile('dataframe', 'exp_report') as phase:
+            phase.payload_bytes = len(content)
+            return read_csv(StringIO(response), **kwargs)
+
+    def _report_payload(self, report_id, format, raw_or_label,
+                        raw_or_label_headers, export_checkbox_labels):
+        pl = self.__basepl('report', format=format)
         to_add = (report_id, raw_or_label, raw_or_label_headers, export_checkbox_labels)
-        str_add = ('report_id', 'rawOrLabel', 'rawOrLabelHeadHeaders', 'exportCheckboxLabel')
+        str_add = ('report_id', 'rawOrLabel', 'rawOrLabelHeaders', 'exportCheckboxLabel')
         for key, data in zip(str_add, to_add):
             if data:
                 pl[key] = data
+        return pl
+
+    def _report_key(self, pl):
+        return tuple(sorted((k, str(v)) for k, v in pl.items()))
+
+    def _server_time(self, headers):
+        """Local time of the server when it sent a response, from the
+        response's ``Date`` (so the clock of this machine doesn't matter)
+        and ``server_utc_offset``"""
+        date = parsedate_tz(headers.get('Date') or '') if headers else None
+        stamp = mktime_tz(date) if date else time.time()
+        if self.server_utc_offset is None:
+            return datetime.fromtimestamp(stamp)
+        return datetime(1970, 1, 1) + timedelta(seconds=stamp) + \
+            self.server_utc_offset
+
+    def _cached_report(self, pl):
+        """Return the cached content of a report export if no records
+        changed since, else ``None``"""
+        key = self._report_key(pl)
+        with self._lock:
+            cached = self._report_cache.get(key)
+            if cached is not None:
+                # most recently used
+                del self._report_cache[key]
+                self._report_cache[key] = cached
+        if cached is None:
+            return None
+        exported_at, content = cached
+        changed = self.export_records(
+            fields=[self.def_field],
+            date_range_begin=exported_at - CACHE_MARGIN)
+        if changed:
+            return None
+        return content
+
+    @_deadline
+    def iter_report(self, report_id, raw_or_label='raw', raw_or_label_headers='raw', export_checkbox_labels=False):
+        """
+        Iterate over the rows of a report while it downloads
 
-        response, _ = self._call_api(pl, 'exp_report')        
+        The report is exported as csv and parsed as it arrives, so only
+        one row at a time is held in memory.
 
-        if format in ('json', 'csv', 'xml'):
-            return response
-        elif not read_csv and format == 'df':
-            warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
-            return response
-        elif format == 'df':
-            if not df_kwargs:
-                return read_csv(StringIO(response))
-            else:
-                return read_csv(StringIO(response), **df_kwargs)  
+        Parameters
+        ----------
+        report_id, raw_or_label, raw_or_label_headers, export_checkbox_labels :
+            see :meth:`export_report`
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the whole iteration must end by. Once it has passed,
+            iterating raises :class:`redcap.deadlines.DeadlineExceeded`
+            (``partial`` is the number of rows yielded).
+
+        Yields
+        ------
+        row : dict
+            column -> value, all values as strings
+        """
+        pl = self._report_payload(report_id, 'csv', raw_or_label,
+                                  raw_or_label_headers,
+                                  export_checkbox_labels)
+        return self._iter_csv(pl, 'exp_report', current_deadline())
+
+    def _iter_csv(self, pl, typpe, deadline=None):
+        """Stream a csv export, yielding its rows as they are parsed and
+        checking ``deadline`` between them"""
+        response = self._call_api(pl, typpe, stream=True,
+                                  deadline=deadline)[0]
+        rows = 0
+        try:
+            # let urllib3 undo any gzip/deflate content encoding, and keep
+            # it from closing the stream before the wrapper sees the end
+            response.raw.decode_content = True
+            response.raw.auto_close = False
+            text = io.TextIOWrapper(response.raw, encoding='utf-8-sig',
+                                    newline='')
+            for row in csv.DictReader(text):
+                if deadline is not None:
+                    deadline.check('%s stream' % typpe, rows)
+                yield row
+                rows += 1
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            # reads time out at the deadline
+            if deadline is not None and deadline.remaining() < 0.05:
+                raise DeadlineExceeded('%s stream ran past its deadline of '
+                                       '%gs' % (typpe, deadline.seconds),
+                                       rows)
+            raise
+        finally:
+            response.close()
 
     def export_instruments(self, format='json', df_kwargs=None):
         """
@@ -326,7 +743,7 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -335,7 +752,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -344,6 +761,7 @@ class Project(object):
             else:
                 return read_csv(StringIO(response), **df_kwargs)   
 
+    @_deadline
     def export_pdf(self, format='json', record=None, event=None, instrument=None, all_records=None, df_kwargs=None):
         """
         Export the project's instrument data as pdf (REDCap >= 6.4.0)
@@ -366,6 +784,9 @@ class Project(object):
         df_kwargs : dict
             Passed to pandas.read_csv to control construction of
             returned DataFrame
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the call must end by, or it raises
+            :class:`redcap.deadlines.DeadlineExceeded`
 
         Returns
         -------
@@ -376,7 +797,7 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -428,7 +849,7 @@ class Project(object):
 
         # Check for dataframe usage
 
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -451,7 +872,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -484,7 +905,7 @@ class Project(object):
 
         # Check for dataframe usage
 
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -496,7 +917,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -532,7 +953,7 @@ class Project(object):
 
         # Check for dataframe usage
 
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -555,7 +976,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -588,7 +1009,7 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -611,7 +1032,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -640,7 +1061,7 @@ class Project(object):
         """
         
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -651,7 +1072,7 @@ class Project(object):
 
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -682,7 +1103,7 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -695,7 +1116,7 @@ class Project(object):
         response, _ = self._call_api(pl, 'exp_fem')
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -729,7 +1150,7 @@ class Project(object):
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
@@ -742,7 +1163,7 @@ class Project(object):
         response, _ = self._call_api(pl, 'metadata')
         if format in ('json', 'csv', 'xml'):
             return response
-        elif not read_csv and format == 'df':
+        elif format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             return response
         elif format == 'df':
@@ -751,7 +1172,8 @@ class Project(object):
             print(response)
             return read_csv(StringIO(response), **df_kwargs)
 
-    def export_records(self, records=None, fields=None, forms=None, events=None, raw_or_label='raw', event_name='label', format='json', export_survey_fields=False, export_data_access_groups=False, df_kwargs=None, export_checkbox_labels=False):
+    @_deadline
+    def export_records(self, records=None, fields=None, forms=None, events=None, raw_or_label='raw', event_name='label', format='json', export_survey_fields=False, export_data_access_groups=False, df_kwargs=None, export_checkbox_labels=False, split_by=None, workers=1, batch_size=None, decode_workers=None, date_range_begin=None, date_range_end=None, sink=None):
         """
         Export data from the REDCap project.
 
@@ -801,27 +1223,69 @@ class Project(object):
         export_checkbox_labels : (``False``), ``True``
             specify whether to export checkbox values as their label on
             export.
+        split_by : (``None``), ``'form'``
+            ``'form'`` exports each form with its own request, which is
+            much cheaper for REDCap than exporting all fields at once, and
+            joins the results on ``def_field`` (and
+            ``redcap_event_name``). In longitudinal projects, each form is
+            only requested for the events it is mapped to. Not available
+            for ``format='xml'``.
+        workers : int
+            number of requests to run in parallel when ``split_by`` or
+            ``batch_size`` is given
+        batch_size : int
+            export ``batch_size`` records per request and concatenate the
+            results. All record ids are exported first unless ``records``
+            is given. Not available for ``format='xml'``.
+        decode_workers : int
+            with ``batch_size`` and ``format='df'``, parse the csv of each
+            batch in a pool of this many processes while the next batches
+            are downloaded. By default, batches are parsed in the threads
+            that download them.
+        date_range_begin, date_range_end : ``datetime.datetime``, str
+            only export records created or modified after/before this
+            time (``'YYYY-MM-DD HH:MM:SS'`` in the server's time zone)
+        sink : :class:`redcap.sinks.JSONLinesSink`, optional
+            write each record to ``sink`` (anything with a ``write(row)``
+            method) as the response is parsed instead of returning them,
+            so memory use doesn't grow with the export. The records are
+            exported as csv and streamed; with ``batch_size``, the batches
+            are streamed one after the other. Only for ``format='json'``,
+            without ``split_by``.
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the export must end by. Batches and forms not exported
+            by then are cancelled, and
+            :class:`redcap.deadlines.DeadlineExceeded` is raised with the
+            records exported so far as ``partial`` and a ``cursor`` to
+            resume from: the record ids of the unfinished batches (pass
+            them as ``records``), the forms left with ``split_by``, or,
+            for a ``sink``, the record ids from the interrupted batch on
+            (its rows written so far are written again on resume).
 
         Returns
         -------
         data : list, str, ``pandas.DataFrame``
-            exported data
+            exported data, or the number of records written to ``sink``
         """
 
         # Check for dataframe usage
-        if not read_csv and format == 'df':
+        if format == 'df' and not read_csv:
             warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
             format = 'csv'
 
-        pl = self.__basepl('record', format=format)
+        # DataFrames are built from a csv export
+        ret_format = 'csv' if format == 'df' else format
+        pl = self.__basepl('record', format=ret_format)
 
-        fields = self.backfill_fields(fields, forms)
+        requested_fields, requested_forms = fields, forms
+        fields, forms = self._shortest_request(fields, forms)
         keys_to_add = (records, fields, forms, events,
         raw_or_label, event_name, export_survey_fields,
-        export_data_access_groups, export_checkbox_labels)
+        export_data_access_groups, export_checkbox_labels,
+        _api_datetime(date_range_begin), _api_datetime(date_range_end))
         str_keys = ('records', 'fields', 'forms', 'events', 'rawOrLabel',
         'eventName', 'exportSurveyFields', 'exportDataAccessGroups',
-        'exportCheckboxLabel')
+        'exportCheckboxLabel', 'dateRangeBegin', 'dateRangeEnd')
         for key, data in zip(str_keys, keys_to_add):
             if data:
                 #  Make a url-ok string
@@ -829,23 +1293,390 @@ class Project(object):
                     pl[key] = ','.join(data)
                 else:
                     pl[key] = data
-        response, _ = self._call_api(pl, 'exp_record')
-        if format in ('json', 'csv', 'xml'):
-            return response
-        elif not read_csv and format == 'df':
-            warnings.warn('Pandas csv_reader not available, dataframe replaced with csv format')
-            return response
-        elif format == 'df':
+        if split_by is not None and batch_size:
+            raise ValueError("split_by and batch_size can't be combined")
+        if sink is not None:
+            if format != 'json' or split_by is not None:
+                raise ValueError("sink needs format='json' and no split_by")
+            return self._export_to_sink(pl, records, batch_size, sink)
+        if batch_size:
+            return self._export_batched(pl, records, format, df_kwargs,
+                                        batch_size, workers, decode_workers)
+        if split_by == 'form':
+            return self._export_by_form(pl, requested_fields,
+                                        requested_forms, events, format,
+                                        df_kwargs, workers)
+        elif split_by is not None:
+            raise ValueError("split_by must be None or 'form'")
+        if format == 'df':
+            # parse the response bytes: decoding them to text first and
+            # wrapping that in a StringIO kept two more copies alive
+            raw = self._call_api(pl, 'exp_record', raw=True)[0]
             if not df_kwargs:
-                if self.is_longitudinal():
-                    df_kwargs = {'index_col': [self.def_field,
-                                               'redcap_event_name']}
+                df_kwargs = self._default_df_kwargs()
+            with self._profile('dataframe', 'exp_record') as phase:
+                phase.payload_bytes = len(raw)
+                return read_csv(BytesIO(raw), **df_kwargs)
+        response, _ = self._call_api(pl, 'exp_record')
+        return response
+
+    @_deadline
+    def export_changes(self, index_path, fields=None, forms=None,
+                       events=None, batch_size=None, workers=1, save=True):
+        """
+        Export records and report which changed since the last call
+
+        Every record is hashed and compared with the hashes stored in
+        ``index_path`` by the previous call, which works on servers
+        without date range filtering. The first call reports all records
+        as new.
+
+        Parameters
+        ----------
+        index_path : str
+            file holding the hashes (a :class:`redcap.changes.HashIndex`)
+        fields, forms, events : list, optional
+            passed to :meth:`export_records`. Use the same ones for each
+            call with the same ``index_path``.
+        batch_size, workers : optional
+            passed to :meth:`export_records`
+        save : (``True``), ``False``
+            store the new hashes in ``index_path``. Pass ``False`` to
+            save them yourself once the changes are handled, by calling
+            ``HashIndex.save`` on ``changes.index``.
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the call must end by, or it raises
+            :class:`redcap.deadlines.DeadlineExceeded`
+
+        Returns
+        -------
+        changes : :class:`redcap.changes.ChangeSet`
+            new, changed and deleted record ids and the rows of the new
+            and changed records. ``changes.index`` is the new index.
+        """
+        # as it reads back from the index file
+        scope = dict((k, list(v) if v else None) for k, v in
+                     (('fields', fields), ('forms', forms),
+                      ('events', events)))
+        old = HashIndex(scope=scope)
+        if os.path.exists(index_path):
+            old = HashIndex.load(index_path)
+            if old.scope != scope:
+                raise ValueError('%s holds hashes of a different export: %s'
+                                 % (index_path, old.scope))
+        rows = self.export_records(fields=fields, forms=forms, events=events,
+                                   batch_size=batch_size, workers=workers)
+        index = HashIndex(record_digests(rows, self.def_field), scope)
+        changes = old.diff(index, rows, self.def_field)
+        if save:
+            index.save(index_path)
+        return changes
+
+    def _default_df_kwargs(self):
+        if self.is_longitudinal():
+            return {'index_col': [self.def_field, 'redcap_event_name']}
+        return {'index_col': self.def_field}
+
+    def record_ids(self, refresh=False):
+        """
+        Return the project's record ids (and their events) without
+        exporting any data
+
+        Only ``def_field`` (and the event name) is exported, as csv. The
+        index is cached; imports and deletions through this project clear
+        the cache, changes by others need ``refresh=True``.
+
+        Parameters
+        ----------
+        refresh : (``False``), ``True``
+            export the ids even if they are cached
+
+        Returns
+        -------
+        index : :class:`redcap.records.RecordIndex`
+            sorted ids, events per record
+        """
+        with self._lock:
+            index = None if refresh else self._record_index
+        if index is None:
+            pl = self.__basepl('record', format='csv')
+            pl['fields'] = self.def_field
+            pl['eventName'] = 'unique'
+            text = self._call_api(pl, 'exp_record', raw=True)[0]
+            index = RecordIndex.from_csv(text.decode('utf-8'),
+                                         self.def_field)
+            with self._lock:
+                self._record_index = index
+        return index
+
+    def _export_batched(self, pl, records, format, df_kwargs, batch_size,
+                        workers, decode_workers):
+        """Export records in batches and concatenate the results"""
+        if format == 'xml':
+            raise ValueError("batch_size can't be used with xml exports")
+        if not records:
+            records = list(self.record_ids(refresh=True))
+        batches = [records[i:i + batch_size]
+                   for i in range(0, len(records), batch_size)]
+        df_kwargs = df_kwargs or self._default_df_kwargs()
+        decoder = None
+        if format == 'df' and decode_workers:
+            decoder = ProcessPoolExecutor(max_workers=decode_workers)
+
+        def fetch(batch):
+            part = dict(pl, records=','.join(batch))
+            if format != 'df':
+                return self._call_api(part, 'exp_record')[0]
+            part['format'] = 'csv'
+            raw = self._call_api(part, 'exp_record', raw=True)[0]
+            if decoder is not None:
+                # decoding overlaps with downloading the next batches
+                return decoder.submit(_read_csv_bytes, raw, df_kwargs)
+            with self._profile('dataframe', 'exp_record') as phase:
+                phase.payload_bytes = len(raw)
+                return _read_csv_bytes(raw, df_kwargs)
+
+        try:
+            parts, left = self._fetch_parts(fetch, batches, workers)
+            if decoder is not None:
+                parts = [f.result() for f in parts]
+        finally:
+            if decoder is not None:
+                decoder.shutdown()
+        result = self._concat_batches(parts, format, df_kwargs)
+        if left:
+            left = [record for batch in left for record in batch]
+            raise DeadlineExceeded('export ran past its deadline with %d '
+                                   'records left' % len(left), result, left)
+        return result
+
+    def _concat_batches(self, parts, format, df_kwargs):
+        """Concatenate the exports of record batches"""
+        if format == 'json':
+            return [row for part in parts for row in part]
+        elif format == 'csv':
+            parts = [p for p in parts if p.strip()]
+            if not parts:
+                return ''
+            bodies = [p.split('\n', 1)[1] if '\n' in p else ''
+                      for p in parts[1:]]
+            return ''.join([parts[0]] + bodies)
+        frames = [p for p in parts if p is not None]
+        if not frames:
+            return read_csv(StringIO(self.def_field + '\n'), **df_kwargs)
+        return concat(frames)
+
+    def _fetch_parts(self, fetch, parts, workers):
+        """
+        Call ``fetch`` on each of ``parts`` in a pool of ``workers``
+        threads, under the current deadline
+
+        Parts not started by the deadline are cancelled; the requests of
+        those in flight time out at the deadline.
+
+        Returns
+        -------
+        results : list
+            results of the finished parts, in order
+        left : list
+            the parts cancelled or cut off by the deadline
+        """
+        deadline = current_deadline()
+
+        def run(part):
+            with deadline_scope(deadline):
+                return fetch(part)
+
+        pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            futures = [pool.submit(run, part) for part in parts]
+            wait(futures, timeout=deadline.remaining() if deadline else None)
+            for future in futures:
+                future.cancel()
+        finally:
+            pool.shutdown()
+        results, left = [], []
+        for part, future in zip(parts, futures):
+            if future.cancelled() or \
+                    isinstance(future.exception(), DeadlineExceeded):
+                left.append(part)
+            else:
+                # re-raises the first failure
+                results.append(future.result())
+        return results, left
+
+    def _export_to_sink(self, pl, records, batch_size, sink):
+        """Stream records as csv into ``sink``, return the rows written"""
+        pl = dict(pl, format='csv')
+        if batch_size:
+            if not records:
+                records = list(self.record_ids(refresh=True))
+            batches = [records[i:i + batch_size]
+                       for i in range(0, len(records), batch_size)]
+            parts = [dict(pl, records=','.join(batch)) for batch in batches]
+        else:
+            batches, parts = [None], [pl]
+        deadline = current_deadline()
+        written = 0
+        for i, part in enumerate(parts):
+            try:
+                for row in self._iter_csv(part, 'exp_record', deadline):
+                    sink.write(row)
+                    written += 1
+            except DeadlineExceeded as e:
+                left = None
+                if batch_size:
+                    left = [r for batch in batches[i:] for r in batch]
+                raise DeadlineExceeded(str(e), written, left)
+        return written
+
+    def _form_plan(self, fields, forms, events):
+        """
+        Plan one request per form for :meth:`export_records`
+
+        Returns
+        -------
+        plan : list
+            ``(fields, form, events)`` tuples, where ``fields`` are the
+            requested fields of that form (``None`` for the whole form)
+            and ``events`` the unique events the form is mapped to (``None``
+            for classic projects)
+        """
+        form_fields = OrderedDict()
+        for field in self.metadata:
+            form_fields.setdefault(field['form_name'], []).append(
+                field['field_name'])
+        wanted = set(fields or [])
+        selected = [f for f in form_fields
+                    if (forms and f in forms) or wanted & set(form_fields[f])
+                    or not (forms or fields)]
+        index = self.longitudinal_index
+        plan = []
+        for form in selected:
+            sub_fields = None
+            if not (forms and form in forms) and wanted:
+                sub_fields = [f for f in form_fields[form] if f in wanted]
+            form_evs = None
+            if index.longitudinal:
+                form_evs = index.events_of(form, events)
+                if not form_evs:
+                    continue
+            plan.append((sub_fields, form, form_evs))
+        return plan
+
+    def _export_by_form(self, pl, fields, forms, events, format, df_kwargs,
+                        workers):
+        """Export each form separately and join the results"""
+        if format == 'xml':
+            raise ValueError("split_by='form' can't join xml exports")
+        part_format = 'csv' if format == 'df' else 'json'
+        payloads = []
+        for sub_fields, form, form_evs in self._form_plan(fields, forms,
+                                                          events):
+            part = dict(pl, format=part_format)
+            part.pop('forms', None)
+            if sub_fields is not None:
+                part['fields'] = ','.join([self.def_field] + [
+                    f for f in sub_fields if f != self.def_field])
+            else:
+                part['fields'] = self.def_field
+                part['forms'] = form
+            if form_evs:
+                part['events'] = ','.join(form_evs)
+            payloads.append((form, part))
+
+        index_col = None
+        if format == 'df':
+            part_kwargs = dict(df_kwargs or {})
+            index_col = part_kwargs.pop('index_col', None)
+
+            def fetch(item):
+                response = self._call_api(item[1], 'exp_record')[0]
+                if not response.strip():
+                    return None
+                return read_csv(StringIO(response), **part_kwargs)
+        else:
+            def fetch(item):
+                return self._call_api(item[1], 'exp_record')[0]
+
+        parts, left = self._fetch_parts(fetch, payloads, workers)
+        result = self._join_parts(parts, format, index_col)
+        if left:
+            forms = [form for form, _ in left]
+            raise DeadlineExceeded('export ran past its deadline with %d '
+                                   'forms left' % len(forms), result, forms)
+        return result
+
+    def _join_parts(self, parts, format, index_col=None):
+        """Join the exports of forms into rows, csv or a DataFrame"""
+        if format == 'df':
+            return self._join_frames([p for p in parts if p is not None],
+                                     index_col)
+        rows = self._join_records(parts)
+        if format == 'json':
+            return rows
+        buf = StringIO()
+        columns = list(rows[0]) if rows else [self.def_field]
+        writer = csv.DictWriter(buf, fieldnames=columns,
+                                lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+        return buf.getvalue()
+
+    def _join_keys(self, columns):
+        """Columns identifying a row of a (possibly longitudinal) export"""
+        keys = [self.def_field, 'redcap_event_name',
+                'redcap_repeat_instrument', 'redcap_repeat_instance']
+        return [k for k in keys if k in columns]
+
+    def _join_records(self, parts):
+        """
+        Merge per-form lists of records into one list of records. Like a
+        single export, every record gets every column, empty if the form
+        wasn't exported for that record's event.
+        """
+        merged = OrderedDict()
+        columns = OrderedDict()
+        for part in parts:
+            for row in part:
+                key = tuple(row.get(k) for k in self._join_keys(row))
+                if key in merged:
+                    merged[key].update(row)
                 else:
-                    df_kwargs = {'index_col': self.def_field}
-            buf = StringIO(response)
-            df = read_csv(buf, **df_kwargs)
-            buf.close()
-            return df
+                    merged[key] = dict(row)
+                columns.update((c, None) for c in row)
+        return [dict((c, row.get(c, '')) for c in columns)
+                for row in merged.values()]
+
+    def _join_frames(self, frames, index_col):
+        """Join per-form DataFrames on their shared key columns"""
+        if not frames:
+            return read_csv(StringIO(self.def_field + '\n'))
+        keys = self._join_keys(frames[0].columns)
+        frames = [f.set_index(self._join_keys(f.columns)) for f in frames]
+        # columns every form exports (e.g. redcap_data_access_group) are
+        # joined once and filled in from the other forms, like the rows
+        # merged by _join_records
+        seen = set(frames[0].columns)
+        others, shared = [], []
+        for frame in frames[1:]:
+            common = [c for c in frame.columns if c in seen]
+            if common:
+                shared.append(frame[common])
+                frame = frame.drop(columns=common)
+            seen.update(frame.columns)
+            others.append(frame)
+        df = frames[0].join(others, how='outer') if others else frames[0]
+        for frame in shared:
+            columns = list(frame.columns)
+            df[columns] = df[columns].combine_first(frame)
+        if index_col is None:
+            index_col = self._default_df_kwargs()['index_col']
+        if not isinstance(index_col, (list, tuple)):
+            index_col = [index_col]
+        if list(index_col) != keys:
+            df = df.reset_index().set_index(list(index_col))
+        return df
 
     def import_arms(self, to_import, override=0, action="import", format='json', return_format='json',df_kwargs=None):
         """
@@ -894,7 +1725,7 @@ class Project(object):
             buf.close()
             format = 'csv'
         elif format == 'json':
-            pl['data'] = json.dumps(to_import, separators=(',', ':'))
+            pl['data'] = dumps(to_import)
         else:
             # don't do anything to csv/xml
             pl['data'] = to_import
@@ -903,6 +1734,8 @@ class Project(object):
         pl['format'] = format
         pl['returnFormat'] = return_format
         response = self._call_api(pl, 'imp_arm')[0]
+        self._invalidate()
+        self._invalidate_structure('events', 'arm_nums', 'arm_names')
 
         if format in ('json', 'csv', 'xml'):
             return response
@@ -974,7 +1807,7 @@ class Project(object):
             buf.close()
             format = 'csv'
         elif format == 'json':
-            pl['data'] = json.dumps(to_import, separators=(',', ':'))
+            pl['data'] = dumps(to_import)
         else:
             # don't do anything to csv/xml
             pl['data'] = to_import
@@ -983,6 +1816,8 @@ class Project(object):
         pl['format'] = format
         pl['returnFormat'] = return_format
         response = self._call_api(pl, 'imp_event')[0]
+        self._invalidate()
+        self._invalidate_structure('events')
 
         if format in ('json', 'csv', 'xml'):
             return response
@@ -1047,13 +1882,15 @@ class Project(object):
             buf.close()
             format = 'csv'
         elif format == 'json':
-            pl['data'] = json.dumps(to_import, separators=(',', ':'))
+            pl['data'] = dumps(to_import)
         else:
             # don't do anything to csv/xml
             pl['data'] = to_import
         pl['format'] = format
         pl['returnFormat'] = return_format
         response = self._call_api(pl, 'imp_fem')[0]
+        self._invalidate()
+        self._invalidate_structure()
 
         if format in ('json', 'csv', 'xml'):
             return response
@@ -1068,7 +1905,7 @@ class Project(object):
             buf.close()
             return df
 
-    def import_metadata(self, to_import, format='json', return_format='json',df_kwargs=None):
+    def import_metadata(self, to_import, format='json', return_format='json',df_kwargs=None, compress=False):
         """
         Import metadata into the RedCap Project
 
@@ -1085,6 +1922,9 @@ class Project(object):
             Format of incoming data. By default, to_import will be json-encoded
         return_format : ('json'), 'csv', 'xml'
             Response format. By default, response will be json-decoded.
+        compress : (``False``), ``True``
+            gzip the request body. Only use this if your REDCap server
+            decompresses request bodies.
 
         Returns
         -------
@@ -1111,13 +1951,14 @@ class Project(object):
             buf.close()
             format = 'csv'
         elif format == 'json':
-            pl['data'] = json.dumps(to_import, separators=(',', ':'))
+            pl['data'] = dumps(to_import)
         else:
             # don't do anything to csv/xml
             pl['data'] = to_import
         pl['format'] = format
         pl['returnFormat'] = return_format
-        response = self._call_api(pl, 'imp_metadata')[0]
+        response = self._call_api(pl, 'imp_metadata', compress=compress)[0]
+        self._invalidate()
 
         if format in ('json', 'csv', 'xml'):
             return response
@@ -1132,6 +1973,56 @@ class Project(object):
             buf.close()
             return df
 
+    def diff_metadata(self, metadata):
+        """
+        Compare data dictionary rows against the project's metadata
+
+        Parameters
+        ----------
+        metadata : list
+            metadata rows (dicts) as exported by :meth:`export_metadata`
+
+        Returns
+        -------
+        diff : :class:`redcap.metadata.MetadataDiff`
+            added, removed and changed fields
+        """
+        return MetadataDiff(self.metadata, metadata)
+
+    def push_metadata(self, metadata, force=False):
+        """
+        Import a data dictionary only if it differs from the project's
+
+        The API can only replace the whole dictionary, so any change
+        imports every row; an unchanged dictionary isn't sent at all.
+        Afterwards the project's metadata and the attributes derived from
+        it are updated without re-exporting them.
+
+        To push the same dictionary to many projects concurrently, use
+        ``ProjectPool.map('push_metadata', metadata)``.
+
+        Parameters
+        ----------
+        metadata : list
+            metadata rows (dicts) as exported by :meth:`export_metadata`
+        force : (``False``), ``True``
+            import even if nothing changed
+
+        Returns
+        -------
+        diff : :class:`redcap.metadata.MetadataDiff`
+            the differences that were imported
+        """
+        diff = self.diff_metadata(metadata)
+        if not (diff or force):
+            return diff
+        response = self.import_metadata(diff.new)
+        if isinstance(response, dict) and 'error' in response:
+            raise RedcapError(response['error'])
+        self.metadata = diff.new
+        self._index_metadata()
+        return diff
+
     def import_users(self, to_import, format='json', return_format='json',df_kwargs=None):
         """
         Import metadata into the RedCap Project
@@ -1175,7 +2066,7 @@ class Project(object):
             buf.close()
             format = 'csv'
         elif format == 'json':
-            pl['data'] = json.dumps(to_import, separators=(',', ':'))
+            pl['data'] = dumps(to_import)
         else:
             # don't do anything to csv/xml
             pl['data'] = to_import
@@ -1218,7 +2109,10 @@ class Project(object):
         pl = self.__basepl(content='arm', format='json')
         pl['action'] = action
         pl['arms'] = arms
-        return self._call_api(pl, 'del_arm')[0]
+        response = self._call_api(pl, 'del_arm')[0]
+        self._invalidate()
+        self._invalidate_structure('events', 'arm_nums', 'arm_names')
+        return response
 
     def delete_event(self, events, action='delete'):
         """
@@ -1242,7 +2136,10 @@ class Project(object):
         pl = self.__basepl(content='event', format='json')
         pl['action'] = action
         pl['events'] = events
-        return self._call_api(pl, 'del_event')[0]
+        response = self._call_api(pl, 'del_event')[0]
+        self._invalidate()
+        self._invalidate_structure('events')
+        return response
 
     def metadata_type(self, field_name):
         """If the given field_name is validated by REDCap, return it's type"""
@@ -1274,7 +2171,7 @@ class Project(object):
             forms: list
                 requested forms
         Returns:
-            new fields, forms
+            new fields
         """
         if forms and not fields:
             new_fields = [self.def_field]
@@ -1288,6 +2185,40 @@ class Project(object):
             new_fields = list(fields)
         return new_fields
 
+    def _shortest_request(self, fields, forms):
+        """
+        Return the shortest ``(fields, forms)`` of a record export
+        equivalent to the ones passed in: duplicates are dropped, fields
+        that make up a whole form (including its ``_complete`` field) are
+        requested through that form, ``def_field`` is added unless its
+        form is requested, and nothing is requested at all when every
+        form is wanted.
+        """
+        fields = _unique(fields or [])
+        forms = _unique(forms or [])
+        if not (fields or forms):
+            return None, None
+        form_fields = OrderedDict()
+        for field in self.metadata:
+            form_fields.setdefault(field['form_name'], []).append(
+                field['field_name'])
+        requested = set(fields)
+        for form, members in form_fields.items():
+            if form in forms:
+                continue
+            if requested.issuperset(members + [form + '_complete']):
+                forms.append(form)
+        in_forms = set()
+        for form in forms:
+            in_forms.update(form_fields.get(form, []))
+            in_forms.add(form + '_complete')
+        fields = [f for f in fields if f not in in_forms]
+        if set(forms) == set(form_fields) and not fields:
+            return None, None
+        if self.def_field not in in_forms and self.def_field not in fields:
+            fields.append(self.def_field)
+        return fields or None, forms or None
+
     def filter(self, query, output_fields=None):
         """Query the database and return subject information for those
         who match the query logic
@@ -1333,9 +2264,10 @@ class Project(object):
                 print('%s --> %s' % (str(name), str(label)))
         return self.field_names, self.field_labels
 
+    @_deadline
     def import_records(self, to_import, overwrite='normal', format='json',
         return_format='json', return_content='count',
-            date_format='YMD'):
+            date_format='YMD', compress=False):
         """
         Import data into the RedCap Project
 
@@ -1345,6 +2277,12 @@ class Project(object):
             :note:
                 If you pass a csv or xml string, you should use the
                 ``format`` parameter appropriately.
+            :note:
+                DataFrames are written as csv in chunks of
+                ``IMPORT_CHUNK_ROWS`` rows, which are written into a
+                temporary file (in memory up to
+                ``redcap.request.SPOOL_SIZE`` bytes) and streamed, so
+                large frames don't need several copies in memory.
             :note:
                 Keys of the dictionaries should be subset of project's,
                 fields, but this isn't a requirement. If you provide keys
@@ -1368,6 +2306,12 @@ class Project(object):
             strings are formatted as 'MM/DD/YYYY' set this parameter as
             'MDY' and if formatted as 'DD/MM/YYYY' set as 'DMY'. No
             other formattings are allowed.
+        compress : (``False``), ``True``
+            gzip the request body. Only use this if your REDCap server
+            decompresses request bodies.
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the call must end by, or it raises
+            :class:`redcap.deadlines.DeadlineExceeded`
 
         Returns
         -------
@@ -1375,33 +2319,45 @@ class Project(object):
             response from REDCap API, json-decoded if ``return_format`` == ``'json'``
         """
         pl = self.__basepl('record')
-        if hasattr(to_import, 'to_csv'):
+        frame = hasattr(to_import, 'to_csv')
+        if frame:
             # We'll assume it's a df
-            buf = StringIO()
             if self.is_longitudinal():
                 csv_kwargs = {'index_label': [self.def_field,
                                               'redcap_event_name']}
             else:
                 csv_kwargs = {'index_label': self.def_field}
-            to_import.to_csv(buf, **csv_kwargs)
-            pl['data'] = buf.getvalue()
-            buf.close()
-            format = 'csv'
-        elif format == 'json':
-            pl['data'] = json.dumps(to_import, separators=(',', ':'))
-        else:
-            # don't do anything to csv/xml
-            pl['data'] = to_import
-        pl['overwriteBehavior'] = overwrite
-        pl['format'] = format
-        pl['returnFormat'] = return_format
-        pl['returnContent'] = return_content
-        pl['dateFormat'] = date_format
-        response = self._call_api(pl, 'imp_record')[0]
+        body = None
+        with self._profile('serialize', 'imp_record') as phase:
+            if frame:
+                # written and encoded a chunk of rows at a time, never as
+                # one string
+                pl['data'] = ChunkedData(_frame_csv(to_import, csv_kwargs))
+                format = 'csv'
+            elif format == 'json':
+                pl['data'] = dumps(to_import)
+            else:
+                # don't do anything to csv/xml
+                pl['data'] = to_import
+            pl['overwriteBehavior'] = overwrite
+            pl['format'] = format
+            pl['returnFormat'] = return_format
+            pl['returnContent'] = return_content
+            pl['dateFormat'] = date_format
+            if frame:
+                body = spool_multipart(pl, compress=compress) \
+                    if self.multipart else spool_form(pl, compress)
+                phase.payload_bytes = len(body)
+            else:
+                phase.payload_bytes = len(pl['data'])
+        response = self._call_api(pl, 'imp_record', compress=compress,
+                                  body=body)[0]
+        self._invalidate()
         if 'error' in response:
             raise RedcapError(str(response))
         return response
 
+    @_deadline
     def export_file(self, record, field, event=None, return_format='json'):
         """
         Export the contents of a file stored for a particular record
@@ -1420,6 +2376,9 @@ class Project(object):
             for longitudinal projects, specify the unique event here
         return_format: ('json'), 'csv', 'xml'
             format of error message
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the call must end by, or it raises
+            :class:`redcap.deadlines.DeadlineExceeded`
 
         Returns
         -------
@@ -1450,6 +2409,7 @@ class Project(object):
             content_map = {}
         return content, content_map
 
+    @_deadline
     def import_file(self, record, field, fname, fobj, event=None,
             return_format='json'):
         """
@@ -1470,6 +2430,9 @@ class Project(object):
             for longitudinal projects, specify the unique event here
         return_format : ('json'), 'csv', 'xml'
             format of error message
+        deadline : float, :class:`redcap.deadlines.Deadline`, optional
+            time the call must end by, or it raises
+            :class:`redcap.deadlines.DeadlineExceeded`
 
         Returns
         -------
@@ -1488,7 +2451,9 @@ class Project(object):
         if event:
             pl['event'] = event
         file_kwargs = {'files': {'file': (fname, fobj)}}
-        return self._call_api(pl, 'imp_file', **file_kwargs)[0]
+        response = self._call_api(pl, 'imp_file', **file_kwargs)[0]
+        self._invalidate()
+        return response
 
     def delete_file(self, record, field, return_format='json', event=None):
         """
@@ -1524,7 +2489,9 @@ class Project(object):
         pl['field'] = field
         if event:
             pl['event'] = event
-        return self._call_api(pl, 'del_file')[0]
+        response = self._call_api(pl, 'del_file')[0]
+        self._invalidate()
+        return response
 
     def _check_file_field(self, field):
         """Check that field exists and is a file field"""
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Record ids of a project
+
+:class:`RecordIndex` holds the ids of a project's records, and in
+longitudinal projects the events each record has data in, without any of
+the records' data. Use :meth:`redcap.Project.record_ids` to get one.
+
+"""
+
+import csv
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def record_sort_key(record):
+    """Sort numeric record ids numerically, before any other ids"""
+    if record.isdigit():
+        return (0, int(record), record)
+    return (1, 0, record)
+
+
+class RecordIndex(object):
+    """
+    Sorted record ids with their events
+
+    Supports ``len``, iteration over the ids in order and ``in`` checks.
+    """
+
+    def __init__(self, pairs):
+        """
+        Parameters
+        ----------
+        pairs : iterable
+            ``(record, event)`` tuples; ``event`` is ``None`` in classic
+            projects. Duplicates (e.g. repeated instances) are ignored.
+        """
+        events = {}
+        for record, event in pairs:
+            record_events = events.setdefault(record, [])
+            if event is not None and event not in record_events:
+                record_events.append(event)
+        self.ids = tuple(sorted(events, key=record_sort_key))
+        self.events = dict((r, tuple(e)) for r, e in events.items())
+        self._ids = frozenset(self.ids)
+
+    @classmethod
+    def from_csv(cls, text, def_field):
+        """Build the index from a csv export of ``def_field`` (and
+        ``redcap_event_name``)"""
+        rows = csv.reader(StringIO(text))
+        header = next(rows, None)
+        if not header:
+            return cls([])
+        id_col = header.index(def_field)
+        ev_col = header.index('redcap_event_name') \
+            if 'redcap_event_name' in header else None
+        return cls((row[id_col], row[ev_col] if ev_col is not None
+                    else None) for row in rows if row)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, record):
+        return record in self._ids
+
+    def __repr__(self):
+        return '<RecordIndex of %d records>' % len(self.ids)
+
+    def pairs(self):
+        """Return the ``(record, event)`` pairs with data, in order. Empty
+        for classic projects."""
+        return [(r, e) for r in self.ids for e in self.events[r]]
+
+    def records_in(self, event):
+        """Return the ids of the records with data in ``event``"""
+        return [r for r in self.ids if event in self.events[r]]
+
+    def batches(self, size):
+        """Return the ids in consecutive lists of at most ``size``"""
+        return [list(self.ids[i:i + size])
+                for i in range(0, len(self.ids), size)]
+
+    def diff(self, other):
+        """
+        Compare with the index of another project or another time
+
+        Returns
+        -------
+        added : list
+            ids in ``other`` but not in this index
+        removed : list
+            ids in this index but not in ``other``
+        """
+        other_ids = set(other)
+        return ([r for r in other if r not in self._ids],
+                [r for r in self.ids if r not in other_ids])
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Copying records from one project to another
+
+A :class:`Replicator` exports records from a source :class:`redcap.Project`
+in chunks, transforms each chunk (renaming and dropping fields, shifting
+dates) and imports it into a target project. Imports run concurrently and
+overlap with exporting the next chunks, and finished records are written to
+a checkpoint file so an interrupted copy picks up where it stopped.
+
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .metadata import DATE_VALIDATIONS
+from .request import RedcapError
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class Replicator(object):
+    """Export, transform and import records between two projects"""
+
+    def __init__(self, source, target, batch_size=100, workers=2,
+                 field_map=None, drop=None, date_shift=None, transform=None,
+                 checkpoint=None, overwrite='normal', progress=None):
+        """
+        Parameters
+        ----------
+        source : :class:`redcap.Project`
+            project to export from
+        target : :class:`redcap.Project`
+            project to import into
+        batch_size : int
+            number of records exported and imported per request
+        workers : int
+            number of chunks imported concurrently
+        field_map : dict, optional
+            source field name -> target field name. Checkbox columns
+            (``field___code``) follow their field.
+        drop : list, optional
+            source fields not to copy
+        date_shift : int, callable, optional
+            days added to every date and datetime field, or a callable
+            returning the days for a record id, e.g. to shift each subject
+            by a different, stable offset
+        transform : callable, optional
+            called with each chunk (a list of record dicts) after the
+            other transformations, returns the chunk to import
+        checkpoint : str, optional
+            path of a file recording the records already copied, a line
+            of JSON per imported chunk. An existing checkpoint skips those
+            records; it is removed when the copy finishes.
+        overwrite : ('normal'), 'overwrite'
+            passed to ``target.import_records``
+        progress : callable, optional
+            called as ``progress(done, total)`` with record counts after
+            each imported chunk
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        self.source = source
+        self.target = target
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.field_map = field_map or {}
+        self.drop = set(drop or [])
+        self.date_shift = date_shift
+        self.transform = transform
+        self.checkpoint = checkpoint
+        self.overwrite = overwrite
+        self.progress = progress
+        self._lock = threading.Lock()
+        self._date_fields = None
+
+    @property
+    def date_fields(self):
+        """Source fields validated as dates or datetimes"""
+        if self._date_fields is None:
+            self._date_fields = set(
+                f['field_name'] for f in self.source.metadata
+                if (f.get('text_validation_type_or_show_slider_number') or
+                    '').startswith(DATE_VALIDATIONS))
+        return self._date_fields
+
+    def load_checkpoint(self):
+        """Return the record ids already copied according to the
+        checkpoint file"""
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return []
+        with open(self.checkpoint) as fobj:
+            lines = fobj.read().split('\n')
+        state = json.loads(lines[0])
+        if (state.get('source'), state.get('target')) != \
+                (self.source.url, self.target.url):
+            raise ValueError('Checkpoint %s belongs to a copy from %s to %s'
+                             % (self.checkpoint, state.get('source'),
+                                state.get('target')))
+        done = list(state.get('done', []))
+        for n, line in enumerate(lines[1:], 1):
+            if not line:
+                continue
+            try:
+                done.extend(json.loads(line)['done'])
+            except ValueError:
+                # the last chunk was being written when the copy stopped:
+                # drop it so the next chunks are appended after the others
+                with open(self.checkpoint, 'w') as fobj:
+                    fobj.write('\n'.join(lines[:n]) + '\n')
+                break
+        return done
+
+    def save_checkpoint(self, ids):
+        """Append the ids of an imported chunk to the checkpoint file"""
+        if not self.checkpoint:
+            return
+        if not os.path.exists(self.checkpoint):
+            tmp = self.checkpoint + '.tmp'
+            with open(tmp, 'w') as fobj:
+                fobj.write(json.dumps({'source': self.source.url,
+                                       'target': self.target.url}) + '\n')
+            # never leave a checkpoint without its header behind
+            _replace(tmp, self.checkpoint)
+        # only the new chunk is written, not every id copied so far
+        with open(self.checkpoint, 'a') as fobj:
+            fobj.write(json.dumps({'done': ids}) + '\n')
+
+    def target_field(self, column):
+        """Name of a source column in the target, ``None`` to drop it"""
+        field, sep, code = column.partition('___')
+        if field in self.drop or column in self.drop:
+            return None
+        if column in self.field_map:
+            return self.field_map[column]
+        if field in self.field_map:
+            return self.field_map[field] + sep + code
+        return column
+
+    def shift(self, value, days):
+        """Shift a REDCap date or datetime string (always exported as
+        Y-M-D) by ``days``"""
+        if not value:
+            return value
+        day = datetime.strptime(value[:10], '%Y-%m-%d')
+        return (day + timedelta(days=days)).strftime('%Y-%m-%d') + value[10:]
+
+    def transform_chunk(self, chunk):
+        """Apply the date shift, drops, renames and ``transform``"""
+        def_field = self.source.def_field
+        out = []
+        for record in chunk:
+            days = self.date_shift
+            if callable(days):
+                days = days(record[def_field])
+            row = {}
+            for column, value in record.items():
+                name = self.target_field(column)
+                if name is None:
+                    continue
+                if days and column in self.date_fields:
+                    value = self.shift(value, days)
+                row[name] = value
+            out.append(row)
+        if self.transform is not None:
+            out = self.transform(out)
+        return out
+
+    def run(self, records=None, fields=None, forms=None, events=None):
+        """
+        Copy records from the source to the target project
+
+        Parameters
+        ----------
+        records : list, optional
+            ids of the records to copy, all records by default
+        fields, forms, events : list, optional
+            passed to ``source.export_records``
+
+        Returns
+        -------
+        summary : dict
+            ``records`` copied by this run, ``skipped`` records already
+            copied according to the checkpoint, ``chunks`` imported and
+            the ``count`` reported by the target
+        """
+        if records is None:
+            records = list(self.source.record_ids(refresh=True))
+        done = self.load_checkpoint()
+        finished = set(done)
+        todo = [r for r in records if r not in finished]
+        chunks = [todo[i:i + self.batch_size]
+                  for i in range(0, len(todo), self.batch_size)]
+        summary = {'records': 0, 'skipped': len(records) - len(todo),
+                   'chunks': 0, 'count': 0}
+        # bound the chunks held in memory while imports lag behind exports
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        errors = []
+
+        def load(ids, data):
+            try:
+                if errors:
+                    return
+                response = self.target.import_records(
+                    data, overwrite=self.overwrite)
+                with self._lock:
+                    self.save_checkpoint(ids)
+                    summary['records'] += len(ids)
+                    summary['chunks'] += 1
+                    if isinstance(response, dict):
+                        summary['count'] += int(response.get('count', 0))
+                    copied = summary['records']
+                if self.progress is not None:
+                    self.progress(copied, len(todo))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        importer = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            for ids in chunks:
+                slots.acquire()
+                if errors:
+                    slots.release()
+                    break
+                try:
+                    data = self.source.export_records(
+                        records=ids, fields=fields, forms=forms,
+                        events=events)
+                    data = self.transform_chunk(data)
+                except Exception:
+                    slots.release()
+                    raise
+                importer.submit(load, ids, data)
+        finally:
+            importer.shutdown()
+        if errors:
+            raise RedcapError('Replication stopped after %d records: %s' %
+                              (summary['records'], errors[0]))
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        return summary
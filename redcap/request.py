@@ -15,8 +15,249 @@ __author__ = 'Scott Burns'
 __copyright__ = ' Copyright 2014, Vanderbilt University'
 
 
-from requests import post, RequestException
-import json
+from requests import RequestException
+from requests.exceptions import ConnectionError, Timeout
+import gzip
+import hashlib
+import tempfile
+import time
+import uuid
+import zlib
+
+from .metrics import RequestMetrics, profile_phase
+from .transport import POST, SessionTransport
+from .deadlines import DeadlineExceeded
+from . import serializers
+
+try:
+    from urllib import urlencode, quote_plus
+except ImportError:
+    from urllib.parse import urlencode, quote_plus
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+
+def _accept_encoding():
+    """Response encodings ``requests`` can decode in this environment"""
+    encodings = ['gzip', 'deflate']
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        encodings.append('br')
+        break
+    return ', '.join(encodings)
+
+ACCEPT_ENCODING = _accept_encoding()
+
+def gzip_payload(payload):
+    """Form-encode a payload and gzip it, for servers that decompress
+    request bodies"""
+    items = [(k, v.encode('utf-8') if isinstance(v, text_type) else v)
+             for k, v in payload.items()]
+    body = urlencode(items).encode('ascii')
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+# streamed request bodies are kept in memory up to this size, then spooled
+# to a temporary file
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# payloads with more bytes of values than this are sent as multipart/form-data
+MULTIPART_THRESHOLD = 64 * 1024
+
+
+class ChunkedData(object):
+    """
+    Payload value produced piece by piece, e.g. the csv of a DataFrame a
+    few thousand rows at a time. The pieces are form-encoded one after
+    the other when the request is sent, so the whole value is never held
+    as one string. It can only be sent once.
+    """
+
+    def __init__(self, chunks):
+        """
+        Parameters
+        ----------
+        chunks : iterable
+            str or bytes pieces of the value, in order
+        """
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+class SpooledBody(object):
+    """Request body read from a (spooled) temporary file, sent with a
+    ``Content-Length``
+
+    ``digests`` holds the sha1 of each :class:`ChunkedData` value (by
+    field) and file (by ``'file:'`` and field) written into it, so they
+    can be told apart after they were consumed, e.g. by a cassette.
+    """
+
+    def __init__(self, fobj, size, content_type, digests=None):
+        self.fobj = fobj
+        self.size = size
+        self.content_type = content_type
+        self.digests = digests or {}
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        while True:
+            block = self.fobj.read(64 * 1024)
+            if not block:
+                break
+            yield block
+
+    def read(self, size=-1):
+        return self.fobj.read(size)
+
+    def close(self):
+        self.fobj.close()
+
+
+def _encoded(value):
+    if isinstance(value, text_type):
+        return value.encode('utf-8')
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+def spool_form(payload, compress=False, spool_size=SPOOL_SIZE):
+    """
+    Form-encode ``payload`` into a temporary file one value (or
+    :class:`ChunkedData` piece) at a time
+
+    Parameters
+    ----------
+    payload : dict
+        values may be :class:`ChunkedData`
+    compress : (``False``), ``True``
+        gzip the encoded body
+    spool_size : int
+        bytes kept in memory before the body is moved to disk
+
+    Returns
+    -------
+    body : :class:`SpooledBody`
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    out = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+    digests = {}
+    for i, (key, value) in enumerate(payload.items()):
+        out.write((b'&' if i else b'') +
+                  quote_plus(_encoded(key)).encode('ascii') + b'=')
+        if isinstance(value, ChunkedData):
+            digest = hashlib.sha1()
+            for piece in value:
+                piece = _encoded(piece)
+                digest.update(piece)
+                out.write(quote_plus(piece).encode('ascii'))
+            digests[key] = digest.hexdigest()
+        else:
+            out.write(quote_plus(_encoded(value)).encode('ascii'))
+    if compress:
+        # writes the gzip trailer, leaves the spool open
+        out.close()
+    size = spool.tell()
+    spool.seek(0)
+    return SpooledBody(spool, size, 'application/x-www-form-urlencoded',
+                       digests)
+
+
+def spool_multipart(payload, files=None, boundary=None, compress=False,
+                    spool_size=SPOOL_SIZE):
+    """
+    Write ``payload`` (and ``files``) as a multipart/form-data body into a
+    temporary file, one value, :class:`ChunkedData` piece or file block
+    at a time
+
+    Unlike form-encoding, multipart sends values as they are, so JSON and
+    csv don't grow by a third or more through percent-escapes.
+
+    Parameters
+    ----------
+    payload : dict
+        values may be :class:`ChunkedData`
+    files : dict, optional
+        field -> ``(filename, fileobj)`` or ``(filename, fileobj,
+        content_type)`` as passed to ``requests``. File objects are copied
+        in blocks; bytes are accepted too.
+    boundary : str, optional
+        multipart boundary, random by default
+    compress : (``False``), ``True``
+        gzip the body
+
+    Returns
+    -------
+    body : :class:`SpooledBody`
+    """
+    boundary = boundary or uuid.uuid4().hex
+    delimiter = ('--%s\r\n' % boundary).encode('ascii')
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    out = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+    digests = {}
+    for key, value in payload.items():
+        out.write(delimiter)
+        out.write(('Content-Disposition: form-data; name="%s"\r\n\r\n'
+                   % key).encode('utf-8'))
+        if isinstance(value, ChunkedData):
+            digest = hashlib.sha1()
+            for piece in value:
+                piece = _encoded(piece)
+                digest.update(piece)
+                out.write(piece)
+            digests[key] = digest.hexdigest()
+        else:
+            out.write(_encoded(value))
+        out.write(b'\r\n')
+    for key, spec in (files or {}).items():
+        filename, fobj = spec[0], spec[1]
+        content_type = spec[2] if len(spec) > 2 else \
+            'application/octet-stream'
+        out.write(delimiter)
+        out.write(('Content-Disposition: form-data; name="%s"; '
+                   'filename="%s"\r\nContent-Type: %s\r\n\r\n'
+                   % (key, filename, content_type)).encode('utf-8'))
+        digest = hashlib.sha1()
+        if hasattr(fobj, 'read'):
+            # files opened in text mode read '' at the end, not b''
+            while True:
+                block = fobj.read(64 * 1024)
+                if not block:
+                    break
+                block = _encoded(block)
+                digest.update(block)
+                out.write(block)
+        else:
+            block = _encoded(fobj)
+            digest.update(block)
+            out.write(block)
+        digests['file:' + key] = digest.hexdigest()
+        out.write(b'\r\n')
+    out.write(('--%s--\r\n' % boundary).encode('ascii'))
+    if compress:
+        out.close()
+    size = spool.tell()
+    spool.seek(0)
+    return SpooledBody(spool, size,
+                       'multipart/form-data; boundary=%s' % boundary, digests)
+
+
+def _payload_size(payload):
+    return sum(len(v) for v in payload.values()
+               if isinstance(v, (bytes, text_type)))
 
 
 RedcapError = RequestException
@@ -40,7 +281,7 @@ class RCRequest(object):
     biggest consumer.
     """
 
-    def __init__(self, url, payload, qtype):
+    def __init__(self, url, payload, qtype, raw=False, stream=False):
         """
         Constructor
 
@@ -49,13 +290,21 @@ class RCRequest(object):
         url : str
             REDCap API URL
         payload : dict
-            key,values corresponding to the REDCap API
+            key,values corresponding to the REDCap API. The request keeps
+            its own copy, so the dict can be reused for other requests.
         qtype : str
             Used to validate payload contents against API
+        raw : (``False``), ``True``
+            return the undecoded response bytes
+        stream : (``False``), ``True``
+            return the ``requests`` response without reading its body, to
+            be read incrementally from ``response.raw``
         """
         self.url = url
-        self.payload = payload
+        self.payload = dict(payload)
         self.type = qtype
+        self.raw = raw
+        self.stream = stream
         if qtype:
             self.validate()
         fmt_key = 'returnFormat' if 'returnFormat' in payload else 'format'
@@ -138,11 +387,55 @@ class RCRequest(object):
         except KeyError:
             raise RCAPIError('content not in payload')
 
-    def execute(self, **kwargs):
+    def execute(self, session=None, hooks=None, compress=False,
+                profile_memory=False, multipart=True, transport=None,
+                breaker=None, deadline=None, body=None, **kwargs):
         """Execute the API request and return data
 
+        Responses are always requested compressed (gzip, deflate and, if
+        a brotli package is installed, br).
+
         Parameters
         ----------
+        session : ``requests.Session``
+            session to send the request with, e.g. to reuse its pooled
+            connections. By default, ``requests.post`` is used.
+        hooks : list
+            callables called with the :class:`redcap.metrics.RequestMetrics`
+            of the request. They aren't called for streamed requests.
+        compress : (``False``), ``True``
+            gzip the request body and send it with
+            ``Content-Encoding: gzip``. The server must be set up to
+            decompress request bodies (e.g. Apache's ``DEFLATE`` input
+            filter).
+
+            Payloads with :class:`ChunkedData` values are encoded (and
+            compressed) piece by piece into a temporary file, which is
+            then streamed.
+        profile_memory : (``False``), ``True``
+            also call ``hooks`` with the
+            :class:`redcap.metrics.MemoryMetrics` of receiving and
+            decoding the response
+        multipart : (``True``), ``False``
+            send payloads with more than ``MULTIPART_THRESHOLD`` bytes of
+            values, with :class:`ChunkedData` values or with ``files`` as
+            a streamed multipart/form-data body (see
+            :func:`spool_multipart`). ``False`` form-encodes them and
+            leaves ``files`` to ``requests``.
+        transport : :class:`redcap.transport.Transport`, optional
+            transport sending the request instead of ``session``, e.g. a
+            :class:`redcap.transport.CassetteTransport`
+        breaker : :class:`redcap.circuit.CircuitBreaker`, optional
+            count connection errors, timeouts and 5xx responses, and
+            raise :class:`redcap.circuit.CircuitOpenError` instead of
+            sending while its circuit is open
+        deadline : :class:`redcap.deadlines.Deadline`, optional
+            raise :class:`redcap.deadlines.DeadlineExceeded` instead of
+            sending once it has passed, and cut the timeout of the request
+            to the time left
+        body : :class:`SpooledBody`, optional
+            the payload already encoded (by :func:`spool_multipart` or
+            :func:`spool_form`, gzipped if ``compress``), sent as is
         kwargs :
             passed to requests.post()
 
@@ -152,15 +445,104 @@ class RCRequest(object):
             data object from JSON decoding process if format=='json',
             else return raw string (ie format=='csv'|'xml')
         """
-        r = post(self.url, data=self.payload, **kwargs)
+        if transport is None:
+            transport = SessionTransport(session) if session is not None \
+                else POST
+        if deadline is not None:
+            deadline.check('%s request' % self.type)
+            kwargs['timeout'] = deadline.timeout(kwargs.get('timeout'))
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        data = self.payload
+        profile = profile_memory and not self.stream
+        files = kwargs.get('files')
+        chunked = any(isinstance(v, ChunkedData)
+                      for v in self.payload.values())
+        if body is not None:
+            data = body
+            headers['Content-Type'] = data.content_type
+            if compress:
+                headers['Content-Encoding'] = 'gzip'
+        elif multipart and (files or chunked or
+                          _payload_size(self.payload) > MULTIPART_THRESHOLD):
+            kwargs.pop('files', None)
+            with profile_phase(hooks, 'serialize', self.type,
+                               profile) as phase:
+                data = spool_multipart(self.payload, files,
+                                       compress=compress)
+                phase.payload_bytes = len(data)
+            headers['Content-Type'] = data.content_type
+            if compress:
+                headers['Content-Encoding'] = 'gzip'
+        elif chunked:
+            with profile_phase(hooks, 'serialize', self.type,
+                               profile) as phase:
+                data = spool_form(self.payload, compress)
+                phase.payload_bytes = len(data)
+            headers['Content-Type'] = data.content_type
+            if compress:
+                headers['Content-Encoding'] = 'gzip'
+        elif compress:
+            data = gzip_payload(self.payload)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = time.time()
+        try:
+            if breaker is not None:
+                breaker.before()
+            try:
+                with profile_phase(hooks, 'receive', self.type,
+                                   profile) as phase:
+                    r = transport.send(self, data, headers=headers, **kwargs)
+                    if profile:
+                        body = r.request.body if r.request is not None \
+                            else None
+                        phase.payload_bytes = len(r.content) + (
+                            len(body) if hasattr(body, '__len__') else 0)
+            except (ConnectionError, Timeout) as e:
+                # timing out at the deadline (requests raises
+                # ConnectionError for timeouts while reading the body) says
+                # nothing about the server
+                if deadline is not None and deadline.remaining() < 0.05:
+                    if breaker is not None:
+                        breaker.release()
+                    raise DeadlineExceeded('%s request ran past its deadline'
+                                           ' of %gs' % (self.type,
+                                                        deadline.seconds))
+                if breaker is not None:
+                    breaker.failure(e)
+                raise
+            except Exception:
+                if breaker is not None:
+                    breaker.release()
+                raise
+        finally:
+            if isinstance(data, SpooledBody):
+                data.close()
+        if breaker is not None:
+            if r.status_code >= 500:
+                breaker.failure('%d %s' % (r.status_code, r.reason))
+            else:
+                breaker.success()
+        elapsed = time.time() - start
         # Raise if we need to
         self.raise_for_status(r)
-        content = self.get_content(r)
+        with profile_phase(hooks, 'decode', self.type, profile) as phase:
+            phase.payload_bytes = len(r.content) if profile else None
+            content = self.get_content(r)
+        if hooks and not self.stream:
+            metrics = RequestMetrics.from_response(self, r, elapsed)
+            for hook in hooks:
+                hook(metrics)
         return content, r.headers
 
     def get_content(self, r):
         """Abstraction for grabbing content from a returned response"""
-        if self.type == 'exp_file':
+        if self.stream:
+            if r.status_code >= 400:
+                raise RedcapError(r.content)
+            return r
+        elif self.type == 'exp_file' or self.raw:
             # don't use the decoded r.text
             return r.content
         elif self.type == 'version':
@@ -170,8 +552,9 @@ class RCRequest(object):
                 content = {}
                 # Decode
                 try:
-                    # Watch out for bad/empty json
-                    content = json.loads(r.text, strict=False)
+                    # Watch out for bad/empty json. Decoding the bytes
+                    # skips building r.text
+                    content = serializers.loads(r.content)
                 except ValueError as e:
                     if not self.expect_empty_json():
                         # reraise for requests that shouldn't send empty json
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Reshaping of longitudinal exports
+
+REDCap exports longitudinal data with one row per (record, event). The
+:class:`Reshaper` pivots such a ``pandas.DataFrame`` into wide-by-event,
+long-by-form or per-instrument tables. Only the cells of forms that are
+mapped to an event are ever copied, so the results stay proportional to
+the data actually collected.
+
+"""
+
+from .choices import CHECKBOX_SEP
+from .optional import numpy as np, pandas as pd
+
+EVENT_COL = 'redcap_event_name'
+REPEAT_INSTRUMENT_COL = 'redcap_repeat_instrument'
+REPEAT_INSTANCE_COL = 'redcap_repeat_instance'
+
+
+class Reshaper(object):
+    """
+    Pivot longitudinal DataFrames using a project's events, arms and
+    form-event mapping (its :class:`redcap.longitudinal.LongitudinalIndex`).
+    """
+
+    def __init__(self, project):
+        """
+        Parameters
+        ----------
+        project : :class:`redcap.Project`
+            a configured longitudinal project
+        """
+        if not pd:
+            raise ImportError('pandas is required to reshape exports')
+        self.project = project
+        self.def_field = project.def_field
+        self.index = project.longitudinal_index
+        self.form_fields = {}
+        for field in project.metadata:
+            self.form_fields.setdefault(field['form_name'], set()).add(
+                field['field_name'])
+
+    @property
+    def event_forms(self):
+        """dict of unique event name -> list of forms mapped to it"""
+        return self.index.event_forms
+
+    def events(self, arm=None):
+        """Return unique event names in project order, optionally for one
+        arm only"""
+        return self.index.events_in(arm)
+
+    def column_forms(self, columns):
+        """
+        Map exported column names to their form
+
+        Checkbox columns (``field___code``) and ``form_complete`` columns
+        are attributed to the form of their field. Columns that belong to
+        no form (e.g. ``redcap_*`` columns) are left out.
+        """
+        field_form = {}
+        for form, fields in self.form_fields.items():
+            for field in fields:
+                field_form[field] = form
+            field_form[form + '_complete'] = form
+        mapping = {}
+        for col in columns:
+            base = col.split(CHECKBOX_SEP)[0] if CHECKBOX_SEP in col else col
+            if col in field_form:
+                mapping[col] = field_form[col]
+            elif base in field_form:
+                mapping[col] = field_form[base]
+        return mapping
+
+    def _split(self, df):
+        """
+        Return (data, ids, events) where ``data`` only holds the data
+        columns, ``ids`` the record id and ``events`` the unique event
+        name of each row
+        """
+        if EVENT_COL in (df.index.names or []):
+            events = df.index.get_level_values(EVENT_COL)
+        elif EVENT_COL in df:
+            events = df[EVENT_COL]
+        else:
+            raise ValueError('DataFrame has no %s index or column' % EVENT_COL)
+        if self.def_field in (df.index.names or []):
+            ids = df.index.get_level_values(self.def_field)
+        else:
+            ids = df[self.def_field]
+        data = df.reset_index(drop=True)
+        drop = [c for c in (self.def_field, EVENT_COL) if c in data]
+        data = data.drop(columns=drop)
+        # Only the (few) categories are translated, rows keep their codes
+        events = pd.Categorical(pd.Categorical(events).map(
+            self.index.unique_name))
+        return data, pd.Index(ids), events
+
+    def _plain_rows(self, data):
+        """Boolean mask of the rows that aren't repeating instances"""
+        if REPEAT_INSTRUMENT_COL not in data:
+            return np.ones(len(data), dtype=bool)
+        return data[REPEAT_INSTRUMENT_COL].isnull().values | \
+            (data[REPEAT_INSTRUMENT_COL] == '').values
+
+    def _instances(self, data, rows):
+        """Repeat instance of every row, or ``None`` if none of ``rows``
+        (a mask or positions) is a repeated instance"""
+        if REPEAT_INSTANCE_COL not in data:
+            return None
+        instances = data[REPEAT_INSTANCE_COL].values
+        if not pd.notnull(instances[rows]).any():
+            return None
+        return instances
+
+    def wide_by_event(self, df, arm=None, events=None, sep='__'):
+        """
+        Pivot to one row per record and one column per (event, field)
+
+        Only fields of forms mapped to an event become columns for that
+        event. Rows of repeating instruments can't be pivoted and are left
+        out, see :meth:`by_instrument`. Instances of repeating events are
+        pivoted into rows of their own: the table is then indexed by
+        ``redcap_repeat_instance`` as well, which is empty for the rows of
+        events that don't repeat.
+
+        Parameters
+        ----------
+        df : ``pandas.DataFrame``
+            longitudinal export, e.g. ``project.export_records(format='df')``
+        arm : str, int
+            only pivot the events of this arm
+        events : list
+            only pivot these unique event names
+        sep : str
+            separator between event and field in the column names. Pass
+            ``None`` to get a ``(event, field)`` MultiIndex instead.
+
+        Returns
+        -------
+        wide : ``pandas.DataFrame``
+            indexed by ``def_field`` (plus ``redcap_repeat_instance``)
+        """
+        data, ids, row_events = self._split(df)
+        col_forms = self.column_forms(data.columns)
+        plain = self._plain_rows(data)
+        instances = self._instances(data, plain)
+        names = [self.def_field] if instances is None else \
+            [self.def_field, REPEAT_INSTANCE_COL]
+        pieces = []
+        for event in events or self.events(arm):
+            mask = np.asarray(row_events == event) & plain
+            if not mask.any():
+                continue
+            forms = set(self.event_forms.get(event, ()))
+            cols = [c for c in data.columns if col_forms.get(c) in forms]
+            if not cols:
+                continue
+            piece = data.loc[mask, cols]
+            if instances is None:
+                piece.index = ids[mask]
+            else:
+                piece.index = pd.MultiIndex.from_arrays(
+                    [ids[mask], instances[mask]], names=names)
+            if sep is None:
+                piece.columns = pd.MultiIndex.from_product([[event], cols])
+            else:
+                piece.columns = [event + sep + c for c in cols]
+            pieces.append(piece)
+        if not pieces:
+            return pd.DataFrame(index=pd.Index([], name=self.def_field))
+        wide = pd.concat(pieces, axis=1)
+        wide.index.names = names
+        return wide
+
+    def long_by_form(self, df, dropna=True):
+        """
+        Melt to one row per (record, event, form, field)
+
+        Parameters
+        ----------
+        df : ``pandas.DataFrame``
+            longitudinal export
+        dropna : (``True``), ``False``
+            leave out empty values
+
+        Returns
+        -------
+        long : ``pandas.DataFrame``
+            columns ``def_field``, ``redcap_event_name``, ``form``,
+            ``field`` and ``value``, plus ``redcap_repeat_instance`` after
+            the event if the export has repeating instruments or events
+            (empty for rows that don't repeat). The event, form and field
+            columns are categoricals to keep memory usage low.
+        """
+        data, ids, row_events = self._split(df)
+        col_forms = self.column_forms(data.columns)
+        plain = self._plain_rows(data)
+        instances = self._instances(data, slice(None))
+        keys = [self.def_field] if instances is None else \
+            [self.def_field, REPEAT_INSTANCE_COL]
+        pieces = []
+        for event in self.events():
+            at_event = np.asarray(row_events == event)
+            if not at_event.any():
+                continue
+            for form in self.event_forms.get(event, ()):
+                cols = [c for c in data.columns if col_forms.get(c) == form]
+                if not cols:
+                    continue
+                # rows of other repeating instruments have none of its data
+                mask = at_event & plain
+                if REPEAT_INSTRUMENT_COL in data:
+                    mask |= at_event & \
+                        (data[REPEAT_INSTRUMENT_COL] == form).values
+                if not mask.any():
+                    continue
+                block = data.loc[mask, cols]
+                block.insert(0, self.def_field, ids[mask])
+                if instances is not None:
+                    block.insert(1, REPEAT_INSTANCE_COL, instances[mask])
+                piece = block.melt(id_vars=keys,
+                                   var_name='field', value_name='value')
+                if dropna:
+                    piece = piece[piece['value'].notnull()]
+                piece.insert(1, EVENT_COL, event)
+                piece.insert(len(keys) + 1, 'form', form)
+                pieces.append(piece)
+        columns = keys[:1] + [EVENT_COL] + keys[1:] + \
+            ['form', 'field', 'value']
+        if not pieces:
+            return pd.DataFrame(columns=columns)
+        long_df = pd.concat(pieces, ignore_index=True)
+        for col in (EVENT_COL, 'form', 'field'):
+            long_df[col] = long_df[col].astype('category')
+        return long_df[columns]
+
+    def by_instrument(self, df, dropna=True):
+        """
+        Split into one table per instrument
+
+        Each table only holds the rows of events the instrument is mapped
+        to and only the instrument's columns. Rows of repeating
+        instruments go to their instrument's table. Tables holding
+        repeated instances, of the instrument or of repeating events, are
+        indexed by ``redcap_repeat_instance`` in addition to record and
+        event; it is empty for the rows that don't repeat.
+
+        Parameters
+        ----------
+        df : ``pandas.DataFrame``
+            longitudinal export
+        dropna : (``True``), ``False``
+            leave out rows where all of the instrument's fields are empty
+
+        Returns
+        -------
+        tables : dict
+            form name -> ``pandas.DataFrame`` indexed by
+            ``[def_field, redcap_event_name]`` (plus
+            ``redcap_repeat_instance`` for repeating instruments)
+        """
+        data, ids, row_events = self._split(df)
+        col_forms = self.column_forms(data.columns)
+        plain = self._plain_rows(data)
+        # Factorize ids once so every table's index is built from codes
+        id_codes, id_levels = pd.factorize(ids)
+        form_events = {}
+        for event, forms in self.event_forms.items():
+            for form in forms:
+                form_events.setdefault(form, []).append(event)
+        tables = {}
+        for form in sorted(set(col_forms.values())):
+            cols = [c for c in data.columns if col_forms.get(c) == form]
+            positions = [data.columns.get_loc(c) for c in cols]
+            mapped = row_events.isin(form_events.get(form, []))
+            index_names = [self.def_field, EVENT_COL]
+            repeated = ~plain & (data[REPEAT_INSTRUMENT_COL] == form).values \
+                if REPEAT_INSTRUMENT_COL in data else plain & False
+            rows = np.flatnonzero(mapped & (plain | repeated))
+            if self._instances(data, rows) is not None:
+                index_names.append(REPEAT_INSTANCE_COL)
+            if dropna:
+                fields = [p for p, c in zip(positions, cols)
+                          if c != form + '_complete']
+                filled = data.iloc[rows, fields].notnull().any(axis=1)
+                rows = rows[filled.values]
+            table = data.iloc[rows, positions]
+            levels = [id_levels, row_events.categories]
+            codes = [id_codes[rows], row_events.codes[rows]]
+            if REPEAT_INSTANCE_COL in index_names:
+                inst_codes, inst_levels = pd.factorize(
+                    data[REPEAT_INSTANCE_COL].values[rows])
+                levels.append(inst_levels)
+                codes.append(inst_codes)
+            table.index = pd.MultiIndex(levels=levels, codes=codes,
+                names=index_names).remove_unused_levels()
+            tables[form] = table
+        return tables
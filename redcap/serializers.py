@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+JSON encoding and decoding
+
+Large exports spend most of their CPU time decoding JSON. This module uses
+the fastest JSON library installed (``orjson``, ``ujson``, ``simplejson``,
+in that order), falling back to the standard library, chosen on first
+use. Use :func:`set_backend` to pick one explicitly.
+
+"""
+
+import json
+
+BACKENDS = ('orjson', 'ujson', 'simplejson', 'json')
+
+
+def _stdlib_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    # REDCap doesn't escape control characters (e.g. newlines in notes)
+    return json.loads(data, strict=False)
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def _load(name):
+    """Return the (loads, dumps) functions of backend ``name``, ``None``
+    if it isn't installed"""
+    if name == 'json':
+        return _stdlib_loads, _stdlib_dumps
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    if name == 'orjson':
+        return module.loads, lambda obj: module.dumps(obj).decode('utf-8')
+    if name == 'ujson':
+        return module.loads, lambda obj: module.dumps(obj,
+                                                      ensure_ascii=False)
+    return (lambda data: module.loads(data, strict=False),
+            lambda obj: module.dumps(obj, separators=(',', ':')))
+
+
+def available():
+    """Return the names of the installed backends, fastest first"""
+    return [name for name in BACKENDS if _load(name) is not None]
+
+
+_backend = None
+_loads = _dumps = None
+
+
+def set_backend(name=None):
+    """
+    Select the JSON library used by PyCap
+
+    Parameters
+    ----------
+    name : str, optional
+        one of ``'orjson'``, ``'ujson'``, ``'simplejson'`` or ``'json'``.
+        By default, the fastest installed one is used.
+    """
+    global _backend, _loads, _dumps
+    if name is None:
+        name = available()[0]
+    if name not in BACKENDS:
+        raise ValueError('Unknown JSON backend %r, use one of %s' %
+                         (name, ', '.join(BACKENDS)))
+    funcs = _load(name)
+    if funcs is None:
+        raise ValueError('JSON backend %r is not installed' % name)
+    _backend = name
+    _loads, _dumps = funcs
+
+
+def get_backend():
+    """Return the name of the JSON library in use"""
+    if _backend is None:
+        set_backend()
+    return _backend
+
+
+def loads(data):
+    """
+    Decode JSON from bytes or text
+
+    Responses are decoded straight from their bytes. Documents the faster
+    backends reject, like strings with raw control characters, are
+    decoded by the standard library.
+    """
+    if _backend is None:
+        set_backend()
+    try:
+        return _loads(data)
+    except ValueError:
+        if _backend == 'json':
+            raise
+    try:
+        return _loads(_escape_controls(data))
+    except ValueError:
+        return _stdlib_loads(data)
+
+
+def _escape_controls(data):
+    """Escape the control characters REDCap leaves in strings. Any outside
+    of strings make the result invalid, which :func:`loads` then hands to
+    the standard library instead."""
+    if isinstance(data, bytes):
+        return data.replace(b'\r', b'\\r').replace(b'\n', b'\\n') \
+            .replace(b'\t', b'\\t')
+    return data.replace('\r', '\\r').replace('\n', '\\n') \
+        .replace('\t', '\\t')
+
+
+def dumps(obj):
+    """Encode ``obj`` as compact JSON text"""
+    if _backend is None:
+        set_backend()
+    try:
+        return _dumps(obj)
+    except (TypeError, OverflowError):
+        if _backend == 'json':
+            raise
+        # e.g. numpy scalars some backends can't serialize
+        return _stdlib_dumps(obj)
+
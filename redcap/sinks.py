@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Writing exported records as they arrive
+
+Pass a sink to :meth:`redcap.Project.export_records` to write each record
+as soon as it is parsed instead of collecting the export in a list.
+:class:`JSONLinesSink` writes newline delimited JSON (one record per
+line), optionally gzipped and split into files of bounded size.
+
+"""
+
+import gzip
+import io
+import os
+
+from .serializers import dumps
+
+
+def part_path(path, part):
+    """
+    Name of part ``part`` of a split output
+
+    ``path`` may hold a ``{part}`` format field (e.g.
+    ``'records-{part:03d}.jsonl'``); otherwise the part number is added
+    before the extensions: ``records.jsonl.gz`` -> ``records-0002.jsonl.gz``
+    """
+    if '{part' in path:
+        return path.format(part=part)
+    head, tail = os.path.split(path)
+    stem, dot, ext = tail.partition('.')
+    return os.path.join(head, '%s-%04d%s%s' % (stem, part, dot, ext))
+
+
+class JSONLinesSink(object):
+    """
+    Write records as JSON lines to a file, a series of files or a stream
+
+    Use it as a context manager, or call :meth:`close` when done.
+    """
+
+    def __init__(self, target, compress=None, max_bytes=None):
+        """
+        Parameters
+        ----------
+        target : str, file-like
+            path of the output file, or a stream opened for writing. Text
+            streams (e.g. ``sys.stdout``) are written through their
+            ``buffer`` when compressing.
+        compress : bool, optional
+            gzip the output. By default, paths ending in ``.gz`` are
+            compressed and streams are not.
+        max_bytes : int, optional
+            start a new file (see :func:`part_path`) before one would
+            exceed this many bytes of JSON lines, counted before
+            compression. Only for paths; a single record larger than
+            ``max_bytes`` still gets a file of its own.
+        """
+        self.path = None
+        self.stream = None
+        if hasattr(target, 'write'):
+            if max_bytes:
+                raise ValueError("max_bytes needs a path, not a stream")
+            self.stream = target
+        else:
+            self.path = target
+        if compress is None:
+            compress = self.path is not None and self.path.endswith('.gz')
+        self.compress = compress
+        self.max_bytes = max_bytes
+        #: paths of the files written, in order
+        self.paths = []
+        #: number of records written
+        self.rows = 0
+        self._fobj = None
+        self._text = False
+        self._part_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        if self.stream is not None:
+            stream = self.stream
+            self._text = isinstance(stream, io.TextIOBase)
+            if self.compress:
+                if self._text:
+                    if not hasattr(stream, 'buffer'):
+                        raise ValueError("Can't write gzip to a text stream")
+                    stream = stream.buffer
+                    self._text = False
+                stream = gzip.GzipFile(fileobj=stream, mode='wb')
+            self._fobj = stream
+        else:
+            path = self.path
+            if self.max_bytes:
+                path = part_path(self.path, len(self.paths))
+            if self.compress:
+                self._fobj = gzip.open(path, 'wb')
+            else:
+                self._fobj = open(path, 'wb')
+            self.paths.append(path)
+        self._part_bytes = 0
+
+    def _close_part(self):
+        if self._fobj is None:
+            return
+        if self._fobj is self.stream:
+            self._fobj.flush()
+        elif self.stream is not None:
+            # gzip wrapper around the caller's stream: end the gzip member,
+            # leave the stream open
+            self._fobj.close()
+            self.stream.flush()
+        else:
+            self._fobj.close()
+        self._fobj = None
+
+    def write(self, row):
+        """Write one record"""
+        line = dumps(row) + u'\n'
+        data = line.encode('utf-8')
+        if (self._fobj is not None and self.max_bytes and self._part_bytes
+                and self._part_bytes + len(data) > self.max_bytes):
+            self._close_part()
+        if self._fobj is None:
+            self._open()
+        self._fobj.write(line if self._text else data)
+        self._part_bytes += len(data)
+        self.rows += 1
+
+    def writerows(self, rows):
+        """Write every record of ``rows``, return how many"""
+        n = 0
+        for row in rows:
+            self.write(row)
+            n += 1
+        return n
+
+    def close(self):
+        """Finish the output. An export without records still creates
+        its (first) file."""
+        if self._fobj is None and not self.paths and self.path is not None:
+            self._open()
+        self._close_part()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Scott Burns <scott.s.burns@vanderbilt.edu>'
+__license__ = 'MIT'
+__copyright__ = '2014, Vanderbilt University'
+
+"""
+
+Transports sending API requests
+
+:class:`redcap.request.RCRequest` builds the request body and hands it to
+a transport, which sends it and returns a ``requests.Response``:
+
+* :class:`SessionTransport` posts through a pooled ``requests.Session``
+  (the default of every ``Project``)
+* :class:`AsyncTransport` sends through another transport on worker
+  threads, and runs project calls as :mod:`asyncio` awaitables
+* :class:`CassetteTransport` records responses to a file and replays them
+  without a server, e.g. for deterministic tests and benchmarks that
+  measure PyCap's own overhead without the network
+
+Anything with ``send(request, data, headers=None, **kwargs)`` and
+``close()`` methods can be passed as ``Project(transport=...)``.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+# connections kept open per host by the sessions PyCap creates
+POOL_SIZE = 16
+
+
+def pooled_session(pool_size=POOL_SIZE):
+    """Return a ``requests.Session`` keeping up to ``pool_size``
+    connections per host open. Sessions are safe to post through from
+    several threads at once."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class CassetteError(Exception):
+    """ A request that a replaying cassette has no response for """
+    pass
+
+
+class Transport(object):
+    """
+    Base class of transports
+
+    Subclasses implement :meth:`send`.
+    """
+
+    def send(self, request, data, headers=None, **kwargs):
+        """Send a request and return its ``requests.Response``
+
+        Parameters
+        ----------
+        request : :class:`redcap.request.RCRequest`
+            the request, for its ``url``, ``payload``, ``type`` and
+            ``stream``
+        data : dict, bytes, file-like
+            body to post: the payload itself, or its encoded form
+        headers : dict
+            request headers
+        kwargs :
+            passed to ``requests`` (``verify``, ``timeout``, ``files``...)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the transport's connections"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SessionTransport(Transport):
+    """
+    Send requests through a ``requests.Session``
+    """
+
+    def __init__(self, session=None, pool_size=POOL_SIZE):
+        """
+        Parameters
+        ----------
+        session : ``requests.Session``, optional
+            session to post through, e.g. one shared with other projects.
+            By default, the transport creates a pooled session of its own
+            (see :func:`pooled_session`) and closes it on :meth:`close`.
+        pool_size : int
+            connections kept open per host by the transport's own session
+        """
+        self._own_session = session is None
+        self.session = pooled_session(pool_size) if session is None \
+            else session
+
+    def send(self, request, data, headers=None, **kwargs):
+        return self.session.post(request.url, data=data, headers=headers,
+                                 stream=request.stream, **kwargs)
+
+    def close(self):
+        if self._own_session:
+            self.session.close()
+
+
+class _PostTransport(Transport):
+    """Send every request with ``requests.post`` (a new connection each)"""
+
+    def send(self, request, data, headers=None, **kwargs):
+        return requests.post(request.url, data=data, headers=headers,
+                             stream=request.stream, **kwargs)
+
+
+#: transport of requests executed without a session or transport
+POST = _PostTransport()
+
+
+class AsyncTransport(Transport):
+    """
+    Send requests on worker threads
+
+    No async HTTP client is required: requests go through another
+    transport (a pooled :class:`SessionTransport` by default) on a thread
+    pool, which :meth:`run` and :meth:`apost` expose as :mod:`asyncio`
+    awaitables, e.g.::
+
+        transport = AsyncTransport(workers=8)
+        project = Project(url, token, transport=transport)
+        records, users = await asyncio.gather(
+            transport.run(project.export_records),
+            transport.run(project.export_users))
+
+    A project using it directly (``project.export_records()``) still
+    blocks until the response arrives.
+    """
+
+    def __init__(self, transport=None, workers=POOL_SIZE):
+        """
+        Parameters
+        ----------
+        transport : transport, optional
+            transport sending the requests, closed with this one
+        workers : int
+            requests sent at once
+        """
+        self.transport = transport if transport is not None \
+            else SessionTransport(pool_size=workers)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    @property
+    def session(self):
+        return getattr(self.transport, 'session', None)
+
+    def send(self, request, data, headers=None, **kwargs):
+        return self.transport.send(request, data, headers=headers, **kwargs)
+
+    def submit(self, func, *args, **kwargs):
+        """Call ``func`` on a worker thread and return a
+        ``concurrent.futures.Future`` of its result"""
+        return self.executor.submit(func, *args, **kwargs)
+
+    def run(self, func, *args, **kwargs):
+        """Return an :mod:`asyncio` future of ``func(*args, **kwargs)``
+        called on a worker thread; call it from a running event loop"""
+        # imported here, it adds noticeably to the time of import redcap
+        try:
+            import asyncio
+        except ImportError:
+            raise RuntimeError('asyncio is not available')
+        return asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def apost(self, request, data, headers=None, **kwargs):
+        """Return an :mod:`asyncio` future of :meth:`send`"""
+        return self.run(self.send, request, data, headers=headers, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.transport.close()
+
+
+def _match_value(value):
+    """Stable representation of a payload value for matching requests"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if isinstance(value, text_type):
+        if len(value) <= 256:
+            return value
+        return 'sha1:' + hashlib.sha1(value.encode('utf-8')).hexdigest()
+    if isinstance(value, (list, tuple, dict, int, float)) or value is None:
+        return json.dumps(value, sort_keys=True, default=str)
+    # e.g. ChunkedData, which can only be read once
+    return '<%s>' % type(value).__name__
+
+
+def _file_digest(name, fobj):
+    """sha1 of a file's content, read without moving the file"""
+    if isinstance(fobj, (bytes, text_type)):
+        content = fobj.encode('utf-8') if isinstance(fobj, text_type) \
+            else fobj
+        return hashlib.sha1(content).hexdigest()
+    try:
+        start = fobj.tell()
+    except (AttributeError, IOError, OSError):
+        start = None
+    if start is None or not getattr(fobj, 'seekable', lambda: True)():
+        raise CassetteError("can't record the request: file %s can't be "
+                            "read twice" % name)
+    digest = hashlib.sha1()
+    while True:
+        block = fobj.read(64 * 1024)
+        if not block:
+            break
+        digest.update(block.encode('utf-8')
+                      if isinstance(block, text_type) else block)
+    fobj.seek(start)
+    return digest.hexdigest()
+
+
+def _fingerprint(url, payload, files=None, digests=None):
+    """Key of a request in a cassette: its URL and payload without the
+    token, long values and files hashed. ``digests`` are those of a
+    :class:`redcap.request.SpooledBody`, which already consumed its
+    :class:`redcap.request.ChunkedData` values and files."""
+    digests = digests or {}
+    key = [('url', url)]
+    key.extend((k, 'sha1:' + digests[k] if k in digests else _match_value(v))
+               for k, v in sorted(payload.items()) if k != 'token')
+    hashed = dict((k, 'sha1:' + v) for k, v in digests.items()
+                  if k.startswith('file:'))
+    for name, spec in (files or {}).items():
+        hashed['file:' + name] = 'sha1:' + _file_digest(name, spec[1])
+    key.extend(sorted(hashed.items()))
+    return json.dumps(key)
+
+
+def _response(status, reason, headers, body, url, stream):
+    """Build a ``requests.Response`` of recorded content"""
+    r = requests.models.Response()
+    r.status_code = status
+    r.reason = reason
+    r.headers = CaseInsensitiveDict(headers)
+    r.url = url
+    r.encoding = get_encoding_from_headers(r.headers)
+    if stream:
+        r.raw = io.BytesIO(body)
+    else:
+        r._content = body
+        r._content_consumed = True
+    return r
+
+
+class CassetteTransport(Transport):
+    """
+    Record responses to a file and replay them
+
+    Requests are matched by URL, payload (without the token, so cassettes
+    don't hold credentials) and the content of imported files and
+    DataFrames. Requests repeated with the same payload get their
+    recorded responses in order, then the last one again. Files that
+    aren't seekable can only be recorded from a ``multipart`` project. Responses are stored decoded, so replayed responses have no
+    ``Content-Encoding``.
+    """
+
+    MODES = ('replay', 'record', 'once')
+
+    def __init__(self, path, mode='once', transport=None):
+        """
+        Parameters
+        ----------
+        path : str
+            cassette file, JSON, gzipped when the name ends in ``.gz``
+        mode : (``'once'``), ``'replay'``, ``'record'``
+            ``'replay'`` only replays and raises :class:`CassetteError`
+            for unrecorded requests; ``'record'`` sends every request
+            and records it, replacing the cassette; ``'once'`` replays
+            recorded requests and sends and records the others
+        transport : transport, optional
+            transport sending requests that aren't replayed, a pooled
+            :class:`SessionTransport` by default. Closed with this one.
+        """
+        if mode not in self.MODES:
+            raise ValueError('mode must be one of %s' % ', '.join(self.MODES))
+        self.path = path
+        self.mode = mode
+        self._transport = transport
+        self._lock = threading.Lock()
+        self._played = {}
+        self.interactions = OrderedDict()
+        if mode != 'record' and os.path.exists(path):
+            self.load()
+        elif mode == 'replay':
+            raise CassetteError('no cassette at %s' % path)
+        self._dirty = False
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            self._transport = SessionTransport()
+        return self._transport
+
+    @property
+    def session(self):
+        return getattr(self._transport, 'session', None)
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return io.TextIOWrapper(gzip.open(self.path, mode + 'b'),
+                                    encoding='utf-8')
+        return io.open(self.path, mode, encoding='utf-8')
+
+    def load(self):
+        """Read the cassette file"""
+        with self._open('r') as fobj:
+            recorded = json.load(fobj)
+        self.interactions = OrderedDict()
+        for item in recorded['interactions']:
+            key = json.dumps(item['request'])
+            self.interactions.setdefault(key, []).append(item['response'])
+
+    def save(self):
+        """Write the cassette file, if anything was recorded"""
+        with self._lock:
+            if not self._dirty:
+                return
+            interactions = [
+                {'request': json.loads(key), 'response': response}
+                for key, responses in self.interactions.items()
+                for response in responses]
+            with self._open('w') as fobj:
+                fobj.write(text_type(json.dumps(
+                    {'version': 1, 'interactions': interactions}, indent=1)))
+            self._dirty = False
+
+    def send(self, request, data, headers=None, **kwargs):
+        key = _fingerprint(request.url, request.payload, kwargs.get('files'),
+                           getattr(data, 'digests', None))
+        if self.mode != 'record':
+            with self._lock:
+                responses = self.interactions.get(key)
+                if responses:
+                    played = self._played.get(key, 0)
+                    self._played[key] = played + 1
+                    recorded = responses[min(played, len(responses) - 1)]
+                    return self._replay(recorded, request)
+            if self.mode == 'replay':
+                raise CassetteError('no recorded response to %s request '
+                                    '%s' % (request.type, key))
+        r = self.transport.send(request, data, headers=headers, **kwargs)
+        recorded = self._record(r)
+        with self._lock:
+            responses = self.interactions.setdefault(key, [])
+            responses.append(recorded)
+            self._played[key] = len(responses)
+            self._dirty = True
+        return self._replay(recorded, request) if request.stream else r
+
+    def _record(self, r):
+        body = r.content
+        headers = dict((k, v) for k, v in r.headers.items() if k.lower()
+                       not in ('content-encoding', 'content-length',
+                               'transfer-encoding', 'date', 'connection'))
+        try:
+            text, encoding = body.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            text = base64.b64encode(body).decode('ascii')
+            encoding = 'base64'
+        return {'status': r.status_code, 'reason': r.reason,
+                'headers': headers,
+                'body': text, 'encoding': encoding}
+
+    def _replay(self, recorded, request):
+        if recorded['encoding'] == 'base64':
+            body = base64.b64decode(recorded['body'])
+        else:
+            body = recorded['body'].encode('utf-8')
+        return _response(recorded['status'], recorded.get('reason', ''),
+                         recorded['headers'], body,
+                         request.url, request.stream)
+
+    def close(self):
+        self.save()
+        if self._transport is not None:
+            self._transport.close()
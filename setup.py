@@ -6,6 +6,7 @@ __license__ = 'MIT'
 __copyright__ = '2014, Vanderbilt University'
 
 import os
+import sys
 
 try:
     from setuptools import setup
@@ -25,6 +26,10 @@ required = [
     'semantic-version==2.3.1'
 ]
 
+if sys.version_info < (3, 2):
+    # backport of concurrent.futures
+    required.append('futures')
+
 if __name__ == '__main__':
     if os.path.exists('MANIFEST'):
         os.remove('MANIFEST')
@@ -42,6 +47,7 @@ if __name__ == '__main__':
         long_description=long_desc,
         packages=['redcap'],
         install_requires=required,
+        entry_points={'console_scripts': ['redcap = redcap.cli:main']},
         platforms='any',
         classifiers=(
                 'Development Status :: 5 - Production',
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+A tiny in-process REDCap API stand-in for tests that shouldn't need a
+live server. It serves one project and records every request it gets.
+"""
+
+import calendar
+import csv
+import io
+import json
+import re
+import socket
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+
+
+METADATA = [
+    {'field_name': 'study_id', 'form_name': 'demographics',
+     'field_type': 'text', 'field_label': 'Study ID',
+     'select_choices_or_calculations': ''},
+    {'field_name': 'age', 'form_name': 'demographics',
+     'field_type': 'text', 'field_label': 'Age',
+     'select_choices_or_calculations': ''},
+    {'field_name': 'sex', 'form_name': 'demographics',
+     'field_type': 'radio', 'field_label': 'Sex',
+     'select_choices_or_calculations': '0, Female | 1, Male'},
+    {'field_name': 'weight', 'form_name': 'vitals',
+     'field_type': 'text', 'field_label': 'Weight',
+     'select_choices_or_calculations': ''},
+    {'field_name': 'height', 'form_name': 'vitals',
+     'field_type': 'text', 'field_label': 'Height',
+     'select_choices_or_calculations': ''},
+    {'field_name': 'file', 'form_name': 'vitals',
+     'field_type': 'file', 'field_label': 'File',
+     'select_choices_or_calculations': ''},
+]
+
+EVENTS = [
+    {'event_name': 'Baseline', 'arm_num': '1', 'day_offset': '0',
+     'offset_min': '0', 'offset_max': '0',
+     'unique_event_name': 'baseline_arm_1'},
+    {'event_name': 'Follow Up', 'arm_num': '1', 'day_offset': '30',
+     'offset_min': '0', 'offset_max': '0',
+     'unique_event_name': 'follow_up_arm_1'},
+]
+
+ARMS = [{'arm_num': '1', 'name': 'Arm 1'}]
+
+FEM = [
+    {'arm_num': '1', 'unique_event_name': 'baseline_arm_1',
+     'form': 'demographics'},
+    {'arm_num': '1', 'unique_event_name': 'baseline_arm_1',
+     'form': 'vitals'},
+    {'arm_num': '1', 'unique_event_name': 'follow_up_arm_1',
+     'form': 'vitals'},
+]
+
+NOT_LONGITUDINAL = {'error': 'You cannot export events for classic projects'}
+
+
+def make_records(n, longitudinal=False):
+    """Build n records (per event when longitudinal) of synthetic data"""
+    rows = []
+    for i in range(1, n + 1):
+        demo = {'study_id': str(i), 'age': str(20 + i % 50),
+                'sex': str(i % 2), 'demographics_complete': '2'}
+        vitals = {'weight': str(60 + i % 40), 'height': str(150 + i % 40),
+                  'file': '', 'vitals_complete': '0'}
+        if not longitudinal:
+            row = dict(demo)
+            row.update(vitals)
+            rows.append(row)
+            continue
+        base = dict(demo, redcap_event_name='baseline_arm_1')
+        base.update(vitals)
+        rows.append(base)
+        follow = dict((k, '') for k in demo)
+        follow.update(vitals, study_id=str(i),
+                      redcap_event_name='follow_up_arm_1')
+        rows.append(follow)
+    return rows
+
+
+class StubREDCap(ThreadingMixIn, HTTPServer):
+    """
+    Serve a REDCap-like API on localhost
+
+    Attributes
+    ----------
+    requests : list
+        one dict per request with the decoded ``payload``, the ``headers``
+        and the number of ``body_bytes`` received
+    max_in_flight : int
+        most requests that were handled at the same time
+
+    Request bodies sent with ``Content-Encoding: gzip`` are decompressed,
+    and responses are gzipped for clients accepting it unless ``gzip`` is
+    false.
+    """
+
+    daemon_threads = True
+    # the default backlog of 5 resets connections under stress tests
+    request_queue_size = 128
+
+    def __init__(self, n_records=10, longitudinal=False, delay=0, gzip=True):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.longitudinal = longitudinal
+        self.gzip = gzip
+        # seconds to hold each request, to observe concurrency
+        self.delay = delay
+        # status of every response while set, e.g. 503 for an outage
+        self.status = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.metadata = [dict(m) for m in METADATA]
+        self.records = make_records(n_records, longitudinal)
+        # record id -> time.time() of the last import, 0 for the originals
+        self.modified = {}
+        # hours from UTC of the time zone dateRangeBegin is read in, the
+        # local one if None
+        self.utc_offset = None
+        # (record, field, event) -> (file name, bytes) for file exports
+        self.files = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/api/' % self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on a slow response, e.g. at a deadline
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def contents(self, content):
+        """Return the payloads of all requests for ``content``"""
+        return [r['payload'] for r in self.requests
+                if r['payload'].get('content') == content]
+
+    def form_fields(self, form):
+        fields = [m['field_name'] for m in self.metadata
+                  if m['form_name'] == form]
+        return fields + [form + '_complete']
+
+    def export_records(self, pl):
+        fields = [f for f in pl.get('fields', '').split(',') if f]
+        for form in [f for f in pl.get('forms', '').split(',') if f]:
+            fields.extend(self.form_fields(form))
+        if not fields:
+            for form in self.form_names():
+                fields.extend(self.form_fields(form))
+        if self.longitudinal:
+            fields.insert(1, 'redcap_event_name')
+        records = [r for r in pl.get('records', '').split(',') if r]
+        events = [e for e in pl.get('events', '').split(',') if e]
+        since = 0
+        if pl.get('dateRangeBegin'):
+            begin = time.strptime(pl['dateRangeBegin'], '%Y-%m-%d %H:%M:%S')
+            if self.utc_offset is None:
+                since = time.mktime(begin)
+            else:
+                since = calendar.timegm(begin) - self.utc_offset * 3600
+        rows = []
+        for row in self.records:
+            if records and row['study_id'] not in records:
+                continue
+            if since and self.modified.get(row['study_id'], 0) < since:
+                continue
+            if events and row.get('redcap_event_name') not in events:
+                continue
+            out = dict((f, row.get(f, '')) for f in fields if f in row)
+            if pl.get('exportDataAccessGroups', '').lower() == 'true':
+                # every export of a record carries its group
+                out['redcap_data_access_group'] = \
+                    'site_a' if int(row['study_id']) % 2 else 'site_b'
+            rows.append(out)
+        return rows
+
+    def export_report(self, pl):
+        """Report 1 lists study_id, age and sex of every record"""
+        if pl.get('report_id') != '1':
+            return 400, {'error': 'unknown report %s' % pl.get('report_id')}
+        fields = ['study_id', 'age', 'sex']
+        labels = dict((m['field_name'], m['field_label'])
+                      for m in self.metadata)
+        rows = []
+        for row in self.records:
+            values = [row.get(f, '') for f in fields]
+            if pl.get('rawOrLabel') == 'label':
+                values[2] = {'0': 'Female', '1': 'Male'}.get(values[2], '')
+            if pl.get('rawOrLabelHeaders') == 'label':
+                rows.append(OrderedDict((labels[f], v)
+                                        for f, v in zip(fields, values)))
+            else:
+                rows.append(OrderedDict(zip(fields, values)))
+        return 200, rows
+
+    def form_names(self):
+        names = []
+        for m in self.metadata:
+            if m['form_name'] not in names:
+                names.append(m['form_name'])
+        return names
+
+    def import_records(self, pl):
+        if pl.get('format') == 'csv':
+            data = list(csv.DictReader(io.StringIO(pl['data'])))
+        else:
+            data = json.loads(pl['data'])
+        key = lambda r: (r['study_id'], r.get('redcap_event_name'))
+        existing = dict((key(r), r) for r in self.records)
+        for row in data:
+            if key(row) in existing:
+                existing[key(row)].update(row)
+            else:
+                self.records.append(dict(row))
+                existing[key(row)] = self.records[-1]
+        ids = []
+        for row in data:
+            self.modified[row['study_id']] = time.time()
+            if row['study_id'] not in ids:
+                ids.append(row['study_id'])
+        if pl.get('returnContent') == 'ids':
+            return ids
+        return {'count': len(ids)}
+
+    def respond(self, pl, files=None):
+        """Return the (status, body[, headers]) answer to a decoded payload
+        and its uploaded ``files`` (name -> (filename, bytes))"""
+        content = pl.get('content')
+        if content == 'version':
+            return 200, b'6.5.0'
+        if content == 'metadata':
+            if 'data' in pl:
+                self.metadata = json.loads(pl['data'])
+                return 200, len(self.metadata)
+            return 200, self.metadata
+        if content == 'project':
+            return 200, {'project_id': '1', 'project_title': 'Stub',
+                         'is_longitudinal': int(self.longitudinal)}
+        if content == 'event':
+            return 200, EVENTS if self.longitudinal else NOT_LONGITUDINAL
+        if content == 'arm':
+            return 200, ARMS if self.longitudinal else NOT_LONGITUDINAL
+        if content == 'formEventMapping':
+            return 200, FEM if self.longitudinal else NOT_LONGITUDINAL
+        if content == 'record':
+            if 'data' in pl:
+                return 200, self.import_records(pl)
+            return 200, self.export_records(pl)
+        if content == 'report':
+            return self.export_report(pl)
+        if content == 'file' and pl.get('action') == 'import':
+            key = (pl['record'], pl['field'], pl.get('event'))
+            self.files[key] = files['file']
+            return 200, b''
+        if content == 'file' and pl.get('action') == 'export':
+            key = (pl['record'], pl['field'], pl.get('event'))
+            if key not in self.files:
+                return 400, {'error': 'There is no file to download'}
+            name, data = self.files[key]
+            return 200, data, {'Content-Type':
+                               'text/plain; name="%s"' % name}
+        return 400, {'error': 'unsupported content %s' % content}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        data = body
+        if self.headers.get('Content-Encoding') == 'gzip':
+            data = zlib.decompress(body, 31)
+        content_type = self.headers.get('Content-Type', '')
+        files = {}
+        if content_type.startswith('multipart/form-data'):
+            pl, files = _parse_multipart(data, content_type)
+        else:
+            pl = dict((k, v[0]) for k, v in parse_qs(
+                data.decode('utf-8'), keep_blank_values=True).items())
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+            server.requests.append({'payload': pl,
+                                    'headers': dict(self.headers),
+                                    'body_bytes': len(body)})
+            if server.status:
+                answer = server.status, {'error': 'unavailable'}
+            else:
+                answer = server.respond(pl, files)
+        status, content = answer[:2]
+        headers = {'Content-Type': 'text/plain; charset=utf-8'}
+        headers.update(answer[2] if len(answer) > 2 else {})
+        if not isinstance(content, bytes):
+            fmt = pl.get('returnFormat') if 'data' in pl else pl.get('format')
+            if fmt == 'csv' and isinstance(content, list):
+                content = _to_csv(content)
+            else:
+                content = json.dumps(content)
+            content = content.encode('utf-8')
+        self.send_response(status)
+        for header, value in headers.items():
+            self.send_header(header, value)
+        if server.gzip and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            content = compressor.compress(content) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _parse_multipart(data, content_type):
+    """Split a multipart/form-data body into fields and files"""
+    boundary = content_type.split('boundary=', 1)[1].strip('"')
+    pl, files = {}, {}
+    for part in data.split(b'--' + boundary.encode('ascii'))[1:-1]:
+        head, _, value = part[2:-2].partition(b'\r\n\r\n')
+        head = head.decode('utf-8')
+        name = re.search(r'name="([^"]*)"', head).group(1)
+        filename = re.search(r'filename="([^"]*)"', head)
+        if filename:
+            files[name] = (filename.group(1), value)
+        else:
+            pl[name] = value.decode('utf-8')
+    return pl, files
+
+
+def _to_csv(rows):
+    if not rows:
+        return ''
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=list(rows[0]),
+                            lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue()
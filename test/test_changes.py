@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from redcap import Project, HashIndex
+from redcap.changes import record_digests
+from stub_server import StubREDCap
+
+
+class RecordDigestTests(unittest.TestCase):
+    """ Testing record normalization and hashing """
+
+    rows = [{'id': '1', 'redcap_event_name': 'a', 'x': '1', 'y': ''},
+            {'id': '1', 'redcap_event_name': 'b', 'x': '2', 'y': 'z'},
+            {'id': '2', 'redcap_event_name': 'a', 'x': '1', 'y': ''}]
+
+    def test_normalized(self):
+        digests = record_digests(self.rows, 'id')
+        shuffled = [dict(self.rows[1], extra=''), self.rows[2],
+                    dict(self.rows[0], x=' 1 ')]
+        self.assertEqual(record_digests(shuffled, 'id'), digests)
+
+    def test_events_matter(self):
+        digests = record_digests(self.rows, 'id')
+        moved = [dict(self.rows[0], redcap_event_name='b'),
+                 dict(self.rows[1], redcap_event_name='a'), self.rows[2]]
+        self.assertNotEqual(record_digests(moved, 'id')['1'], digests['1'])
+        self.assertNotEqual(digests['1'], digests['2'])
+
+    def test_save_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'hashes.gz')
+            index = HashIndex(record_digests(self.rows, 'id'),
+                              {'fields': ['x']})
+            index.save(path)
+            loaded = HashIndex.load(path)
+            self.assertEqual(loaded.digests, index.digests)
+            self.assertEqual(loaded.scope, {'fields': ['x']})
+        finally:
+            shutil.rmtree(tmp)
+
+
+class ExportChangesTests(unittest.TestCase):
+    """ Testing Project.export_changes against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=20, longitudinal=True).start()
+        self.proj = Project(self.server.url, 'token')
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'hashes.gz')
+
+    def tearDown(self):
+        self.proj.close()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_changes(self):
+        first = self.proj.export_changes(self.path)
+        self.assertEqual(len(first.new), 20)
+        self.assertEqual(len(first.records), 40)
+        self.assertFalse(self.proj.export_changes(self.path))
+
+        self.proj.import_records([
+            {'study_id': '3', 'redcap_event_name': 'follow_up_arm_1',
+             'weight': '99'},
+            {'study_id': '21', 'redcap_event_name': 'baseline_arm_1',
+             'age': '40'}])
+        self.server.records = [r for r in self.server.records
+                               if r['study_id'] != '7']
+        changes = self.proj.export_changes(self.path)
+        self.assertEqual(changes.new, ['21'])
+        self.assertEqual(changes.changed, ['3'])
+        self.assertEqual(changes.deleted, ['7'])
+        self.assertEqual(changes.unchanged, 18)
+        self.assertEqual(sorted(r['study_id'] for r in changes.records),
+                         ['21', '3', '3'])
+
+    def test_unsaved(self):
+        changes = self.proj.export_changes(self.path, save=False)
+        self.assertFalse(os.path.exists(self.path))
+        changes.index.save(self.path)
+        self.assertFalse(self.proj.export_changes(self.path))
+
+    def test_scope(self):
+        self.proj.export_changes(self.path, fields=['age'])
+        with self.assertRaises(ValueError):
+            self.proj.export_changes(self.path, fields=['weight'])
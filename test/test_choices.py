@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap.choices import ChoiceMap, parse_choices, checkbox_column
+
+skip_pd = False
+try:
+    import pandas as pd
+except ImportError:
+    skip_pd = True
+
+
+METADATA = [
+    {'field_name': 'study_id', 'field_type': 'text',
+     'select_choices_or_calculations': ''},
+    {'field_name': 'sex', 'field_type': 'radio',
+     'select_choices_or_calculations': '0, Female | 1, Male'},
+    {'field_name': 'site', 'field_type': 'dropdown',
+     'select_choices_or_calculations': 'A, Nashville, TN | B, Boston, MA'},
+    {'field_name': 'consent', 'field_type': 'yesno',
+     'select_choices_or_calculations': ''},
+    {'field_name': 'color', 'field_type': 'checkbox',
+     'select_choices_or_calculations': '1, Red | 2, Blue'},
+    {'field_name': 'score', 'field_type': 'calc',
+     'select_choices_or_calculations': '[a] + [b]'},
+]
+
+
+class ChoiceMapTests(unittest.TestCase):
+    """ Testing ChoiceMap """
+
+    def setUp(self):
+        self.cmap = ChoiceMap(METADATA)
+        self.records = [
+            {'study_id': '1', 'sex': '1', 'site': 'A', 'consent': '0',
+             'color___1': '1', 'color___2': '0', 'score': '3'},
+            {'study_id': '2', 'sex': '0', 'site': 'B', 'consent': '1',
+             'color___1': '0', 'color___2': '1', 'score': ''},
+        ]
+
+    def test_parse_choices(self):
+        """Labels may contain commas"""
+        self.assertEqual(parse_choices('A, Nashville, TN | B, Boston'),
+                         [('A', 'Nashville, TN'), ('B', 'Boston')])
+        self.assertEqual(parse_choices(''), [])
+
+    def test_checkbox_column(self):
+        self.assertEqual(checkbox_column('color', '1'), 'color___1')
+        self.assertEqual(checkbox_column('color', 'A-b'), 'color___a_b')
+
+    def test_columns(self):
+        self.assertEqual(sorted(self.cmap.columns()),
+            ['color___1', 'color___2', 'consent', 'sex', 'site'])
+
+    def test_records_roundtrip(self):
+        """Records are labeled and translated back without modification"""
+        labeled = self.cmap.to_label(self.records)
+        self.assertEqual(labeled[0]['sex'], 'Male')
+        self.assertEqual(labeled[0]['site'], 'Nashville, TN')
+        self.assertEqual(labeled[0]['consent'], 'No')
+        self.assertEqual(labeled[0]['color___1'], 'Checked')
+        self.assertEqual(labeled[0]['color___2'], 'Unchecked')
+        self.assertEqual(labeled[0]['score'], '3')
+        self.assertEqual(self.records[0]['sex'], '1')
+        self.assertEqual(self.cmap.to_raw(labeled), self.records)
+
+    def test_checkbox_labels(self):
+        labeled = self.cmap.to_label(self.records, checkbox_labels=True)
+        self.assertEqual(labeled[0]['color___1'], 'Red')
+        self.assertEqual(labeled[0]['color___2'], '')
+        raw = self.cmap.to_raw(labeled, checkbox_labels=True)
+        self.assertEqual(raw, self.records)
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_df_to_label(self):
+        """Numeric columns inferred by read_csv are labeled as categoricals"""
+        df = pd.DataFrame({'sex': [1.0, 0.0, None], 'site': ['A', 'B', 'A'],
+                           'color___1': [1, 0, 1]})
+        labeled = self.cmap.to_label(df)
+        self.assertEqual(list(labeled['sex'].cat.categories),
+                         ['Female', 'Male'])
+        self.assertEqual(labeled['sex'][0], 'Male')
+        self.assertTrue(pd.isnull(labeled['sex'][2]))
+        self.assertEqual(list(labeled['site']),
+                         ['Nashville, TN', 'Boston, MA', 'Nashville, TN'])
+        self.assertEqual(list(labeled['color___1']),
+                         ['Checked', 'Unchecked', 'Checked'])
+        raw = self.cmap.to_raw(labeled)
+        self.assertEqual(list(raw['site']), ['A', 'B', 'A'])
+        self.assertEqual(list(raw['color___1']), ['1', '0', '1'])
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_categorize(self):
+        """Labeling a categorized frame only renames categories"""
+        df = pd.DataFrame({'sex': [1, 0, 1]})
+        cat = self.cmap.categorize(df)
+        self.assertEqual(list(cat['sex'].cat.codes), [1, 0, 1])
+        labeled = self.cmap.to_label(cat)
+        self.assertEqual(list(labeled['sex'].cat.codes), [1, 0, 1])
+        self.assertEqual(list(labeled['sex']), ['Male', 'Female', 'Male'])
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_df_unknown_codes(self):
+        """Codes missing from the metadata are kept, as with records"""
+        df = pd.DataFrame({'sex': [1, 3, 0], 'site': ['A', 'C', None]})
+        labeled = self.cmap.to_label(df)
+        self.assertEqual(list(labeled['sex']), ['Male', 3, 'Female'])
+        self.assertEqual(list(labeled['site'][:2]), ['Nashville, TN', 'C'])
+        self.assertTrue(pd.isnull(labeled['site'][2]))
+        self.assertEqual(list(self.cmap.to_raw(labeled)['sex']),
+                         ['1', 3, '0'])
+        self.assertEqual(list(self.cmap.categorize(df)['sex']), [1, 3, 0])
+        records = self.cmap.to_label([{'sex': '3'}])
+        self.assertEqual(records, [{'sex': '3'}])
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_df_checkbox_labels_unchecked(self):
+        """Unchecked boxes read as NaN by read_csv become '0'"""
+        df = pd.DataFrame({'color___1': ['Red', None],
+                           'color___2': [None, None]})
+        raw = self.cmap.to_raw(df, checkbox_labels=True)
+        self.assertEqual(list(raw['color___1']), ['1', '0'])
+        self.assertEqual(list(raw['color___2']), ['0', '0'])
+        labeled = self.cmap.to_label(
+            pd.DataFrame({'color___1': [1, 0]}), checkbox_labels=True)
+        labeled['color___1'] = labeled['color___1'].replace('', None)
+        self.assertEqual(
+            list(self.cmap.to_raw(labeled, checkbox_labels=True)
+                 ['color___1']), ['1', '0'])
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from requests.exceptions import ReadTimeout
+
+from redcap import (Project, RedcapError, CircuitBreaker, CircuitOpenError,
+                    server_health)
+from redcap.circuit import breaker_for, DEFAULT_TIMEOUT
+from stub_server import StubREDCap
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    """ Testing the CircuitBreaker state machine """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('http://redcap/api/', failures=3,
+                                      reset_after=0.1)
+
+    def fail(self, times):
+        for _ in range(times):
+            self.breaker.before()
+            self.breaker.failure('503 Service Unavailable')
+
+    def test_trips_after_consecutive_failures(self):
+        self.fail(2)
+        self.breaker.success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, 'closed')
+        self.fail(1)
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.breaker.before()
+        self.assertIn('503', str(cm.exception))
+        self.assertEqual(self.breaker.health()['rejected'], 1)
+
+    def test_half_open_probe(self):
+        self.fail(3)
+        time.sleep(0.12)
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.breaker.before()
+        # one probe at a time
+        self.assertRaises(CircuitOpenError, self.breaker.before)
+        self.breaker.failure('timeout')
+        self.assertEqual(self.breaker.state, 'open')
+        time.sleep(0.12)
+        self.breaker.before()
+        self.breaker.success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.breaker.consecutive_failures, 0)
+
+    def test_release_frees_probe(self):
+        self.fail(3)
+        time.sleep(0.12)
+        self.breaker.before()
+        self.breaker.release()
+        self.breaker.before()
+
+    def test_shared_per_url(self):
+        self.assertIs(breaker_for('http://shared/api/'),
+                      breaker_for('http://shared/api'))
+        self.assertIsNot(breaker_for('http://shared/api/'),
+                         breaker_for('http://other/api/'))
+
+
+class ProjectCircuitTests(unittest.TestCase):
+    """ Testing timeouts and circuit breakers of projects """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=5).start()
+        self.breaker = CircuitBreaker(self.server.url, failures=2,
+                                      reset_after=0.2)
+        self.project = Project(self.server.url, 'token', lazy=True,
+                               circuit_breaker=self.breaker)
+
+    def tearDown(self):
+        self.project.close()
+        self.server.stop()
+
+    def test_default_timeout(self):
+        self.assertEqual(self.project._kwargs()['timeout'], DEFAULT_TIMEOUT)
+        project = Project(self.server.url, 'token', lazy=True, timeout=None)
+        self.assertIsNone(project._kwargs()['timeout'])
+
+    def test_fail_fast_and_recover(self):
+        self.server.status = 503
+        for _ in range(2):
+            self.assertRaises(RedcapError, self.project.export_records)
+        sent = len(self.server.requests)
+        with self.assertRaises(CircuitOpenError):
+            self.project.export_records()
+        self.assertEqual(len(self.server.requests), sent)
+        self.server.status = None
+        time.sleep(0.25)
+        self.assertEqual(len(self.project.export_records()), 5)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_timeouts_count_as_failures(self):
+        self.server.delay = 0.3
+        project = Project(self.server.url, 'token', lazy=True, timeout=0.05,
+                          circuit_breaker=self.breaker)
+        for _ in range(2):
+            self.assertRaises(ReadTimeout, project.export_records)
+        self.assertRaises(CircuitOpenError, project.export_records)
+        self.assertIn('timed out', self.breaker.last_failure)
+
+    def test_client_errors_keep_circuit_closed(self):
+        for _ in range(3):
+            self.assertEqual(self.project.export_report('2'),
+                             {'error': 'unknown report 2'})
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_shared_between_projects(self):
+        first = Project(self.server.url, 'token', lazy=True)
+        second = Project(self.server.url, 'other token', lazy=True)
+        self.assertIs(first.breaker, second.breaker)
+        self.server.status = 500
+        for _ in range(5):
+            self.assertRaises(RedcapError, first.export_records)
+        self.assertRaises(CircuitOpenError, second.export_records)
+        health = server_health()[self.server.url]
+        self.assertEqual(health['state'], 'open')
+        self.assertEqual(health['failures'], 5)
+        first.breaker.reset()
+        self.server.status = None
+        self.assertTrue(second.export_records())
+
+    def test_disabled(self):
+        project = Project(self.server.url, 'token', lazy=True,
+                          circuit_breaker=False)
+        self.server.status = 503
+        for _ in range(6):
+            self.assertRaises(RedcapError, project.export_records)
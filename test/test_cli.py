@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from redcap import cli
+from stub_server import StubREDCap
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class CLITests(unittest.TestCase):
+    """ Testing the redcap command against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=7, longitudinal=True).start()
+        self.tmp = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def run_cli(self, *argv):
+        sys.stdout = io.StringIO()
+        try:
+            code = cli.main(list(argv) + ['--url', self.server.url,
+                                          '--token', 'token'])
+            return code, sys.stdout.getvalue()
+        finally:
+            sys.stdout = self.stdout
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def test_export_csv_batches(self):
+        code, _ = self.run_cli('export-records', '-o', self.path('r.csv'),
+                               '--batch-size', '3', '--workers', '2')
+        self.assertEqual(code, 0)
+        with io.open(self.path('r.csv'), encoding='utf-8') as fobj:
+            rows = list(csv.DictReader(fobj))
+        # one header, every row of every batch, in record order
+        self.assertEqual(len(rows), len(self.server.records))
+        self.assertEqual(rows[0]['study_id'], '1')
+        self.assertEqual(rows[-1]['study_id'], '7')
+        batches = [pl for pl in self.server.contents('record')
+                   if pl.get('records')]
+        self.assertEqual(len(batches), 3)
+
+    def test_export_jsonl_to_stdout(self):
+        code, out = self.run_cli('export-records', '--format', 'jsonl',
+                                 '--fields', 'study_id,age',
+                                 '--events', 'baseline_arm_1')
+        self.assertEqual(code, 0)
+        rows = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual(set(rows[0]), set(['study_id', 'redcap_event_name',
+                                            'age']))
+
+    def test_export_jsonl_split(self):
+        code, _ = self.run_cli('export-records', '--format', 'jsonl',
+                               '--fields', 'study_id', '--max-bytes', '200',
+                               '-o', self.path('r.jsonl'))
+        self.assertEqual(code, 0)
+        parts = sorted(p for p in os.listdir(self.tmp) if p.endswith('.jsonl'))
+        self.assertTrue(len(parts) > 1)
+        for name in parts:
+            self.assertLessEqual(os.path.getsize(self.path(name)), 200)
+
+    def test_export_json(self):
+        code, out = self.run_cli('export-records', '--format', 'json',
+                                 '--batch-size', '2', '--records', '1,2,3')
+        self.assertEqual(code, 0)
+        rows = json.loads(out)
+        self.assertEqual(sorted(set(r['study_id'] for r in rows)),
+                         ['1', '2', '3'])
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow not installed')
+    def test_export_parquet(self):
+        import pandas as pd
+        self.run_cli('export-records', '--format', 'parquet',
+                     '-o', self.path('r.parquet'))
+        df = pd.read_parquet(self.path('r.parquet'))
+        self.assertEqual(len(df), len(self.server.records))
+
+    def test_import_roundtrip(self):
+        with io.open(self.path('in.jsonl'), 'w', encoding='utf-8') as fobj:
+            for i in range(20, 25):
+                fobj.write(u'{"study_id": "%d", "redcap_event_name": '
+                           u'"baseline_arm_1", "age": "40"}\n' % i)
+        code, out = self.run_cli('import-records', self.path('in.jsonl'),
+                                 '--batch-size', '2', '--workers', '2')
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(out), {'count': 5})
+        self.assertEqual(len(self.server.contents('record')), 3)
+        self.assertIn('24', [r['study_id'] for r in self.server.records])
+
+    def test_export_files(self):
+        self.server.records[0]['file'] = 'a.txt'
+        self.server.files[('1', 'file', 'baseline_arm_1')] = ('a.txt', b'A')
+        code, out = self.run_cli('export-files', '--field', 'file',
+                                 '-d', self.path('files'))
+        self.assertEqual(code, 0)
+        path = self.path(os.path.join('files', '1_baseline_arm_1_a.txt'))
+        self.assertEqual(out.strip(), path)
+        with open(path, 'rb') as fobj:
+            self.assertEqual(fobj.read(), b'A')
+
+    def test_export_metadata(self):
+        code, out = self.run_cli('export-metadata', '--format', 'json')
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(out), self.server.metadata)
+
+    def test_errors_exit_nonzero(self):
+        code, _ = self.run_cli('export-files', '--field', 'file',
+                               '--records', '1', '-d', self.path('files'))
+        self.assertEqual(code, 0)
+        self.server.records[0]['file'] = 'missing.txt'
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            code, _ = self.run_cli('export-files', '--field', 'file',
+                                   '-d', self.path('files'))
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(code, 1)
+
+    def test_deadline(self):
+        self.server.delay = 0.3
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            code, _ = self.run_cli('export-records', '-o', self.path('r.csv'),
+                                   '--batch-size', '2', '--deadline', '0.5')
+            message = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(code, 1)
+        self.assertIn('deadline', message)
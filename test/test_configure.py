@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from redcap import Project
+from stub_server import StubREDCap
+
+
+class LazyConfigureTests(unittest.TestCase):
+    """ Testing on-demand loading of project attributes """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=3, longitudinal=True).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def contents(self):
+        return [r['payload']['content'] for r in self.server.requests]
+
+    def test_lazy_nothing_exported(self):
+        Project(self.server.url, 'token', lazy=True)
+        self.assertEqual(self.server.requests, [])
+
+    def test_lazy_metadata_only(self):
+        proj = Project(self.server.url, 'token', lazy=True)
+        self.assertEqual(proj.def_field, 'study_id')
+        self.assertEqual(proj.field_names[-1], 'file')
+        self.assertEqual(sorted(proj.forms), ['demographics', 'vitals'])
+        self.assertEqual(self.contents(), ['metadata'])
+        self.assertFalse(proj.configured)
+
+    def test_lazy_export_records(self):
+        proj = Project(self.server.url, 'token', lazy=True)
+        records = proj.export_records(fields=['age'])
+        self.assertEqual(len(records), 6)
+        self.assertEqual(self.contents(), ['metadata', 'record'])
+
+    def test_lazy_longitudinal(self):
+        proj = Project(self.server.url, 'token', lazy=True)
+        self.assertTrue(proj.is_longitudinal())
+        self.assertEqual(sorted(self.contents()), ['arm', 'event'])
+        self.assertEqual(proj.arm_names, ('Arm 1',))
+        self.assertEqual(len(self.contents()), 2)
+
+    def test_assignment_wins(self):
+        proj = Project(self.server.url, 'token', lazy=True)
+        proj.metadata = [{'field_name': 'pid', 'form_name': 'f',
+                          'field_label': 'PID'}]
+        self.assertEqual(proj.def_field, 'pid')
+        self.assertEqual(self.server.requests, [])
+
+    def test_configure_concurrent(self):
+        self.server.delay = 0.1
+        start = time.time()
+        proj = Project(self.server.url, 'token')
+        elapsed = time.time() - start
+        self.assertTrue(proj.configured)
+        self.assertEqual(sorted(self.contents()), ['arm', 'event', 'metadata',
+                                                   'project', 'version'])
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLess(elapsed, 0.4)
+        self.assertEqual(proj.project_info['project_title'], 'Stub')
+        self.assertEqual(str(proj.redcap_version), '6.5.0')
+
+    def test_configure_serial(self):
+        Project(self.server.url, 'token', lazy=True).configure(workers=1)
+        self.assertEqual(self.server.max_in_flight, 1)
+        self.assertEqual(len(self.server.requests), 5)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from redcap import Project, Deadline, DeadlineExceeded, CircuitBreaker
+from redcap.deadlines import current_deadline
+from stub_server import StubREDCap
+
+
+class DeadlineTests(unittest.TestCase):
+    """ Testing Deadline """
+
+    def test_timeouts_cut_to_time_left(self):
+        deadline = Deadline(2)
+        self.assertLessEqual(deadline.timeout(None), 2)
+        self.assertEqual(deadline.timeout(1), 1)
+        connect, read = deadline.timeout((1, 300))
+        self.assertEqual(connect, 1)
+        self.assertLessEqual(read, 2)
+
+    def test_nested_deadlines(self):
+        self.assertIsNone(current_deadline())
+        with Deadline(10) as outer:
+            self.assertIs(current_deadline(), outer)
+            with Deadline(20):
+                self.assertIs(current_deadline(), outer)
+            inner = Deadline(1)
+            self.assertIs(current_deadline(inner), inner)
+        self.assertIsNone(current_deadline())
+        self.assertEqual(current_deadline(5).seconds, 5)
+
+    def test_check(self):
+        deadline = Deadline(0)
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded) as cm:
+            deadline.check('export', partial=[1], cursor=['2'])
+        self.assertEqual(cm.exception.partial, [1])
+        self.assertEqual(cm.exception.cursor, ['2'])
+
+
+class ProjectDeadlineTests(unittest.TestCase):
+    """ Testing deadlines of project operations against a slow stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=10, longitudinal=True).start()
+        self.breaker = CircuitBreaker(self.server.url)
+        self.project = Project(self.server.url, 'token',
+                               circuit_breaker=self.breaker)
+        self.ids = [str(i) for i in range(1, 11)]
+
+    def tearDown(self):
+        self.project.close()
+        self.server.stop()
+
+    def test_single_request(self):
+        self.server.delay = 0.5
+        start = time.time()
+        with self.assertRaises(DeadlineExceeded) as cm:
+            with Deadline(0.1):
+                self.project.export_records()
+        self.assertLess(time.time() - start, 0.4)
+        self.assertIsNone(cm.exception.cursor)
+        # timing out at the deadline isn't the server's failure
+        self.assertEqual(self.breaker.total_failures, 0)
+
+    def test_expired_deadline_sends_nothing(self):
+        sent = len(self.server.requests)
+        self.assertRaises(DeadlineExceeded, self.project.export_pdf,
+                          deadline=Deadline(0))
+        self.assertEqual(len(self.server.requests), sent)
+
+    def test_batched_export_resumes(self):
+        self.server.delay = 0.3
+        start = time.time()
+        with self.assertRaises(DeadlineExceeded) as cm:
+            self.project.export_records(records=self.ids, batch_size=2,
+                                        deadline=0.5)
+        self.assertLess(time.time() - start, 0.8)
+        done, left = cm.exception.partial, cm.exception.cursor
+        self.assertTrue(done)
+        self.assertTrue(left)
+        # batches not started by the deadline were never sent
+        self.assertLess(len(self.server.contents('record')), 5)
+        self.server.delay = 0
+        rest = self.project.export_records(records=left, batch_size=2)
+        self.assertEqual(sorted(set(r['study_id'] for r in done + rest),
+                                key=int), self.ids)
+
+    def test_sink_export(self):
+        rows = []
+
+        class Sink(object):
+            def write(self, row):
+                rows.append(row)
+
+        self.server.delay = 0.3
+        with self.assertRaises(DeadlineExceeded) as cm:
+            self.project.export_records(records=self.ids, batch_size=4,
+                                        sink=Sink(), deadline=0.5)
+        self.assertEqual(cm.exception.partial, len(rows))
+        self.assertEqual(cm.exception.cursor, self.ids[4:])
+
+    def test_split_by_form(self):
+        # the form-event mapping is exported before the delay
+        self.project.longitudinal_index.forms_in('baseline_arm_1')
+        self.server.delay = 0.3
+        with self.assertRaises(DeadlineExceeded) as cm:
+            self.project.export_records(split_by='form', deadline=0.5)
+        self.assertTrue(cm.exception.partial)
+        self.assertTrue(set(cm.exception.cursor) <=
+                        set(self.server.form_names()))
+
+    def test_iter_report_checks_between_rows(self):
+        rows = 0
+        with self.assertRaises(DeadlineExceeded) as cm:
+            for row in self.project.iter_report('1', deadline=0.2):
+                rows += 1
+                time.sleep(0.1)
+        self.assertEqual(cm.exception.partial, rows)
+        self.assertLess(rows, 10)
+
+    def test_no_deadline(self):
+        self.assertEqual(len(self.project.export_records(
+            records=self.ids, batch_size=3, workers=2)), 20)
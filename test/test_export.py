@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap import Project
+from stub_server import StubREDCap
+
+skip_pd = False
+try:
+    import pandas as pd
+except ImportError:
+    skip_pd = True
+
+
+class SplitExportTests(unittest.TestCase):
+    """ Testing export_records(split_by='form') against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=5).start()
+        self.long_server = StubREDCap(n_records=5, longitudinal=True).start()
+        self.proj = Project(self.server.url, 'token')
+        self.long_proj = Project(self.long_server.url, 'token')
+
+    def tearDown(self):
+        self.server.stop()
+        self.long_server.stop()
+
+    def record_requests(self, server):
+        return [pl for pl in server.contents('record') if 'data' not in pl]
+
+    def test_split_matches_single_export(self):
+        full = self.proj.export_records(forms=['demographics', 'vitals'])
+        split = self.proj.export_records(split_by='form', workers=2)
+        self.assertEqual(split, full)
+        forms = [pl.get('forms') for pl in self.record_requests(self.server)]
+        self.assertEqual(sorted(forms[1:]), ['demographics', 'vitals'])
+
+    def test_split_fields(self):
+        """Only the forms of the requested fields are exported"""
+        records = self.proj.export_records(fields=['weight'],
+                                           split_by='form')
+        self.assertEqual(records[0], {'study_id': '1', 'weight': '61'})
+        last = self.record_requests(self.server)[-1]
+        self.assertEqual(last['fields'], 'study_id,weight')
+        self.assertNotIn('forms', last)
+
+    def test_split_longitudinal_events(self):
+        """Forms are only requested for the events they're mapped to"""
+        full = self.long_proj.export_records(forms=['demographics',
+                                                    'vitals'])
+        split = self.long_proj.export_records(split_by='form', workers=2)
+        key = lambda r: (r['study_id'], r['redcap_event_name'])
+        self.assertEqual(sorted(split, key=key), sorted(full, key=key))
+        parts = self.record_requests(self.long_server)[1:]
+        events = dict((pl['forms'], pl['events']) for pl in parts)
+        self.assertEqual(events, {
+            'demographics': 'baseline_arm_1',
+            'vitals': 'baseline_arm_1,follow_up_arm_1'})
+
+    def test_split_csv(self):
+        csv = self.proj.export_records(format='csv', split_by='form')
+        header = csv.splitlines()[0].split(',')
+        self.assertEqual(header[0], 'study_id')
+        self.assertIn('weight', header)
+        self.assertEqual(len(csv.splitlines()), 6)
+
+    def test_split_bad_args(self):
+        with self.assertRaises(ValueError):
+            self.proj.export_records(split_by='record')
+        with self.assertRaises(ValueError):
+            self.proj.export_records(format='xml', split_by='form')
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_split_df(self):
+        df = self.long_proj.export_records(format='df', split_by='form',
+                                           workers=2)
+        self.assertEqual(df.index.names, ['study_id', 'redcap_event_name'])
+        self.assertEqual(len(df), 10)
+        self.assertEqual(df.loc[(1, 'follow_up_arm_1'), 'weight'], 61)
+        self.assertTrue(pd.isnull(df.loc[(1, 'follow_up_arm_1'), 'age']))
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_split_df_shared_columns(self):
+        """Columns exported with every form are joined once"""
+        for proj in (self.proj, self.long_proj):
+            full = proj.export_records(format='df',
+                                       export_data_access_groups=True)
+            df = proj.export_records(format='df', split_by='form',
+                                     export_data_access_groups=True)
+            self.assertEqual(list(df['redcap_data_access_group']),
+                             list(full['redcap_data_access_group']))
+            self.assertEqual(sorted(df.columns), sorted(full.columns))
+        records = self.proj.export_records(split_by='form',
+                                           export_data_access_groups=True)
+        self.assertEqual(records[1]['redcap_data_access_group'], 'site_b')
+
+
+class BackfillTests(unittest.TestCase):
+    """ Testing the fields & forms sent by export_records """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=2).start()
+        self.proj = Project(self.server.url, 'token')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_all_fields(self):
+        """Nothing is sent when everything is wanted"""
+        self.assertEqual(self.proj._shortest_request(None, None),
+                         (None, None))
+        every = self.proj.field_names + ['demographics_complete',
+                                         'vitals_complete']
+        self.assertEqual(self.proj._shortest_request(every, None),
+                         (None, None))
+        self.proj.export_records()
+        last = self.server.contents('record')[-1]
+        self.assertNotIn('fields', last)
+        self.assertNotIn('forms', last)
+
+    def test_forms(self):
+        """def_field is only added when its form isn't requested"""
+        self.assertEqual(self.proj._shortest_request(None, ['vitals']),
+                         (['study_id'], ['vitals']))
+        self.assertEqual(self.proj._shortest_request(None, ['demographics']),
+                         (None, ['demographics']))
+
+    def test_fields(self):
+        self.assertEqual(self.proj._shortest_request(['age', 'age'], None),
+                         (['age', 'study_id'], None))
+        self.assertEqual(
+            self.proj._shortest_request(['study_id', 'age'], None),
+            (['study_id', 'age'], None))
+
+    def test_backfill_fields(self):
+        """The public helper still returns a list of fields"""
+        self.assertEqual(self.proj.backfill_fields(None, ['vitals']),
+                         ['study_id'])
+        self.assertEqual(self.proj.backfill_fields(['age'], None),
+                         ['age', 'study_id'])
+        self.assertEqual(self.proj.backfill_fields(None, None),
+                         self.proj.field_names)
+
+    def test_collapse_forms(self):
+        """Fields making up a whole form are requested as that form"""
+        fields = ['weight', 'height', 'file', 'vitals_complete', 'age']
+        self.assertEqual(self.proj._shortest_request(fields, None),
+                         (['age', 'study_id'], ['vitals']))
+        # Without the _complete field it's not the same request
+        self.assertEqual(self.proj._shortest_request(fields[:3], None),
+                         (['weight', 'height', 'file', 'study_id'], None))
+        self.assertEqual(
+            self.proj._shortest_request(['weight', 'weight'], ['vitals']),
+            (['study_id'], ['vitals']))
+
+
+class BatchedExportTests(unittest.TestCase):
+    """ Testing export_records(batch_size=...) """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=7, longitudinal=True).start()
+        self.proj = Project(self.server.url, 'token')
+
+    def tearDown(self):
+        self.server.stop()
+
+    def batches(self):
+        return [pl['records'] for pl in self.server.contents('record')
+                if 'records' in pl]
+
+    def test_batched_json(self):
+        full = self.proj.export_records()
+        batched = self.proj.export_records(batch_size=3, workers=2)
+        self.assertEqual(batched, full)
+        self.assertEqual(sorted(self.batches()), ['1,2,3', '4,5,6', '7'])
+
+    def test_batched_records(self):
+        batched = self.proj.export_records(records=['2', '5', '6'],
+                                           batch_size=2)
+        self.assertEqual(len(batched), 6)
+        self.assertEqual(self.batches(), ['2,5', '6'])
+
+    def test_batched_csv(self):
+        full = self.proj.export_records(format='csv')
+        batched = self.proj.export_records(format='csv', batch_size=3)
+        self.assertEqual(batched, full)
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_batched_df(self):
+        full = self.proj.export_records(format='df')
+        for decode_workers in (None, 2):
+            batched = self.proj.export_records(format='df', batch_size=3,
+                workers=2, decode_workers=decode_workers)
+            self.assertTrue(batched.equals(full))
+            self.assertEqual(batched.index.names,
+                             ['study_id', 'redcap_event_name'])
+
+    def test_batched_bad_args(self):
+        with self.assertRaises(ValueError):
+            self.proj.export_records(batch_size=2, split_by='form')
+        with self.assertRaises(ValueError):
+            self.proj.export_records(batch_size=2, format='xml')
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+import unittest
+
+from redcap.optional import OptionalFunction, OptionalModule
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LazyImportTests(unittest.TestCase):
+    """ Testing that optional dependencies are imported on first use """
+
+    def run_python(self, code):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            [ROOT, os.path.join(ROOT, 'test')]))
+        out = subprocess.check_output([sys.executable, '-c', code], env=env)
+        return out.decode('utf-8').split()
+
+    def test_import_redcap_skips_pandas(self):
+        out = self.run_python('import sys, redcap; '
+                              'print("pandas" in sys.modules, '
+                              '"numpy" in sys.modules)')
+        self.assertEqual(out, ['False', 'False'])
+
+    def test_exports_skip_pandas(self):
+        out = self.run_python(
+            'import sys; from redcap import Project; '
+            'from stub_server import StubREDCap; '
+            'server = StubREDCap(n_records=3).start(); '
+            'project = Project(server.url, "token", lazy=True); '
+            'records = project.export_records(format="json"); '
+            'csv = project.export_records(format="csv"); '
+            'server.stop(); '
+            'print("pandas" in sys.modules, len(records))')
+        self.assertEqual(out, ['False', '3'])
+
+    def test_df_imports_pandas(self):
+        out = self.run_python(
+            'import sys; from redcap import project; '
+            'df = project._read_csv_bytes(b"a,b\\n1,2\\n", {}); '
+            'print("pandas" in sys.modules, len(df))')
+        self.assertEqual(out, ['True', '1'])
+
+    def test_missing_module(self):
+        missing = OptionalModule('redcap_no_such_module')
+        self.assertFalse(missing)
+        func = OptionalFunction(missing, 'read_csv')
+        self.assertFalse(func)
+        with self.assertRaises(ImportError):
+            func('data.csv')
+
+    def test_present_module(self):
+        json = OptionalModule('json')
+        self.assertTrue(json)
+        self.assertEqual(OptionalFunction(json, 'loads')('[1]'), [1])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap import Project, LongitudinalIndex
+from stub_server import StubREDCap
+
+
+EVENTS = [
+    {'event_name': 'Baseline', 'arm_num': 1,
+     'unique_event_name': 'baseline_arm_1'},
+    {'event_name': 'Follow Up', 'arm_num': 1,
+     'unique_event_name': 'follow_up_arm_1'},
+    {'event_name': 'Baseline', 'arm_num': 2,
+     'unique_event_name': 'baseline_arm_2'},
+]
+
+FEM = [
+    {'unique_event_name': 'baseline_arm_1', 'form': 'demographics'},
+    {'unique_event_name': 'baseline_arm_1', 'form': 'vitals'},
+    {'unique_event_name': 'follow_up_arm_1', 'form': 'vitals'},
+    {'unique_event_name': 'baseline_arm_2', 'form': 'demographics'},
+]
+
+
+class LongitudinalIndexTests(unittest.TestCase):
+    """ Testing LongitudinalIndex """
+
+    def setUp(self):
+        self.calls = 0
+
+        def fem():
+            self.calls += 1
+            return FEM
+
+        self.index = LongitudinalIndex(EVENTS, (1, 2), ('Drug', 'Placebo'),
+                                       fem=fem)
+
+    def test_arms_and_events(self):
+        self.assertTrue(self.index)
+        self.assertEqual(self.index.events_in(1),
+                         ['baseline_arm_1', 'follow_up_arm_1'])
+        self.assertEqual(self.index.events_in('2'), ['baseline_arm_2'])
+        self.assertEqual(len(self.index.events_in()), 3)
+        self.assertEqual(self.index.arm_of('baseline_arm_2'), '2')
+        self.assertEqual(self.index.labels['follow_up_arm_1'], 'Follow Up')
+        self.assertEqual(self.index.arms, {'1': 'Drug', '2': 'Placebo'})
+
+    def test_unique_names(self):
+        self.assertEqual(self.index.unique_name('Follow Up'),
+                         'follow_up_arm_1')
+        self.assertEqual(self.index.unique_name('Baseline (Arm 1: Drug)'),
+                         'baseline_arm_1')
+        self.assertEqual(self.index.unique_name('baseline_arm_2'),
+                         'baseline_arm_2')
+        self.assertEqual(self.index.unique_name('unknown'), 'unknown')
+
+    def test_forms_fetched_once(self):
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.index.forms_in('baseline_arm_1'),
+                         ['demographics', 'vitals'])
+        self.assertEqual(self.index.events_of('demographics'),
+                         ['baseline_arm_1', 'baseline_arm_2'])
+        self.assertEqual(self.index.events_of('vitals', ['follow_up_arm_1']),
+                         ['follow_up_arm_1'])
+        self.assertEqual(self.calls, 1)
+
+    def test_classic(self):
+        index = LongitudinalIndex([])
+        self.assertFalse(index)
+        self.assertEqual(index.forms_in('anything'), [])
+
+
+class ProjectLongitudinalIndexTests(unittest.TestCase):
+    """ Testing Project.longitudinal_index against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=4, longitudinal=True).start()
+        self.proj = Project(self.server.url, 'token')
+
+    def tearDown(self):
+        self.proj.close()
+        self.server.stop()
+
+    def test_no_extra_requests(self):
+        sent = len(self.server.requests)
+        for _ in range(3):
+            self.assertTrue(self.proj.is_longitudinal())
+        self.assertEqual(len(self.server.requests), sent)
+        self.proj.export_records(split_by='form')
+        self.proj.export_records(split_by='form', format='csv')
+        self.assertEqual(len(self.server.contents('formEventMapping')), 1)
+        self.assertEqual(self.proj.longitudinal_index.forms_in(
+            'follow_up_arm_1'), ['vitals'])
+
+    def test_structure_changes_reload(self):
+        index = self.proj.longitudinal_index
+        self.proj.import_fem([{'arm_num': '1', 'form': 'vitals',
+                               'unique_event_name': 'baseline_arm_1'}])
+        self.assertIsNot(self.proj.longitudinal_index, index)
+        events = len(self.server.contents('event'))
+        self.proj.import_events([{'event_name': 'Visit', 'arm_num': '1'}])
+        self.assertTrue(self.proj.is_longitudinal())
+        self.assertEqual(len(self.server.contents('event')), events + 2)
+
+    def test_classic_project(self):
+        server = StubREDCap(n_records=2).start()
+        proj = Project(server.url, 'token')
+        try:
+            self.assertFalse(proj.is_longitudinal())
+            self.assertFalse(proj.longitudinal_index)
+            proj.export_records(split_by='form')
+            self.assertEqual(server.contents('formEventMapping'), [])
+        finally:
+            proj.close()
+            server.stop()
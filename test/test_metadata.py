@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap import Project, ProjectPool, MetadataDiff
+from stub_server import StubREDCap, METADATA
+
+
+class MetadataDiffTests(unittest.TestCase):
+    """ Testing MetadataDiff """
+
+    def setUp(self):
+        self.old = [dict(m) for m in METADATA]
+
+    def test_no_changes(self):
+        new = [dict(m) for m in METADATA]
+        # missing and padded attributes don't count as changes
+        del new[0]['select_choices_or_calculations']
+        new[1]['field_label'] = ' Age '
+        diff = MetadataDiff(self.old, new)
+        self.assertFalse(diff)
+        self.assertEqual(diff.summary(), 'no changes')
+
+    def test_changes(self):
+        new = [dict(m) for m in METADATA if m['field_name'] != 'height']
+        new[1]['field_label'] = 'Age (years)'
+        new.append({'field_name': 'bmi', 'form_name': 'vitals',
+                    'field_type': 'calc', 'field_label': 'BMI'})
+        diff = MetadataDiff(self.old, new)
+        self.assertTrue(diff)
+        self.assertEqual(diff.added, ['bmi'])
+        self.assertEqual(diff.removed, ['height'])
+        self.assertEqual(diff.changed,
+                         {'age': {'field_label': ('Age', 'Age (years)')}})
+        self.assertFalse(diff.reordered)
+        self.assertEqual(diff.new[-1]['select_choices_or_calculations'], '')
+
+    def test_reordered(self):
+        new = [self.old[0], self.old[2], self.old[1]] + self.old[3:]
+        diff = MetadataDiff(self.old, new)
+        self.assertTrue(diff.reordered)
+        self.assertEqual(diff.summary(), 'fields reordered')
+
+
+class PushMetadataTests(unittest.TestCase):
+    """ Testing Project.push_metadata against local stubs """
+
+    def setUp(self):
+        self.servers = [StubREDCap(n_records=2).start() for _ in range(3)]
+        self.proj = Project(self.servers[0].url, 'token')
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def imports(self, server):
+        return [pl for pl in server.contents('metadata') if 'data' in pl]
+
+    def test_unchanged_not_imported(self):
+        diff = self.proj.push_metadata([dict(m) for m in METADATA])
+        self.assertFalse(diff)
+        self.assertEqual(self.imports(self.servers[0]), [])
+        self.proj.push_metadata(self.proj.metadata, force=True)
+        self.assertEqual(len(self.imports(self.servers[0])), 1)
+
+    def test_push_refreshes_index(self):
+        new = [dict(m) for m in METADATA]
+        new.append({'field_name': 'bmi', 'form_name': 'labs',
+                    'field_type': 'calc', 'field_label': 'BMI'})
+        requests = len(self.servers[0].requests)
+        labels = self.proj.choice_map()
+        diff = self.proj.push_metadata(new)
+        self.assertEqual(diff.added, ['bmi'])
+        # one import, no re-export
+        self.assertEqual(len(self.servers[0].requests), requests + 1)
+        self.assertEqual(self.servers[0].metadata[-1]['field_name'], 'bmi')
+        self.assertEqual(self.proj.field_names[-1], 'bmi')
+        self.assertEqual(self.proj.field_labels[-1], 'BMI')
+        self.assertIn('labs', self.proj.forms)
+        self.assertIsNot(self.proj.choice_map(), labels)
+
+    def test_pool_push(self):
+        new = [dict(m) for m in METADATA]
+        new[1]['field_label'] = 'Age (years)'
+        self.servers[1].metadata[1]['field_label'] = 'Age (years)'
+        creds = [(s.url, 'token') for s in self.servers]
+        with ProjectPool(creds) as pool:
+            results = pool.map('push_metadata', new, raise_errors=True)
+        self.assertEqual([bool(r.result) for r in results],
+                         [True, False, True])
+        self.assertEqual([len(self.imports(s)) for s in self.servers],
+                         [1, 0, 1])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap import ProjectPool, PoolError
+from redcap.pool import server_of
+from stub_server import StubREDCap
+
+
+class ProjectPoolTests(unittest.TestCase):
+    """ Testing ProjectPool against local stub servers """
+
+    def setUp(self):
+        self.servers = [StubREDCap(n_records=3, delay=0.02).start()
+                        for _ in range(2)]
+        self.creds = [(s.url, 'token%d' % i, 'p%d%d' % (n, i))
+                      for n, s in enumerate(self.servers) for i in range(4)]
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def test_configure_and_map(self):
+        with ProjectPool(self.creds, per_server=2) as pool:
+            self.assertEqual(len(pool), 8)
+            self.assertTrue(all(p.configured for p in pool))
+            self.assertEqual(len(pool.servers()), 2)
+            results = pool.map('export_records', fields=['age'])
+        self.assertEqual([r.project.name for r in results],
+                         [c[2] for c in self.creds])
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertEqual(len(result.result), 3)
+        for server in self.servers:
+            self.assertLessEqual(server.max_in_flight, 2)
+
+    def test_per_server_limits(self):
+        limits = {server_of(self.servers[0].url): 1}
+        pool = ProjectPool(self.creds, per_server=limits)
+        pool.close()
+        self.assertEqual(self.servers[0].max_in_flight, 1)
+
+    def test_streaming_and_progress(self):
+        seen = []
+        pool = ProjectPool(self.creds, per_server=4, configure=False,
+                           progress=lambda done, total, r: seen.append(
+                               (done, total)))
+        names = [r.project.name for r in pool.imap(lambda p: p.token)]
+        pool.close()
+        self.assertEqual(sorted(names), sorted(c[2] for c in self.creds))
+        self.assertEqual(seen[-1], (8, 8))
+
+    def test_limit_per_request(self):
+        """Operations sending requests in parallel share the limit"""
+        with ProjectPool(self.creds[:4], per_server=2) as pool:
+            results = pool.map('export_records', batch_size=1, workers=3)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertLessEqual(self.servers[0].max_in_flight, 2)
+
+    def test_error_aggregation(self):
+        creds = self.creds[:2] + [('http://127.0.0.1:1/api/', 'bad', 'dead')]
+        with ProjectPool(creds) as pool:
+            self.assertEqual([p.name for p in pool], ['p00', 'p01'])
+            self.assertEqual([r.project.name for r in pool.errors],
+                             ['dead'])
+            self.assertTrue(all(r.ok for r in pool.map('export_records')))
+        with self.assertRaises(PoolError) as cm:
+            ProjectPool(creds, raise_errors=True)
+        self.assertEqual([r.project.name for r in cm.exception.errors],
+                         ['dead'])
+        pool = ProjectPool(creds, configure=False)
+        results = pool.map('configure')
+        pool.close()
+        self.assertEqual([r.ok for r in results], [True, True, False])
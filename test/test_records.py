@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap import Project, RecordIndex
+from stub_server import StubREDCap
+
+
+class RecordIndexTests(unittest.TestCase):
+    """ Testing RecordIndex """
+
+    def setUp(self):
+        self.index = RecordIndex([('10', 'a'), ('2', 'a'), ('2', 'b'),
+                                  ('2', 'b'), ('x-1', 'b')])
+
+    def test_sorted(self):
+        self.assertEqual(self.index.ids, ('2', '10', 'x-1'))
+        self.assertEqual(list(self.index), ['2', '10', 'x-1'])
+        self.assertEqual(len(self.index), 3)
+        self.assertIn('10', self.index)
+        self.assertNotIn('1', self.index)
+
+    def test_events(self):
+        self.assertEqual(self.index.events['2'], ('a', 'b'))
+        self.assertEqual(self.index.records_in('b'), ['2', 'x-1'])
+        self.assertEqual(self.index.pairs(), [('2', 'a'), ('2', 'b'),
+                                              ('10', 'a'), ('x-1', 'b')])
+
+    def test_batches_and_diff(self):
+        self.assertEqual(self.index.batches(2), [['2', '10'], ['x-1']])
+        added, removed = self.index.diff(['2', '3', 'x-1'])
+        self.assertEqual((added, removed), (['3'], ['10']))
+
+    def test_from_csv(self):
+        index = RecordIndex.from_csv('study_id\n1\n2\n1\n', 'study_id')
+        self.assertEqual(index.ids, ('1', '2'))
+        self.assertEqual(index.pairs(), [])
+        self.assertEqual(len(RecordIndex.from_csv('', 'study_id')), 0)
+
+
+class ProjectRecordIdsTests(unittest.TestCase):
+    """ Testing Project.record_ids against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=12, longitudinal=True).start()
+        self.proj = Project(self.server.url, 'token')
+
+    def tearDown(self):
+        self.proj.close()
+        self.server.stop()
+
+    def test_record_ids(self):
+        index = self.proj.record_ids()
+        self.assertEqual(index.ids, tuple(str(i) for i in range(1, 13)))
+        self.assertEqual(index.events['1'],
+                         ('baseline_arm_1', 'follow_up_arm_1'))
+        pl = self.server.contents('record')[-1]
+        self.assertEqual((pl['format'], pl['fields'], pl['eventName']),
+                         ('csv', 'study_id', 'unique'))
+
+    def test_cached_until_import(self):
+        index = self.proj.record_ids()
+        self.assertIs(self.proj.record_ids(), index)
+        self.assertEqual(len(self.server.contents('record')), 1)
+        self.proj.import_records([{'study_id': '13',
+                                   'redcap_event_name': 'baseline_arm_1'}])
+        self.assertIn('13', self.proj.record_ids())
+        self.assertIsNot(self.proj.record_ids(refresh=True), index)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from redcap import Project, Replicator, RedcapError
+from stub_server import StubREDCap
+
+
+class ReplicatorTests(unittest.TestCase):
+    """ Testing Replicator between two local stubs """
+
+    def setUp(self):
+        self.source = StubREDCap(n_records=25)
+        self.source.metadata.append({
+            'field_name': 'visit', 'form_name': 'vitals',
+            'field_type': 'text', 'field_label': 'Visit',
+            'select_choices_or_calculations': '',
+            'text_validation_type_or_show_slider_number': 'datetime_ymd'})
+        for i, row in enumerate(self.source.records):
+            row['visit'] = '2014-02-%02d 10:30' % (i + 1)
+        self.source.start()
+        self.target = StubREDCap(n_records=0).start()
+        self.src = Project(self.source.url, 'token')
+        self.dst = Project(self.target.url, 'token')
+        self.tmp = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmp, 'copy.json')
+
+    def tearDown(self):
+        self.source.stop()
+        self.target.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_copy(self):
+        rep = Replicator(self.src, self.dst, batch_size=10, workers=2,
+                         checkpoint=self.checkpoint)
+        summary = rep.run()
+        self.assertEqual(summary, {'records': 25, 'skipped': 0,
+                                   'chunks': 3, 'count': 25})
+        key = lambda r: int(r['study_id'])
+        self.assertEqual(sorted(self.target.records, key=key),
+                         sorted(self.source.records, key=key))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_transform(self):
+        rep = Replicator(self.src, self.dst, batch_size=10,
+                         field_map={'weight': 'weight_kg'}, drop=['age'],
+                         date_shift=lambda record: -int(record))
+        rep.run(records=['1', '3'])
+        rows = dict((r['study_id'], r) for r in self.target.records)
+        self.assertEqual(sorted(rows), ['1', '3'])
+        self.assertNotIn('age', rows['1'])
+        self.assertNotIn('weight', rows['1'])
+        self.assertEqual(rows['1']['weight_kg'], '61')
+        self.assertEqual(rows['1']['visit'], '2014-01-31 10:30')
+        self.assertEqual(rows['3']['visit'], '2014-01-31 10:30')
+
+    def test_checkboxes_follow_field(self):
+        rep = Replicator(self.src, self.dst, field_map={'race': 'ethnicity'},
+                         drop=['diet'])
+        self.assertEqual(rep.target_field('race___1'), 'ethnicity___1')
+        self.assertEqual(rep.target_field('race'), 'ethnicity')
+        self.assertIsNone(rep.target_field('diet___2'))
+        self.assertEqual(rep.target_field('height'), 'height')
+
+    def test_resume(self):
+        calls = []
+
+        def fail_second(chunk):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError('interrupted')
+            return chunk
+
+        rep = Replicator(self.src, self.dst, batch_size=10, workers=1,
+                         transform=fail_second, checkpoint=self.checkpoint)
+        with self.assertRaises(RuntimeError):
+            rep.run()
+        done = rep.load_checkpoint()
+        self.assertEqual(done, [str(i) for i in range(1, 11)])
+        # a header and a line per imported chunk
+        with open(self.checkpoint) as fobj:
+            self.assertEqual(len(fobj.readlines()), 2)
+
+        exported = len(self.source.contents('record'))
+        rep = Replicator(self.src, self.dst, batch_size=10,
+                         checkpoint=self.checkpoint)
+        summary = rep.run()
+        self.assertEqual(summary['records'], 15)
+        self.assertEqual(summary['skipped'], 10)
+        self.assertEqual(len(self.target.records), 25)
+        requested = [pl['records'].split(',') for pl in
+                     self.source.contents('record')[exported:]
+                     if 'records' in pl]
+        self.assertNotIn('1', sum(requested, []))
+
+    def test_torn_checkpoint(self):
+        """A chunk half-written to the checkpoint is dropped"""
+        rep = Replicator(self.src, self.dst, checkpoint=self.checkpoint)
+        rep.save_checkpoint(['1', '2'])
+        with open(self.checkpoint, 'a') as fobj:
+            fobj.write('{"done": ["3", "4')
+        self.assertEqual(rep.load_checkpoint(), ['1', '2'])
+        rep.save_checkpoint(['5'])
+        self.assertEqual(rep.load_checkpoint(), ['1', '2', '5'])
+
+    def test_failed_import(self):
+        self.target.respond = lambda pl: (400, {'error': 'no'})
+        rep = Replicator(self.src, self.dst, batch_size=10,
+                         checkpoint=self.checkpoint)
+        with self.assertRaises(RedcapError):
+            rep.run()
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_foreign_checkpoint(self):
+        with open(self.checkpoint, 'w') as fobj:
+            json.dump({'source': 'x', 'target': 'y', 'done': []}, fobj)
+        with self.assertRaises(ValueError):
+            Replicator(self.src, self.dst,
+                       checkpoint=self.checkpoint).run()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import timedelta
+
+from redcap import Project
+from redcap import project as project_module
+from redcap.optional import pandas
+from stub_server import StubREDCap
+
+skip_pd = not pandas
+
+
+class ReportTests(unittest.TestCase):
+    """ Testing export_report and iter_report against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=12)
+        self.server.metadata[1]['text_validation_type_or_show_slider_number'] = 'integer'
+        self.server.start()
+        self.proj = Project(self.server.url, 'token')
+
+    def tearDown(self):
+        self.proj.close()
+        self.server.stop()
+
+    def reports(self):
+        return self.server.contents('report')
+
+    def test_headers_key(self):
+        rows = self.proj.export_report('1', raw_or_label='label',
+                                       raw_or_label_headers='label')
+        self.assertEqual(rows[0], {'Study ID': '1', 'Age': '21',
+                                   'Sex': 'Male'})
+        self.assertEqual(self.reports()[-1]['rawOrLabelHeaders'], 'label')
+        self.assertNotIn('rawOrLabelHeadHeaders', self.reports()[-1])
+
+    def test_formats(self):
+        self.assertEqual(len(self.proj.export_report('1')), 12)
+        text = self.proj.export_report('1', format='csv')
+        self.assertEqual(text.splitlines()[0], 'study_id,age,sex')
+
+    def test_iter_report(self):
+        rows = list(self.proj.iter_report('1'))
+        self.assertEqual(rows, self.proj.export_report('1'))
+        self.assertEqual(self.reports()[0]['format'], 'csv')
+
+    def test_iter_report_unknown(self):
+        with self.assertRaises(Exception):
+            list(self.proj.iter_report('2'))
+
+    @unittest.skipIf(skip_pd, "Couldn't import pandas")
+    def test_typed_df(self):
+        df = self.proj.export_report('1', format='df', typed=True)
+        self.assertEqual(self.reports()[-1]['format'], 'csv')
+        self.assertEqual(df['study_id'].tolist()[:2], ['1', '2'])
+        self.assertEqual(df['sex'].tolist()[:2], ['1', '0'])
+        self.assertEqual(df['age'].dtype, 'float64')
+        # pandas guesses by default, as before
+        untyped = self.proj.export_report('1', format='df')
+        self.assertEqual(untyped['study_id'].dtype, 'int64')
+        overridden = self.proj.export_report(
+            '1', format='df', typed=True,
+            df_kwargs={'dtype': {'sex': 'int64'}})
+        self.assertEqual(overridden['sex'].dtype, 'int64')
+
+    def test_cache(self):
+        first = self.proj.export_report('1', cache=True)
+        again = self.proj.export_report('1', cache=True)
+        self.assertEqual(first, again)
+        self.assertEqual(len(self.reports()), 1)
+        # the freshness check only asks for records modified since
+        check = self.server.contents('record')[-1]
+        self.assertIn('dateRangeBegin', check)
+        self.assertEqual(check['fields'], 'study_id')
+        # other formats are cached separately
+        self.proj.export_report('1', format='csv', cache=True)
+        self.assertEqual(len(self.reports()), 2)
+
+    def test_cache_invalidated(self):
+        self.proj.export_report('1', cache=True)
+        # a change by another client is detected
+        other = Project(self.server.url, 'token')
+        other.import_records([{'study_id': '3', 'age': '99'}])
+        rows = self.proj.export_report('1', cache=True)
+        self.assertEqual(rows[2]['age'], '99')
+        self.assertEqual(len(self.reports()), 2)
+        # imports through this project clear the cache right away
+        self.proj.import_records([{'study_id': '4', 'age': '98'}])
+        checks = len(self.server.contents('record'))
+        rows = self.proj.export_report('1', cache=True)
+        self.assertEqual(rows[3]['age'], '98')
+        self.assertEqual(len(self.server.contents('record')), checks)
+        other.close()
+
+    def test_cache_server_time_zone(self):
+        """Changes are found on a server in another time zone"""
+        self.server.utc_offset = -5
+        proj = Project(self.server.url, 'token', lazy=True,
+                       server_utc_offset=-5)
+        other = Project(self.server.url, 'token', lazy=True)
+        for offset in (-5, 9):
+            self.server.utc_offset = offset
+            proj.server_utc_offset = timedelta(hours=offset)
+            proj.export_report('1', cache=True)
+            other.import_records([{'study_id': '3', 'age': str(offset)}])
+            rows = proj.export_report('1', cache=True)
+            self.assertEqual(rows[2]['age'], str(offset))
+        other.close()
+        proj.close()
+
+    def test_cache_bounded(self):
+        cached, project_module.CACHED_REPORTS = \
+            project_module.CACHED_REPORTS, 2
+        try:
+            for label in ('raw', 'label', 'raw'):
+                self.proj.export_report('1', raw_or_label_headers=label,
+                                        cache=True)
+            self.proj.export_report('1', format='csv', cache=True)
+        finally:
+            project_module.CACHED_REPORTS = cached
+        self.assertEqual(len(self.proj._report_cache), 2)
+        exported = len(self.reports())
+        # the least recently used report was dropped
+        self.proj.export_report('1', cache=True)
+        self.assertEqual(len(self.reports()), exported)
+        self.proj.export_report('1', raw_or_label_headers='label',
+                                cache=True)
+        self.assertEqual(len(self.reports()), exported + 1)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+skip_pd = False
+try:
+    import pandas as pd
+    from redcap.reshape import Reshaper
+except ImportError:
+    skip_pd = True
+from redcap.longitudinal import LongitudinalIndex
+
+
+class FakeProject(object):
+    """Just enough of a longitudinal Project to reshape its exports"""
+
+    def_field = 'study_id'
+    arm_nums = (1,)
+    arm_names = ('Arm One',)
+    events = [
+        {'event_name': 'Baseline', 'arm_num': 1,
+         'unique_event_name': 'baseline_arm_1'},
+        {'event_name': 'Follow Up', 'arm_num': 1,
+         'unique_event_name': 'follow_up_arm_1'},
+    ]
+    metadata = [
+        {'field_name': 'study_id', 'form_name': 'demographics'},
+        {'field_name': 'age', 'form_name': 'demographics'},
+        {'field_name': 'color', 'form_name': 'demographics'},
+        {'field_name': 'weight', 'form_name': 'vitals'},
+        {'field_name': 'med', 'form_name': 'meds'},
+    ]
+
+    def __init__(self):
+        self.fem_calls = 0
+        self.longitudinal_index = LongitudinalIndex(
+            self.events, self.arm_nums, self.arm_names, fem=self.export_fem)
+
+    def export_fem(self):
+        self.fem_calls += 1
+        return [
+            {'arm_num': 1, 'unique_event_name': 'baseline_arm_1',
+             'form': 'demographics'},
+            {'arm_num': 1, 'unique_event_name': 'baseline_arm_1',
+             'form': 'vitals'},
+            {'arm_num': 1, 'unique_event_name': 'follow_up_arm_1',
+             'form': 'vitals'},
+            {'arm_num': 1, 'unique_event_name': 'follow_up_arm_1',
+             'form': 'meds'},
+        ]
+
+
+@unittest.skipIf(skip_pd, "Couldn't import pandas")
+class ReshapeTests(unittest.TestCase):
+    """ Testing Reshaper """
+
+    def setUp(self):
+        self.project = FakeProject()
+        self.reshaper = Reshaper(self.project)
+        df = pd.DataFrame({
+            'study_id': ['1', '1', '1', '1', '2', '2'],
+            'redcap_event_name': ['Baseline', 'Follow Up', 'Follow Up',
+                                  'Follow Up', 'Baseline', 'Follow Up'],
+            'redcap_repeat_instrument': [None, None, 'meds', 'meds', None,
+                                         None],
+            'redcap_repeat_instance': [None, None, 1, 2, None, None],
+            'age': [30, None, None, None, 40, None],
+            'color___1': [1, None, None, None, 0, None],
+            'demographics_complete': [2, None, None, None, 2, None],
+            'weight': [70.0, 71.0, None, None, 80.0, 81.0],
+            'med': [None, None, 'aspirin', 'statin', None, None],
+        })
+        self.df = df.set_index(['study_id', 'redcap_event_name'])
+
+    def test_wide_by_event(self):
+        wide = self.reshaper.wide_by_event(self.df)
+        self.assertEqual(list(wide.index), ['1', '2'])
+        self.assertEqual(wide.loc['1', 'baseline_arm_1__age'], 30)
+        self.assertEqual(wide.loc['2', 'follow_up_arm_1__weight'], 81.0)
+        # unmapped (event, form) pairs never become columns
+        self.assertNotIn('follow_up_arm_1__age', wide)
+        self.assertIn('baseline_arm_1__color___1', wide)
+        self.assertEqual(self.project.fem_calls, 1)
+        self.reshaper.wide_by_event(self.df, sep=None)
+        self.assertEqual(self.project.fem_calls, 1)
+
+    def test_wide_by_event_multiindex(self):
+        wide = self.reshaper.wide_by_event(self.df, sep=None,
+                                           events=['follow_up_arm_1'])
+        self.assertEqual(list(wide.columns),
+                         [('follow_up_arm_1', 'weight'),
+                          ('follow_up_arm_1', 'med')])
+
+    def test_long_by_form(self):
+        long_df = self.reshaper.long_by_form(self.df)
+        self.assertEqual(list(long_df.columns),
+            ['study_id', 'redcap_event_name', 'redcap_repeat_instance',
+             'form', 'field', 'value'])
+        weights = long_df[long_df['field'] == 'weight']
+        self.assertEqual(len(weights), 4)
+        self.assertEqual(str(long_df['form'].dtype), 'category')
+        meds = long_df[long_df['field'] == 'med']
+        self.assertEqual(list(meds['value']), ['aspirin', 'statin'])
+        self.assertEqual(list(meds['redcap_repeat_instance']), [1, 2])
+        # rows of repeating instruments only go to their own form
+        everything = self.reshaper.long_by_form(self.df, dropna=False)
+        self.assertEqual(
+            len(everything[everything['field'] == 'weight']), 4)
+        keys = ['study_id', 'redcap_event_name', 'redcap_repeat_instance',
+                'field']
+        self.assertFalse(everything.duplicated(keys).any())
+
+    def test_by_instrument(self):
+        tables = self.reshaper.by_instrument(self.df)
+        self.assertEqual(sorted(tables), ['demographics', 'meds', 'vitals'])
+        meds = tables['meds']
+        self.assertEqual(meds.index.names,
+            ['study_id', 'redcap_event_name', 'redcap_repeat_instance'])
+        self.assertEqual(list(meds['med']), ['aspirin', 'statin'])
+        vitals = tables['vitals']
+        self.assertEqual(len(vitals), 4)
+        self.assertEqual(list(vitals.columns), ['weight'])
+        demo = tables['demographics']
+        self.assertEqual(list(demo.index.get_level_values(1)),
+                         ['baseline_arm_1', 'baseline_arm_1'])
+
+    def test_by_instrument_partly_repeating(self):
+        """Rows where a form doesn't repeat are kept with the repeated
+        instances of another event"""
+        df = pd.DataFrame({
+            'study_id': ['1', '1', '1', '2'],
+            'redcap_event_name': ['Baseline', 'Follow Up', 'Follow Up',
+                                  'Baseline'],
+            'redcap_repeat_instrument': [None, 'vitals', 'vitals', None],
+            'redcap_repeat_instance': [None, 1, 2, None],
+            'weight': [70.0, 71.0, 72.0, 80.0],
+        })
+        vitals = self.reshaper.by_instrument(df)['vitals']
+        self.assertEqual(list(vitals['weight']), [70.0, 71.0, 72.0, 80.0])
+        self.assertEqual(vitals.index.names,
+            ['study_id', 'redcap_event_name', 'redcap_repeat_instance'])
+        self.assertTrue(pd.isnull(vitals.index[0][2]))
+        self.assertEqual(vitals.index[2][2], 2)
+
+    def test_repeating_events(self):
+        """Instances of repeating events get keys of their own"""
+        df = pd.DataFrame({
+            'study_id': ['1', '1', '1', '2', '2'],
+            'redcap_event_name': ['Baseline', 'Follow Up', 'Follow Up',
+                                  'Baseline', 'Follow Up'],
+            'redcap_repeat_instrument': [None] * 5,
+            'redcap_repeat_instance': [None, 1, 2, None, 1],
+            'age': [30, None, None, 40, None],
+            'weight': [70.0, 71.0, 72.0, 80.0, 81.0],
+            'med': [None, 'aspirin', 'statin', None, None],
+        })
+        wide = self.reshaper.wide_by_event(df)
+        self.assertEqual(wide.index.names,
+                         ['study_id', 'redcap_repeat_instance'])
+        self.assertTrue(wide.index.is_unique)
+        self.assertEqual(wide.loc[('1', 2), 'follow_up_arm_1__med'],
+                         'statin')
+        self.assertEqual(wide['baseline_arm_1__age'].count(), 2)
+        tables = self.reshaper.by_instrument(df)
+        for form in ('vitals', 'meds'):
+            self.assertTrue(tables[form].index.is_unique)
+        self.assertEqual(len(tables['vitals']), 5)
+        self.assertEqual(list(tables['meds']['med']), ['aspirin', 'statin'])
+        long_df = self.reshaper.long_by_form(df)
+        weights = long_df[long_df['field'] == 'weight']
+        self.assertEqual(len(weights), 5)
+        self.assertFalse(long_df.duplicated(
+            ['study_id', 'redcap_event_name', 'redcap_repeat_instance',
+             'field']).any())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from redcap import serializers, Project
+from stub_server import StubREDCap
+
+RECORDS = [{'study_id': '1', 'notes': u'caf\xe9 – ok', 'age': '31'},
+           {'study_id': '2', 'notes': '', 'age': ''}]
+
+
+class SerializerTests(unittest.TestCase):
+    """ Testing every installed JSON backend """
+
+    def setUp(self):
+        self.default = serializers.get_backend()
+
+    def tearDown(self):
+        serializers.set_backend(self.default)
+
+    def test_fastest_by_default(self):
+        self.assertEqual(self.default, serializers.available()[0])
+        self.assertIn('json', serializers.available())
+
+    def test_roundtrip(self):
+        for name in serializers.available():
+            serializers.set_backend(name)
+            text = serializers.dumps(RECORDS)
+            self.assertEqual(serializers.loads(text), RECORDS, name)
+            self.assertEqual(serializers.loads(text.encode('utf-8')),
+                             RECORDS, name)
+
+    def test_control_characters(self):
+        """REDCap sends unescaped newlines inside strings"""
+        raw = b'[{"study_id": "1", "notes": "line one\nline two\t!"}]'
+        for name in serializers.available():
+            serializers.set_backend(name)
+            self.assertEqual(serializers.loads(raw)[0]['notes'],
+                             'line one\nline two\t!', name)
+
+    def test_invalid(self):
+        for name in serializers.available():
+            serializers.set_backend(name)
+            with self.assertRaises(ValueError):
+                serializers.loads(b'{"unterminated": ')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            serializers.set_backend('yaml')
+
+    def test_project_roundtrip(self):
+        server = StubREDCap(n_records=3).start()
+        try:
+            for name in serializers.available():
+                serializers.set_backend(name)
+                proj = Project(server.url, 'token')
+                records = proj.export_records()
+                records[0]['age'] = u'–'
+                self.assertEqual(proj.import_records(records), {'count': 3})
+                self.assertEqual(proj.export_records()[0]['age'], u'–')
+                proj.close()
+        finally:
+            server.stop()
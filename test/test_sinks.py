@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from redcap import JSONLinesSink, Project
+from redcap.sinks import part_path
+from stub_server import StubREDCap
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as fobj:
+        return [json.loads(line.decode('utf-8')) for line in fobj]
+
+
+class JSONLinesSinkTests(unittest.TestCase):
+    """ Testing JSONLinesSink """
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.rows = [{'study_id': str(i), 'note': u'line\nbreak \xe9'}
+                     for i in range(10)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_part_path(self):
+        self.assertEqual(part_path('out/r.jsonl.gz', 2),
+                         os.path.join('out', 'r-0002.jsonl.gz'))
+        self.assertEqual(part_path('r{part:02d}.jsonl', 3), 'r03.jsonl')
+
+    def test_gzip_by_extension(self):
+        path = os.path.join(self.tmp, 'r.jsonl.gz')
+        with JSONLinesSink(path) as sink:
+            sink.writerows(self.rows)
+        self.assertEqual(sink.paths, [path])
+        self.assertEqual(read_lines(path), self.rows)
+
+    def test_split(self):
+        path = os.path.join(self.tmp, 'r.jsonl')
+        line = len(json.dumps(self.rows[0], separators=(',', ':'))) + 1
+        with JSONLinesSink(path, max_bytes=3 * line + 1) as sink:
+            sink.writerows(self.rows)
+        self.assertEqual(len(sink.paths), 4)
+        self.assertEqual([len(read_lines(p)) for p in sink.paths],
+                         [3, 3, 3, 1])
+        self.assertEqual(sum((read_lines(p) for p in sink.paths), []),
+                         self.rows)
+
+    def test_streams(self):
+        text = io.StringIO()
+        with JSONLinesSink(text) as sink:
+            sink.writerows(self.rows)
+        self.assertEqual([json.loads(l) for l in text.getvalue().splitlines()],
+                         self.rows)
+        binary = io.BytesIO()
+        with JSONLinesSink(binary, compress=True) as sink:
+            sink.writerows(self.rows)
+        data = gzip.GzipFile(fileobj=io.BytesIO(binary.getvalue())).read()
+        self.assertEqual(len(data.splitlines()), 10)
+        self.assertRaises(ValueError, JSONLinesSink, binary, max_bytes=10)
+
+    def test_empty_export_creates_file(self):
+        path = os.path.join(self.tmp, 'r.jsonl')
+        JSONLinesSink(path).close()
+        self.assertEqual(read_lines(path), [])
+
+
+class ExportToSinkTests(unittest.TestCase):
+    """ Testing export_records(sink=...) against a local stub """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=5, longitudinal=True).start()
+        self.proj = Project(self.server.url, 'token')
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.proj.close()
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_matches_json_export(self):
+        path = os.path.join(self.tmp, 'r.jsonl.gz')
+        with JSONLinesSink(path) as sink:
+            n = self.proj.export_records(sink=sink, fields=['age'])
+        self.assertEqual(n, len(self.server.records))
+        self.assertEqual(read_lines(path),
+                         self.proj.export_records(fields=['age']))
+        self.assertEqual(self.server.contents('record')[-2]['format'], 'csv')
+
+    def test_batches(self):
+        text = io.StringIO()
+        with JSONLinesSink(text) as sink:
+            self.proj.export_records(sink=sink, batch_size=2)
+        ids = [json.loads(l)['study_id'] for l in text.getvalue().splitlines()]
+        self.assertEqual(sorted(set(ids), key=int), ['1', '2', '3', '4', '5'])
+        batches = [pl['records'] for pl in self.server.contents('record')
+                   if pl.get('records')]
+        self.assertEqual(batches, ['1,2', '3,4', '5'])
+
+    def test_json_only(self):
+        self.assertRaises(ValueError, self.proj.export_records,
+                          sink=JSONLinesSink(io.StringIO()), format='csv')
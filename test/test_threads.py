@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from redcap import Project
+from stub_server import StubREDCap
+
+
+class SharedProjectTests(unittest.TestCase):
+    """ Stress testing one Project shared by many threads """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=20, longitudinal=True,
+                                 delay=0.01).start()
+        self.proj = Project(self.server.url, 'token', lazy=True)
+
+    def tearDown(self):
+        self.proj.close()
+        self.server.stop()
+
+    def run_threads(self, func, n=16, repeat=4):
+        start = threading.Event()
+
+        def worker(i):
+            start.wait()
+            return [func(i, j) for j in range(repeat)]
+
+        with ThreadPoolExecutor(max_workers=n) as executor:
+            futures = [executor.submit(worker, i) for i in range(n)]
+            start.set()
+            return [f.result() for f in futures]
+
+    def test_lazy_loaded_once(self):
+        def read(i, j):
+            return (self.proj.def_field, self.proj.is_longitudinal(),
+                    len(self.proj.field_names), id(self.proj.choice_map()))
+
+        results = set(sum(self.run_threads(read), []))
+        self.assertEqual(len(results), 1)
+        contents = sorted(r['payload']['content']
+                          for r in self.server.requests)
+        self.assertEqual(contents, ['arm', 'event', 'metadata'])
+
+    def test_concurrent_exports(self):
+        expected = {}
+        for i in range(4):
+            record = str(i + 1)
+            expected[i] = self.proj.export_records(records=[record],
+                                                   fields=['age', 'weight'])
+
+        def export(i, j):
+            record = str(i % 4 + 1)
+            if j % 2:
+                return i, self.proj.export_records(
+                    records=[record], fields=['age', 'weight'])
+            return i, self.proj.export_records(
+                records=[record], fields=['age', 'weight'],
+                split_by='form', workers=2)
+
+        key = lambda r: (r['study_id'], r['redcap_event_name'])
+        for results in self.run_threads(export):
+            for i, records in results:
+                self.assertEqual(sorted(records, key=key),
+                                 sorted(expected[i % 4], key=key))
+        # every request got its own, unchanged payload
+        for r in self.server.contents('record'):
+            self.assertEqual(r['token'], 'token')
+            self.assertLessEqual(len(r.get('records', '').split(',')), 1)
+
+    def test_concurrent_reconfigure(self):
+        def work(i, j):
+            if i == 0:
+                self.proj.configure()
+                return self.proj.def_field
+            return self.proj.export_records(fields=['age'])[0]['study_id']
+
+        results = set(sum(self.run_threads(work, n=8), []))
+        self.assertEqual(results, set(['study_id', '1']))
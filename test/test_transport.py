@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import unittest
+import zlib
+
+try:
+    from urlparse import parse_qs
+except ImportError:
+    from urllib.parse import parse_qs
+
+from redcap import (Project, MetricsCollector, AsyncTransport,
+                    CassetteTransport, CassetteError)
+from redcap import project as project_module
+from redcap.optional import pandas
+from redcap.request import ChunkedData, spool_form, spool_multipart
+from stub_server import StubREDCap, _parse_multipart
+
+
+class CompressedTransportTests(unittest.TestCase):
+    """ Testing compressed requests and responses against a stub server """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=200).start()
+        self.metrics = MetricsCollector()
+        self.project = Project(self.server.url, 'token',
+                               hooks=[self.metrics])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_gzip_responses(self):
+        records = self.project.export_records()
+        self.assertEqual(len(records), 200)
+        headers = self.server.requests[-1]['headers']
+        self.assertIn('gzip', headers['Accept-Encoding'])
+        last = self.metrics.requests[-1]
+        self.assertEqual(last.type, 'exp_record')
+        self.assertEqual(last.content_encoding, 'gzip')
+        self.assertLess(last.bytes_received, last.content_bytes)
+
+    def test_uncompressed_responses_counted(self):
+        self.server.gzip = False
+        self.project.export_records()
+        last = self.metrics.requests[-1]
+        self.assertEqual(last.content_encoding, '')
+        self.assertEqual(last.bytes_received, last.content_bytes)
+
+    def test_compressed_import(self):
+        records = self.project.export_records()
+        for r in records:
+            r['age'] = '99'
+        plain = self.project.import_records(records)
+        compressed = self.project.import_records(records, compress=True)
+        self.assertEqual(plain, compressed)
+        sent = self.server.requests[-2:]
+        self.assertNotIn('Content-Encoding', sent[0]['headers'])
+        self.assertEqual(sent[1]['headers']['Content-Encoding'], 'gzip')
+        self.assertLess(sent[1]['body_bytes'], sent[0]['body_bytes'] / 4)
+        self.assertEqual(self.metrics.requests[-1].bytes_sent,
+                         sent[1]['body_bytes'])
+        self.assertTrue(all(r['age'] == '99'
+                            for r in self.project.export_records()))
+
+    def test_totals(self):
+        configured = len(self.metrics.requests)
+        self.project.export_records()
+        totals = self.metrics.totals()
+        self.assertEqual(totals['requests'], configured + 1)
+        self.assertEqual(totals['content_bytes'],
+                         sum(m.content_bytes for m in self.metrics.requests))
+
+
+class MemoryProfilingTests(unittest.TestCase):
+    """ Testing profile_memory against a stub server """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=200).start()
+        self.metrics = MetricsCollector()
+        self.project = Project(self.server.url, 'token', lazy=True,
+                               hooks=[self.metrics], profile_memory=True)
+
+    def tearDown(self):
+        self.project.close()
+        self.server.stop()
+
+    def test_export_phases(self):
+        self.project.export_records(format='df')
+        phases = [m for m in self.metrics.memory if m.type == 'exp_record']
+        self.assertEqual([m.phase for m in phases],
+                         ['receive', 'decode', 'dataframe'])
+        receive, decode, frame = phases
+        request = [m for m in self.metrics.requests
+                   if m.type == 'exp_record'][-1]
+        self.assertEqual(decode.payload_bytes, request.content_bytes)
+        self.assertEqual(receive.payload_bytes,
+                         request.content_bytes + request.bytes_sent)
+        self.assertEqual(frame.payload_bytes, decode.payload_bytes)
+        self.assertGreater(frame.peak, 0)
+        self.assertGreater(frame.copies, 0)
+
+    def test_import_serialize(self):
+        records = self.project.export_records()
+        self.project.import_records(records)
+        self.assertIn(('imp_record', 'serialize'),
+                      [(m.type, m.phase) for m in self.metrics.memory])
+        totals = self.metrics.memory_totals()
+        self.assertEqual(totals['serialize']['count'], 1)
+        self.assertEqual(totals['decode']['count'],
+                         totals['receive']['count'])
+        # request metrics are still counted separately
+        self.assertEqual(self.metrics.totals()['requests'],
+                         totals['receive']['count'])
+
+    @unittest.skipIf(not pandas, 'pandas not installed')
+    def test_dataframe_import_serialize(self):
+        frame = self.project.export_records(format='df')
+        for multipart in (True, False):
+            self.project.multipart = multipart
+            del self.metrics.memory[:]
+            self.project.import_records(frame)
+            phases = [(m.phase, m.type) for m in self.metrics.memory]
+            self.assertEqual(phases, [('serialize', 'imp_record'),
+                                      ('receive', 'imp_record'),
+                                      ('decode', 'imp_record')])
+            self.assertGreater(self.metrics.memory[0].payload_bytes, 0)
+
+    def test_tracing_stopped(self):
+        self.project.export_records()
+        self.assertFalse(tracemalloc.is_tracing())
+        tracemalloc.start()
+        try:
+            self.project.export_records()
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+    def test_concurrent_requests(self):
+        self.server.delay = 0.2
+        threads = [threading.Thread(target=self.project.export_records)
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertEqual(self.metrics.memory_totals()['receive']['count'], 3)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_off_by_default(self):
+        project = Project(self.server.url, 'token', lazy=True,
+                          hooks=[self.metrics])
+        before = len(self.metrics.memory)
+        project.export_records()
+        self.assertEqual(len(self.metrics.memory), before)
+
+
+class StreamedBodyTests(unittest.TestCase):
+    """ Testing spooled, chunk by chunk encoded request bodies """
+
+    def test_spool_form(self):
+        payload = {'token': 'x', 'content': 'record',
+                   'data': ChunkedData([u'a,b\n', u'1,\xe9 &=+\n'])}
+        body = spool_form(payload)
+        encoded = body.read()
+        self.assertEqual(len(body), len(encoded))
+        decoded = parse_qs(encoded.decode('ascii'))
+        self.assertEqual(decoded['data'], [u'a,b\n1,\xe9 &=+\n'])
+        body = spool_form(dict(payload, data=ChunkedData([b'a', b'b'])),
+                          compress=True)
+        decoded = parse_qs(zlib.decompress(body.read(), 31).decode('ascii'))
+        self.assertEqual(decoded['data'], ['ab'])
+
+    @unittest.skipIf(not pandas, 'pandas not installed')
+    def test_dataframe_import_in_chunks(self):
+        server = StubREDCap(n_records=30, longitudinal=True).start()
+        metrics = MetricsCollector()
+        project = Project(server.url, 'token', hooks=[metrics])
+        rows = project.export_records(format='df')
+        rows['age'] = 77
+        chunk_rows = project_module.IMPORT_CHUNK_ROWS
+        project_module.IMPORT_CHUNK_ROWS = 7
+        try:
+            response = project.import_records(rows, compress=True)
+        finally:
+            project_module.IMPORT_CHUNK_ROWS = chunk_rows
+            project.close()
+            server.stop()
+        self.assertEqual(response, {'count': 30})
+        self.assertEqual(len(list(project_module._frame_csv(rows, {},
+                                                            rows=7))), 9)
+        sent = server.requests[-1]
+        self.assertEqual(sent['headers']['Content-Encoding'], 'gzip')
+        self.assertEqual(int(sent['headers']['Content-Length']),
+                         sent['body_bytes'])
+        self.assertEqual(metrics.requests[-1].bytes_sent, sent['body_bytes'])
+        self.assertEqual(len(server.records), 60)
+        self.assertTrue(all(r['age'] == '77' for r in server.records))
+
+
+class MultipartTests(unittest.TestCase):
+    """ Testing multipart/form-data request bodies """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=600).start()
+        self.project = Project(self.server.url, 'token')
+        self.records = self.project.export_records()
+        for r in self.records:
+            r['age'] = '55'
+            r['notes'] = u'free text, with "quotes" & caf\xe9 {}/%'
+
+    def tearDown(self):
+        self.project.close()
+        self.server.stop()
+
+    def test_spool_multipart(self):
+        body = spool_multipart(
+            {'content': 'record', 'data': ChunkedData([u'x\r\n', b'y'])},
+            files={'file': ('a.bin', io.BytesIO(b'\x00\r\n--'))},
+            boundary='b0undary')
+        self.assertEqual(body.content_type,
+                         'multipart/form-data; boundary=b0undary')
+        pl, files = _parse_multipart(body.read(), body.content_type)
+        self.assertEqual(pl, {'content': 'record', 'data': u'x\r\ny'})
+        self.assertEqual(files, {'file': ('a.bin', b'\x00\r\n--')})
+
+    def test_large_imports_smaller_on_the_wire(self):
+        plain = Project(self.server.url, 'token', lazy=True, multipart=False)
+        self.assertEqual(plain.import_records(self.records), {'count': 600})
+        plain.close()
+        self.assertEqual(self.project.import_records(self.records),
+                         {'count': 600})
+        encoded, multipart = self.server.requests[-2:]
+        self.assertEqual(encoded['headers']['Content-Type'],
+                         'application/x-www-form-urlencoded')
+        self.assertTrue(multipart['headers']['Content-Type'].startswith(
+            'multipart/form-data; boundary='))
+        self.assertEqual(encoded['payload'], multipart['payload'])
+        self.assertLess(multipart['body_bytes'],
+                        encoded['body_bytes'] * 0.8)
+
+    def test_small_payloads_form_encoded(self):
+        self.project.import_records(self.records[:1])
+        self.assertEqual(self.server.requests[-1]['headers']['Content-Type'],
+                         'application/x-www-form-urlencoded')
+
+    def test_compressed_multipart(self):
+        self.project.import_records(self.records, compress=True)
+        sent = self.server.requests[-1]
+        self.assertEqual(sent['headers']['Content-Encoding'], 'gzip')
+        self.assertIn('notes', sent['payload']['data'])
+
+    def test_import_file_streamed(self):
+        content = b'\x89PNG' + b'\x00' * 100000
+        self.project.import_file('1', 'file', 'scan.png', io.BytesIO(content))
+        sent = self.server.requests[-1]
+        self.assertEqual(int(sent['headers']['Content-Length']),
+                         sent['body_bytes'])
+        exported, info = self.project.export_file('1', 'file')
+        self.assertEqual(exported, content)
+        self.assertEqual(info['name'], 'scan.png')
+
+    def test_import_text_mode_file(self):
+        path = os.path.join(tempfile.mkdtemp(), 'notes.txt')
+        try:
+            with io.open(path, 'w', encoding='utf-8') as fobj:
+                fobj.write(u'caf\xe9\n' * 20000)
+            with open(path, 'r') as fobj:
+                self.project.import_file('1', 'file', 'notes.txt', fobj)
+            exported, _ = self.project.export_file('1', 'file')
+            self.assertEqual(exported, u'caf\xe9\n'.encode('utf-8') * 20000)
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+
+
+class CassetteTests(unittest.TestCase):
+    """ Testing recording and replaying responses """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=20, longitudinal=True).start()
+        self.url = self.server.url
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cassette.json.gz')
+        self.server.files[('1', 'file', 'baseline_arm_1')] = (
+            'a.bin', b'\x00\xff')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def record(self):
+        with CassetteTransport(self.path, mode='record') as cassette:
+            project = Project(self.url, 'token', transport=cassette)
+            records = project.export_records()
+            frame = project.export_records(format='df') if pandas else None
+            rows = list(project.iter_report('1'))
+            project.export_file('1', 'file', 'baseline_arm_1')
+        return records, frame, rows
+
+    def test_replay_without_server(self):
+        records, frame, rows = self.record()
+        sent = len(self.server.requests)
+        self.server.stop()
+        with CassetteTransport(self.path, mode='replay') as replay:
+            project = Project(self.url, 'other token', transport=replay)
+            self.assertTrue(project.is_longitudinal())
+            self.assertEqual(project.export_records(), records)
+            if pandas:
+                self.assertTrue(project.export_records(format='df').equals(
+                    frame))
+            self.assertEqual(list(project.iter_report('1')), rows)
+            self.assertEqual(
+                project.export_file('1', 'file', 'baseline_arm_1')[0],
+                b'\x00\xff')
+            # repeated requests get the last recorded response again
+            self.assertEqual(project.export_records(), records)
+            with self.assertRaises(CassetteError):
+                project.export_records(fields=['age'])
+        self.assertEqual(len(self.server.requests), sent)
+        with open(self.path, 'rb') as fobj:
+            self.assertNotIn(b'token', fobj.read())
+
+    def test_repeated_requests_in_order(self):
+        with CassetteTransport(self.path, mode='record') as cassette:
+            project = Project(self.url, 'token', transport=cassette,
+                              lazy=True)
+            before = project.export_records(records=['1'])
+            project.import_records([{'study_id': '1', 'age': '99',
+                                     'redcap_event_name': 'baseline_arm_1'}])
+            after = project.export_records(records=['1'])
+        self.assertNotEqual(before, after)
+        with CassetteTransport(self.path, mode='replay') as replay:
+            project = Project(self.url, 'token', transport=replay, lazy=True)
+            self.assertEqual(project.export_records(records=['1']), before)
+            self.assertEqual(project.export_records(records=['1']), after)
+
+    def test_once_records_new_requests(self):
+        self.record()
+        sent = len(self.server.requests)
+        with CassetteTransport(self.path) as cassette:
+            project = Project(self.url, 'token', transport=cassette)
+            project.export_records()
+            self.assertEqual(len(self.server.requests), sent)
+            project.export_records(fields=['age'])
+            self.assertEqual(len(self.server.requests), sent + 1)
+        with CassetteTransport(self.path, mode='replay') as replay:
+            project = Project(self.url, 'token', transport=replay)
+            self.assertTrue(project.export_records(fields=['age']))
+
+    def test_files_matched_by_content(self):
+        for multipart in (True, False):
+            with CassetteTransport(self.path, mode='record') as cassette:
+                project = Project(self.url, 'token', transport=cassette,
+                                  lazy=True, multipart=multipart)
+                for content in (b'first', b'second'):
+                    project.import_file('1', 'file', 'a.txt',
+                                        io.BytesIO(content),
+                                        'baseline_arm_1')
+            imports = [k for k in cassette.interactions if 'file:' in k]
+            self.assertEqual(len(imports), 2)
+            with CassetteTransport(self.path, mode='replay') as replay:
+                project = Project(self.url, 'token', transport=replay,
+                                  lazy=True, multipart=multipart)
+                project.import_file('1', 'file', 'a.txt',
+                                    io.BytesIO(b'second'), 'baseline_arm_1')
+                with self.assertRaises(CassetteError):
+                    project.import_file('1', 'file', 'a.txt',
+                                        io.BytesIO(b'third'),
+                                        'baseline_arm_1')
+
+    def test_unseekable_file(self):
+        class Pipe(object):
+            def __init__(self, content):
+                self.fobj = io.BytesIO(content)
+
+            def read(self, size=-1):
+                return self.fobj.read(size)
+
+        with CassetteTransport(self.path, mode='record') as cassette:
+            project = Project(self.url, 'token', transport=cassette,
+                              lazy=True, multipart=False)
+            with self.assertRaises(CassetteError):
+                project.import_file('1', 'file', 'a.txt', Pipe(b'data'),
+                                    'baseline_arm_1')
+            project.multipart = True
+            project.import_file('1', 'file', 'a.txt', Pipe(b'data'),
+                                'baseline_arm_1')
+
+    @unittest.skipIf(not pandas, 'pandas not installed')
+    def test_dataframes_matched_by_content(self):
+        with CassetteTransport(self.path, mode='record') as cassette:
+            project = Project(self.url, 'token', transport=cassette,
+                              lazy=True)
+            frame = project.export_records(format='df')
+            project.import_records(frame)
+            project.import_records(frame.head(2))
+        imports = [k for k in cassette.interactions if '"data"' in k]
+        self.assertEqual(len(imports), 2)
+
+    def test_replay_needs_cassette(self):
+        with self.assertRaises(CassetteError):
+            CassetteTransport(self.path, mode='replay')
+        with self.assertRaises(ValueError):
+            CassetteTransport(self.path, mode='rewind')
+
+
+class AsyncTransportTests(unittest.TestCase):
+    """ Testing project calls run as asyncio awaitables """
+
+    def setUp(self):
+        self.server = StubREDCap(n_records=10, delay=0.2).start()
+        self.transport = AsyncTransport(workers=4)
+        self.project = Project(self.server.url, 'token', lazy=True,
+                               transport=self.transport)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def test_gather(self):
+        async def export():
+            return await asyncio.gather(*[
+                self.transport.run(self.project.export_records,
+                                   records=[str(i)])
+                for i in range(1, 5)])
+
+        results = asyncio.run(export())
+        self.assertEqual([r[0]['study_id'] for r in results],
+                         ['1', '2', '3', '4'])
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    def test_blocking_calls(self):
+        self.assertEqual(len(self.project.export_records()), 10)
+        self.assertIs(self.project.session, self.transport.session)